@@ -1,25 +1,56 @@
 from google.cloud import documentai
-from google.cloud import storage
+import logging
 import os
-from PIL import Image
-import matplotlib.pyplot as plt
+import re
+from concurrent.futures import ThreadPoolExecutor
 
+from Class.cache import ResultCache, get_backend
+from Class import resilience
+from Class.concurrency import in_caller_context
+from Class.metrics import upstream
+from Class.tracing import traced
+from Class.doc_store import count_pdf_pages, known_page_count, remember_page_count, sha256_from_uri
+from Class.clients import (
+    DOCUMENTAI_LOCATION,
+    DOCUMENTAI_PROCESSOR_ID,
+    PROJECT_ID,
+    get_documentai_client,
+    get_storage_client,
+)
 
-# Configure Document AI client
-project_id = "sodium-coil-470706-f4"  
-location = "us"  # Change if using different region
-processor_id = "18d898182b219656"
 
-# Initialize the client
-client_options = {"api_endpoint": f"{location}-documentai.googleapis.com"}
-client = documentai.DocumentProcessorServiceClient(client_options=client_options)
+logger = logging.getLogger("OCR")
 
-def process_document(gcs_uri):
-    """Process a document using Document AI. Accepts GCS URI (gs://) as input."""
+# Configure Document AI (clients are created on first use by Class.clients)
+project_id = PROJECT_ID
+location = DOCUMENTAI_LOCATION  # Set DOCUMENTAI_LOCATION if using different region
+processor_id = DOCUMENTAI_PROCESSOR_ID
+
+# OCR results keyed by PDF content hash + processor id.
+# OCR_CACHE_BACKEND=off disables it; "memory" keeps it in-process only.
+_ocr_cache_backend = os.getenv("OCR_CACHE_BACKEND", "sqlite").lower()
+ocr_cache = None
+if _ocr_cache_backend != "off":
+    ocr_cache = ResultCache(
+        get_backend(_ocr_cache_backend, os.getenv("OCR_CACHE_PATH")),
+        namespace="ocr",
+        max_entries=int(os.getenv("OCR_CACHE_MAX_ENTRIES", "1000")),
+        max_bytes=int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+        max_age_seconds=float(os.getenv("OCR_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600))),
+    )
+
+def processor_name():
+    return f"projects/{project_id}/locations/{location}/processors/{processor_id}"
+
+def process_document(gcs_uri, pages=None):
+    """
+    Process a document using Document AI. Accepts GCS URI (gs://) as input.
+    If pages (1-based page numbers) is given, only those pages are processed.
+    """
     if not gcs_uri.startswith("gs://"):
         raise ValueError("Input must be a GCS URI starting with 'gs://'")
     
-    name = f"projects/{project_id}/locations/{location}/processors/{processor_id}"
+    name = processor_name()
 
     # Use GCS input config for Document AI
     gcs_document = documentai.GcsDocument(
@@ -31,77 +62,115 @@ def process_document(gcs_uri):
         name=name,
         gcs_document=gcs_document
     )
-    result = client.process_document(request=request)
+    if pages:
+        request.process_options = documentai.ProcessOptions(
+            individual_page_selector=documentai.ProcessOptions.IndividualPageSelector(pages=list(pages))
+        )
+    with upstream("documentai", "process_document") as active:
+        if active is not None:
+            active.set_attribute("document.uri", gcs_uri)
+            active.set_attribute("document.pages_requested", len(pages) if pages else 0)
+        result = resilience.call("documentai", get_documentai_client(location).process_document, request=request)
     return result.document
 
-def extract_text_with_pages(document):
-    """Extract text with page-wise breakdown and return structured data"""
+def _raw_proto(message):
+    """Return the underlying protobuf message of a proto-plus wrapper.
+
+    Attribute access on the raw message is much cheaper: proto-plus wraps
+    every nested message and copies document.text on every access.
+    """
+    pb = getattr(type(message), "pb", None)
+    return pb(message) if pb is not None else message
+
+def _segment_offsets(text_anchor):
+    """Precompute the (start, end) offsets of a text anchor's segments."""
+    return [(segment.start_index, segment.end_index) for segment in text_anchor.text_segments]
+
+def _text_at(text, offsets):
+    if len(offsets) == 1:
+        start, end = offsets[0]
+        return text[start:end]
+    return "".join([text[start:end] for start, end in offsets])
+
+@traced()
+def extract_text_with_pages(document, lazy_page_text=False):
+    """
+    Extract text with page-wise breakdown and return structured data.
+
+    Single pass over the document: document.text is read once and every text
+    anchor is resolved by slicing it, so cost is linear in the number of
+    pages, form fields and segments.
+
+    Args:
+        document: documentai.Document (proto-plus or raw protobuf).
+        lazy_page_text (bool): Leave each page's "text" as None and store its
+            "text_segments" offsets instead; call page_text() to materialize it.
+    """
+    doc = _raw_proto(document)
+    text = doc.text
+    page_count = len(doc.pages)
     result = {
-        "full_text": document.text,
+        "full_text": text,
         "pages": [],
         "form_fields": [],
         "confidence_score": None
     }
+    pages = result["pages"]
+    all_fields = result["form_fields"]
     
     # Process each page
-    for page_num, page in enumerate(document.pages, 1):
+    for page_num, page in enumerate(doc.pages, 1):
+        layout = page.layout
+        confidence = layout.confidence
         page_info = {
             "page_number": page_num,
             "text": "",
             "form_fields": [],
-            "confidence": None,
-            "detected_languages": []
+            "confidence": confidence,
+            "detected_languages": [
+                {"language_code": lang.language_code, "confidence": lang.confidence}
+                for lang in page.detected_languages
+            ]
         }
-        
-        # Extract page-level confidence if available
-        if hasattr(page, 'layout') and hasattr(page.layout, 'confidence'):
-            page_info["confidence"] = page.layout.confidence
-            # Use the first page's confidence as overall document confidence if not set
-            if result["confidence_score"] is None:
-                result["confidence_score"] = page.layout.confidence
-        
-        # Extract detected languages for this page
-        if hasattr(page, 'detected_languages'):
-            for lang in page.detected_languages:
-                page_info["detected_languages"].append({
-                    "language_code": lang.language_code,
-                    "confidence": lang.confidence
-                })
+        # Use the first page's confidence as overall document confidence
+        if result["confidence_score"] is None:
+            result["confidence_score"] = confidence
         
         # Extract page text using the page's text anchor
-        if hasattr(page, 'layout') and hasattr(page.layout, 'text_anchor'):
-            page_text_segments = []
-            for segment in page.layout.text_anchor.text_segments:
-                start_index = getattr(segment, 'start_index', 0)
-                end_index = getattr(segment, 'end_index', len(document.text))
-                page_text_segments.append(document.text[start_index:end_index])
-            page_info["text"] = "".join(page_text_segments)
-        else:
+        offsets = _segment_offsets(layout.text_anchor)
+        if lazy_page_text:
+            page_info["text"] = None
+            page_info["text_segments"] = offsets
+        elif offsets:
+            page_info["text"] = _text_at(text, offsets)
+        elif page_count == 1:
             # Fallback: if this is a single page document, use the full text
-            if len(document.pages) == 1:
-                page_info["text"] = document.text
+            page_info["text"] = text
         
-        # Extract form fields for this page if they exist
-        if hasattr(page, 'form_fields'):
-            for field in page.form_fields:
-                field_name = get_text(field.field_name, document) if hasattr(field, 'field_name') and field.field_name else ""
-                field_value = get_text(field.field_value, document) if hasattr(field, 'field_value') and field.field_value else ""
-                
-                field_info = {
-                    "name": field_name,
-                    "value": field_value
-                }
-                page_info["form_fields"].append(field_info)
-                result["form_fields"].append({
-                    "page": page_num,
-                    "name": field_name,
-                    "value": field_value
-                })
+        # Extract form fields for this page
+        page_fields = page_info["form_fields"]
+        for field in page.form_fields:
+            field_name = _text_at(text, _segment_offsets(field.field_name.text_anchor)).strip()
+            field_value = _text_at(text, _segment_offsets(field.field_value.text_anchor)).strip()
+            page_fields.append({"name": field_name, "value": field_value})
+            all_fields.append({"page": page_num, "name": field_name, "value": field_value})
         
-        result["pages"].append(page_info)
+        pages.append(page_info)
     
     return result
 
+def page_text(result, page_info):
+    """Return a page's text, materializing it from text_segments for lazily extracted results."""
+    if page_info.get("text") is None:
+        offsets = page_info.get("text_segments") or []
+        if offsets:
+            page_info["text"] = _text_at(result["full_text"], offsets)
+        elif len(result["pages"]) == 1:
+            page_info["text"] = result["full_text"]
+        else:
+            page_info["text"] = ""
+    return page_info["text"]
+
 def display_results(document):
     """Display the extracted text and other information (legacy function for backwards compatibility)"""
     print("Full text extracted:")
@@ -121,23 +190,173 @@ def get_text(doc_element, document):
     if not doc_element or not hasattr(doc_element, 'text_anchor') or not doc_element.text_anchor:
         return ""
     
-    if not hasattr(doc_element.text_anchor, 'text_segments') or not doc_element.text_anchor.text_segments:
+    offsets = _segment_offsets(_raw_proto(doc_element).text_anchor)
+    if not offsets:
         return ""
-    
-    text = ""
-    for segment in doc_element.text_anchor.text_segments:
-        start_index = getattr(segment, 'start_index', 0)
-        end_index = getattr(segment, 'end_index', len(document.text))
-        text += document.text[start_index:end_index]
-    return text.strip()
+    return _text_at(_raw_proto(document).text, offsets).strip()
+
+def get_content_hash(gcs_uri):
+    """
+    Return a hash of the object's content using GCS metadata, without downloading it.
+    Returns None when the object or its hash cannot be looked up.
+    """
+    # Content-addressed uploads carry their SHA-256 in the object name
+    sha256 = sha256_from_uri(gcs_uri)
+    if sha256:
+        return f"sha256:{sha256}"
+    bucket_name, _, blob_name = gcs_uri[len("gs://"):].partition("/")
+    if not bucket_name or not blob_name:
+        return None
+    blob = resilience.call("gcs", get_storage_client(project_id).bucket(bucket_name).get_blob, blob_name)
+    if blob is None:
+        return None
+    # Composite objects have no MD5, only CRC32C
+    if blob.md5_hash:
+        return f"md5:{blob.md5_hash}"
+    if blob.crc32c:
+        return f"crc32c:{blob.crc32c}:{blob.size}"
+    return None
 
-def process_pdf_with_document_ai(gcs_uri):
+def ocr_cache_key(gcs_uri):
+    """Build the OCR cache key for a GCS URI, or None if the content hash is unknown."""
+    try:
+        content_hash = get_content_hash(gcs_uri)
+    except Exception:
+        return None
+    if content_hash is None:
+        return None
+    return f"{processor_id}:{content_hash}"
+
+def ocr_cache_stats():
+    """Hit/miss counters and usage of the OCR cache (None when disabled)."""
+    return ocr_cache.stats() if ocr_cache else None
+
+def add_result_metadata(result, document_uri="", mime_type=""):
+    """Add the success flag and summary fields process_pdf_with_document_ai returns."""
+    result["success"] = True
+    result["error"] = None
+    result["total_pages"] = len(result["pages"])
+    result["total_characters"] = len(result["full_text"])
+    result["document_uri"] = document_uri
+    result["mime_type"] = mime_type
+    return result
+
+def failed_result(error):
+    return {
+        "success": False,
+        "error": error,
+        "full_text": "",
+        "pages": [],
+        "form_fields": [],
+        "confidence_score": None,
+        "total_pages": 0,
+        "total_characters": 0
+    }
+
+def merge_extracted_results(results):
+    """
+    Merge extract_text_with_pages outputs for consecutive parts of one document
+    (batch output shards or page ranges) into a single result of the same shape.
+    Page numbers continue across parts.
+    """
+    merged = {
+        "full_text": "".join(r["full_text"] for r in results),
+        "pages": [],
+        "form_fields": [],
+        "confidence_score": None
+    }
+    page_offset = 0
+    for part in results:
+        for page in part["pages"]:
+            merged["pages"].append({**page, "page_number": page["page_number"] + page_offset})
+        for field in part["form_fields"]:
+            merged["form_fields"].append({**field, "page": field["page"] + page_offset})
+        if merged["confidence_score"] is None:
+            merged["confidence_score"] = part["confidence_score"]
+        page_offset += len(part["pages"])
+    return merged
+
+# ---- Page-range fan-out ----
+# Long PDFs are OCR'd as several page ranges in parallel and stitched back
+# together. OCR_PAGES_PER_REQUEST=0 disables splitting.
+OCR_PAGES_PER_REQUEST = int(os.getenv("OCR_PAGES_PER_REQUEST", "15"))
+OCR_FANOUT_WORKERS = int(os.getenv("OCR_FANOUT_WORKERS", "8"))
+
+# Separate from the server's blocking pool: process_pdf_with_document_ai runs on
+# that pool, so fanning out into it could deadlock. Shared across requests, so it
+# also caps concurrent Document AI calls per instance.
+_fanout_pool = ThreadPoolExecutor(max_workers=OCR_FANOUT_WORKERS, thread_name_prefix="ocr-fanout")
+
+# Linearized ("fast web view") PDFs state their page count in the first object
+_LINEARIZED_PAGES = re.compile(rb"/Linearized\b[^>]*?/N\s+(\d+)", re.S)
+
+def get_pdf_page_count(gcs_uri):
+    """
+    Count the pages of a PDF in GCS, as cheaply as possible: the count recorded
+    when the document was uploaded, then the linearization header in the first
+    KiB, and only then a full download. Returns None if it cannot be counted.
+    """
+    sha256 = sha256_from_uri(gcs_uri)
+    if sha256:
+        page_count = known_page_count(sha256)
+        if page_count:
+            return page_count
+    bucket_name, _, blob_name = gcs_uri[len("gs://"):].partition("/")
+    blob = get_storage_client(project_id).bucket(bucket_name).blob(blob_name)
+    with upstream("gcs", "download"):
+        head = resilience.call("gcs", blob.download_as_bytes, start=0, end=1023)
+    match = _LINEARIZED_PAGES.search(head)
+    if match:
+        page_count = int(match.group(1))
+    else:
+        with upstream("gcs", "download"):
+            page_count = count_pdf_pages(resilience.call("gcs", blob.download_as_bytes))
+    if sha256:
+        remember_page_count(sha256, page_count)
+    return page_count
+
+def _plan_page_count(gcs_uri, page_count):
+    """Page count to fan out on, or None (logged) when the document is OCR'd in one request."""
+    if page_count is None and OCR_PAGES_PER_REQUEST > 0:
+        try:
+            page_count = get_pdf_page_count(gcs_uri)
+        except Exception as e:
+            logger.warning("Page count lookup failed for %s: %s", gcs_uri, e)
+            page_count = None
+        if page_count is None:
+            logger.warning("Page count unknown for %s; OCR'ing it in a single request", gcs_uri)
+    return page_count
+
+def page_ranges(page_count, pages_per_request):
+    """Split 1..page_count into consecutive lists of at most pages_per_request pages."""
+    return [
+        list(range(start, min(start + pages_per_request, page_count + 1)))
+        for start in range(1, page_count + 1, pages_per_request)
+    ]
+
+def process_document_in_ranges(gcs_uri, page_count, pages_per_request=None):
+    """
+    OCR a document as parallel page ranges and merge the results.
+    Returns extract_text_with_pages-shaped data with pages numbered 1..page_count.
+    """
+    ranges = page_ranges(page_count, pages_per_request or OCR_PAGES_PER_REQUEST)
+    process = in_caller_context(process_document)
+    documents = list(_fanout_pool.map(lambda pages: process(gcs_uri, pages), ranges))
+    return merge_extracted_results([extract_text_with_pages(doc) for doc in documents])
+
+def process_pdf_with_document_ai(gcs_uri, use_cache=True, page_count=None):
     """
     Main function to process a PDF from GCS URI using Document AI.
     Returns structured text data with page details for MCP app usage.
+    Successful results are cached by PDF content hash and processor id, so
+    re-processing the same file skips the Document AI round-trip.
     
     Args:
         gcs_uri (str): GCS URI of the PDF file (e.g., 'gs://bucket-name/file.pdf')
+        use_cache (bool): Look up and store the result in the OCR cache.
+        page_count (int, optional): Number of pages, if known. Otherwise it is looked
+            up with get_pdf_page_count. Documents longer than OCR_PAGES_PER_REQUEST pages are
+            OCR'd as parallel page ranges.
     
     Returns:
         dict: Structured data containing:
@@ -153,44 +372,191 @@ def process_pdf_with_document_ai(gcs_uri):
     try:
         # Validate input
         if not gcs_uri or not isinstance(gcs_uri, str):
-            return {
-                "success": False,
-                "error": "Invalid GCS URI provided",
-                "full_text": "",
-                "pages": [],
-                "form_fields": [],
-                "confidence_score": None,
-                "total_pages": 0,
-                "total_characters": 0
-            }
-        
-        # Process the document
-        processed_doc = process_document(gcs_uri)
+            return failed_result("Invalid GCS URI provided")
         
-        # Extract structured text with page details
-        result = extract_text_with_pages(processed_doc)
-        
-        # Add success flag and additional metadata
-        result["success"] = True
-        result["error"] = None
-        result["total_pages"] = len(result["pages"])
-        result["total_characters"] = len(result["full_text"])
-        result["document_uri"] = getattr(processed_doc, 'uri', '') if hasattr(processed_doc, 'uri') else ''
-        result["mime_type"] = getattr(processed_doc, 'mime_type', '') if hasattr(processed_doc, 'mime_type') else ''
+        cache_key = ocr_cache_key(gcs_uri) if (use_cache and ocr_cache) else None
+        if cache_key:
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        page_count = _plan_page_count(gcs_uri, page_count)
+
+        if page_count and OCR_PAGES_PER_REQUEST > 0 and page_count > OCR_PAGES_PER_REQUEST:
+            result = process_document_in_ranges(gcs_uri, page_count)
+            add_result_metadata(result, gcs_uri, "application/pdf")
+        else:
+            # Process the document
+            processed_doc = process_document(gcs_uri)
+            
+            # Extract structured text with page details
+            result = extract_text_with_pages(processed_doc)
+            
+            # Add success flag and additional metadata
+            add_result_metadata(
+                result,
+                getattr(processed_doc, 'uri', '') if hasattr(processed_doc, 'uri') else '',
+                getattr(processed_doc, 'mime_type', '') if hasattr(processed_doc, 'mime_type') else '',
+            )
+
+        if cache_key:
+            ocr_cache.set(cache_key, result)
         
         return result
         
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Document processing failed: {str(e)}",
-            "full_text": "",
-            "pages": [],
-            "form_fields": [],
-            "confidence_score": None,
-            "total_pages": 0,
-            "total_characters": 0
-        }
+        return failed_result(f"Document processing failed: {str(e)}")
+
+def iter_pdf_pages(gcs_uri, use_cache=True, page_count=None):
+    """
+    Generator form of process_pdf_with_document_ai: yields page dicts (same shape
+    as its "pages") as soon as their page range has been OCR'd, so later stages
+    can start on the first pages of a long document. The merged result is cached
+    like process_pdf_with_document_ai's. Raises on failure instead of returning
+    an error dict.
+    """
+    cache_key = ocr_cache_key(gcs_uri) if (use_cache and ocr_cache) else None
+    if cache_key:
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            yield from cached["pages"]
+            return
+
+    page_count = _plan_page_count(gcs_uri, page_count)
+
+    if page_count and OCR_PAGES_PER_REQUEST > 0 and page_count > OCR_PAGES_PER_REQUEST:
+        parts = []
+        page_offset = 0
+        # map yields in range order, each as soon as it (and the ones before it) finished
+        ranges = page_ranges(page_count, OCR_PAGES_PER_REQUEST)
+        process = in_caller_context(process_document)
+        for document in _fanout_pool.map(lambda pages: process(gcs_uri, pages), ranges):
+            part = extract_text_with_pages(document)
+            parts.append(part)
+            for page in part["pages"]:
+                yield {**page, "page_number": page["page_number"] + page_offset}
+            page_offset += len(part["pages"])
+        result = add_result_metadata(merge_extracted_results(parts), gcs_uri, "application/pdf")
+    else:
+        processed_doc = process_document(gcs_uri)
+        result = add_result_metadata(
+            extract_text_with_pages(processed_doc),
+            getattr(processed_doc, 'uri', ''),
+            getattr(processed_doc, 'mime_type', ''),
+        )
+        yield from result["pages"]
+
+    if cache_key:
+        ocr_cache.set(cache_key, result)
+
+# ---- Batch processing for large documents ----
+# The synchronous API has page limits and holds the caller for the whole OCR.
+# Batch jobs run in Document AI, write JSON shards to GCS and are polled by
+# job id (the long-running operation name), so any instance can poll them.
+
+BATCH_OUTPUT_URI = os.getenv("OCR_BATCH_OUTPUT_URI") or f"gs://{os.getenv('BUCKET_NAME') or 'legal-doc-bucket1'}/ocr-output"
+
+def start_batch_process(gcs_uri, output_uri=None):
+    """
+    Start a Document AI batch job for a PDF in GCS.
+
+    Args:
+        gcs_uri (str): GCS URI of the PDF file
+        output_uri (str, optional): gs:// prefix for the JSON output shards
+
+    Returns:
+        str: Job id (operation name) to pass to get_batch_status / fetch_batch_result
+    """
+    if not gcs_uri.startswith("gs://"):
+        raise ValueError("Input must be a GCS URI starting with 'gs://'")
+
+    request = documentai.BatchProcessRequest(
+        name=processor_name(),
+        input_documents=documentai.BatchDocumentsInputConfig(
+            gcs_documents=documentai.GcsDocuments(
+                documents=[documentai.GcsDocument(gcs_uri=gcs_uri, mime_type="application/pdf")]
+            )
+        ),
+        document_output_config=documentai.DocumentOutputConfig(
+            gcs_output_config=documentai.DocumentOutputConfig.GcsOutputConfig(
+                gcs_uri=(output_uri or BATCH_OUTPUT_URI).rstrip("/") + "/"
+            )
+        ),
+    )
+    with upstream("documentai", "batch_process_documents"):
+        operation = resilience.create("documentai", get_documentai_client(location).batch_process_documents, request=request)
+    return operation.operation.name
+
+def get_batch_status(job_id):
+    """
+    Return the state of a batch job.
+
+    Returns:
+        dict: Contains job_id, state (WAITING, RUNNING, SUCCEEDED, FAILED, ...),
+              done, error, and per-input {input, output} locations
+    """
+    with upstream("documentai", "get_operation"):
+        operation = resilience.call("documentai", get_documentai_client(location).get_operation, request={"name": job_id})
+    metadata = documentai.BatchProcessMetadata.deserialize(operation.metadata.value)
+    state = documentai.BatchProcessMetadata.State(metadata.state).name
+    error = operation.error.message if operation.HasField("error") else None
+    return {
+        "job_id": job_id,
+        "state": state,
+        "done": operation.done,
+        "error": error or (metadata.state_message if state == "FAILED" else None),
+        "documents": [
+            {"input": status.input_gcs_source, "output": status.output_gcs_destination}
+            for status in metadata.individual_process_statuses
+        ],
+    }
+
+def load_batch_output(output_uri):
+    """Download and parse the Document shards under an output prefix, in shard order."""
+    bucket_name, _, prefix = output_uri[len("gs://"):].partition("/")
+    storage_client = get_storage_client(project_id)
+    documents = []
+    with upstream("gcs", "list_blobs"):
+        blobs = resilience.call("gcs", lambda: list(storage_client.list_blobs(bucket_name, prefix=prefix.rstrip("/") + "/")))
+    for blob in blobs:
+        if blob.name.endswith(".json"):
+            with upstream("gcs", "download"):
+                data = resilience.call("gcs", blob.download_as_bytes)
+            documents.append(documentai.Document.from_json(data, ignore_unknown_fields=True))
+    documents.sort(key=lambda doc: doc.shard_info.shard_index)
+    return documents
+
+def fetch_batch_result(job_id, use_cache=True):
+    """
+    Return the merged OCR result of a finished batch job in the same shape as
+    process_pdf_with_document_ai, or a status dict (success=False, state=...)
+    while the job is still running.
+    """
+    try:
+        status = get_batch_status(job_id)
+        if not status["done"]:
+            return {**failed_result("Batch job still running"), "state": status["state"], "job_id": job_id}
+        if status["state"] != "SUCCEEDED" or not status["documents"]:
+            return {**failed_result(f"Batch job failed: {status['error']}"), "state": status["state"], "job_id": job_id}
+
+        source = status["documents"][0]
+        shards = load_batch_output(source["output"])
+        result = merge_extracted_results([extract_text_with_pages(doc) for doc in shards])
+        add_result_metadata(result, source["input"], "application/pdf")
+
+        cache_key = ocr_cache_key(source["input"]) if (use_cache and ocr_cache) else None
+        if cache_key:
+            ocr_cache.set(cache_key, result)
+
+        return {**result, "state": status["state"], "job_id": job_id}
+
+    except Exception as e:
+        return {**failed_result(f"Batch result retrieval failed: {str(e)}"), "job_id": job_id}
+
+def cached_ocr_result(gcs_uri):
+    """Return the cached OCR result for gcs_uri, or None."""
+    cache_key = ocr_cache_key(gcs_uri) if ocr_cache else None
+    return ocr_cache.get(cache_key) if cache_key else None
 
 # Example usage (commented out for production use)
 # if __name__ == "__main__":
@@ -1,15 +1,160 @@
-from vertexai.generative_models import GenerativeModel
-import vertexai
-from google.cloud import aiplatform
+import asyncio
+import datetime
+import json
 import os
+from dataclasses import asdict, dataclass
 
+from Class import resilience
+from Class.clients import PROJECT_ID, VERTEX_LOCATION, get_generative_model
+from Class.metrics import record_usage, upstream
+from Class.prompts import render_precedent_prompt
 
-PROJECT_ID = "sodium-coil-470706-f4"
-LOCATION = "us-central1"
 
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+LOCATION = VERTEX_LOCATION
+MODEL_NAME = "gemini-2.5-flash-lite"
 
-model = GenerativeModel("gemini-2.5-flash-lite")
+# Batch lookups pack several clauses into one prompt, within these limits
+BATCH_MAX_CLAUSES = int(os.getenv("PRECEDENT_BATCH_MAX_CLAUSES", "5"))
+BATCH_MAX_CHARS = int(os.getenv("PRECEDENT_BATCH_MAX_CHARS", "6000"))
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("PRECEDENT_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+# Packed prompts in flight at once for one batch
+BATCH_CONCURRENCY = int(os.getenv("PRECEDENT_BATCH_CONCURRENCY", "8"))
+# Single-clause lookups send a second, identical request if the first has not
+# answered after this many seconds, and take whichever answers first (0: off)
+HEDGE_AFTER_SECONDS = float(os.getenv("PRECEDENT_HEDGE_AFTER_SECONDS", "0"))
+
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "clause_id": {"type": "INTEGER"},
+            "precedents": {"type": "STRING"},
+        },
+        "required": ["clause_id", "precedents"],
+    },
+}
+
+# Structured lookups ask for a JSON array of precedent records
+PRECEDENT_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "case_name": {"type": "STRING"},
+            "citation": {"type": "STRING"},
+            "year": {"type": "INTEGER"},
+            "court": {"type": "STRING"},
+            "relevance": {"type": "STRING"},
+            "principle": {"type": "STRING"},
+        },
+        "required": ["case_name", "court", "relevance", "principle"],
+        "propertyOrdering": ["case_name", "citation", "year", "court", "relevance", "principle"],
+    },
+}
+# Longer fields are cut, so one rambling answer cannot bloat the caches
+RECORD_MAX_CHARS = {"case_name": 200, "citation": 120, "court": 160, "relevance": 1200, "principle": 800}
+MAX_RECORDS = int(os.getenv("PRECEDENT_MAX_RECORDS", "10"))
+
+
+@dataclass(frozen=True, slots=True)
+class PrecedentRecord:
+    """One validated precedent from a structured lookup."""
+    case_name: str
+    court: str
+    relevance: str
+    principle: str
+    citation: str = ""
+    year: int | None = None
+
+    @classmethod
+    def from_dict(cls, item):
+        """Validate one model item; returns None if it is not a usable precedent."""
+        if not isinstance(item, dict):
+            return None
+        fields = {}
+        for name, limit in RECORD_MAX_CHARS.items():
+            value = item.get(name)
+            fields[name] = " ".join(value.split())[:limit] if isinstance(value, str) else ""
+        if not fields["case_name"] or not (fields["relevance"] or fields["principle"]):
+            return None
+        year = item.get("year")
+        if isinstance(year, str) and year.strip().isdigit():
+            year = int(year)
+        if not isinstance(year, int) or isinstance(year, bool) or not 1600 <= year <= datetime.date.today().year:
+            year = None
+        return cls(year=year, **fields)
+
+    def key(self):
+        """Records naming the same case (and year) are duplicates."""
+        return (self.case_name.casefold(), self.year)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_markdown(self, number):
+        """Render in the numbered format of the free-text answers."""
+        name = f"{self.case_name}, {self.citation}" if self.citation else self.case_name
+        return "\n".join([
+            f"{number}. **{name}**",
+            f"   - **Year:** {self.year if self.year is not None else 'Unknown'}",
+            f"   - **Court/Jurisdiction:** {self.court or 'Unknown'}",
+            f"   - **Relevance:** {self.relevance}",
+            f"   - **Key Principle:** {self.principle}",
+        ])
+
+
+def parse_precedents(text, max_records=MAX_RECORDS):
+    """
+    Parse a structured response into PrecedentRecords.
+
+    Items that fail validation are dropped and duplicate cases are kept once,
+    so the result is safe to cache and index as-is.
+
+    Raises:
+        ValueError: If the text is not a JSON array (or an object wrapping one).
+    """
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("precedents")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of precedents")
+    records = {}
+    for item in data:
+        record = PrecedentRecord.from_dict(item)
+        if record is not None:
+            records.setdefault(record.key(), record)
+    return list(records.values())[:max_records]
+
+
+def format_precedent_records(records, location):
+    """Markdown for a list of records, matching find_precedents output."""
+    if not records:
+        return f"No precedents could be identified for the given clause in jurisdiction: {location}"
+    return "\n\n".join(record.to_markdown(i) for i, record in enumerate(records, 1))
+
+def get_model():
+    """Shared precedent model; vertexai is initialised on first use rather than at import."""
+    return get_generative_model(MODEL_NAME, PROJECT_ID, LOCATION)
+
+def _generate(prompt):
+    with upstream("gemini", "generate_content") as active:
+        if active is not None:
+            active.set_attribute("gen_ai.request.model", MODEL_NAME)
+        response = resilience.call("gemini", get_model().generate_content, prompt)
+    record_usage(MODEL_NAME, getattr(response, "usage_metadata", None))
+    return response
+
+async def _agenerate(prompt, generation_config=None, hedge=False):
+    with upstream("gemini", "generate_content") as active:
+        if active is not None:
+            active.set_attribute("gen_ai.request.model", MODEL_NAME)
+        response = await resilience.hedged(
+            "gemini", get_model().generate_content_async, prompt, generation_config=generation_config,
+            hedge_after=HEDGE_AFTER_SECONDS if hedge else 0,
+        )
+    record_usage(MODEL_NAME, getattr(response, "usage_metadata", None))
+    return response
 
 def find_precedents(user_clause: str, location: str = "US") -> str:
     """
@@ -33,41 +178,162 @@ def find_precedents(user_clause: str, location: str = "US") -> str:
         # Clean inputs
         user_clause = user_clause.strip()
         location = location.strip()
-        
-        prompt = f"""
-        You are a highly precise legal research assistant with expertise in case law and legal precedents.
-        
-        Given the clause below, identify the most relevant and authoritative legal precedents from the specified jurisdiction.
-        
-        INSTRUCTIONS:
-        - Focus primarily on the specified jurisdiction: "{location}"
-        - If the location is a specific state (e.g., California, New York), prioritize state-specific cases but also include relevant federal precedents
-        - If the location is a country (e.g., US, India, UK), include the most significant national and high court precedents
-        - Only include precedents that are directly relevant to the legal principles in the clause
-        - Prioritize landmark cases and frequently cited precedents
-        - Exclude cases that are merely tangentially related
-        
-        For each precedent, provide:
-        1. **Case Name** (with official citation if available)
-        2. **Year** of decision
-        3. **Court/Jurisdiction** (specify court level and jurisdiction)
-        4. **Relevance** (2-3 sentences explaining the direct connection to the clause)
-        5. **Key Principle** (the specific legal principle established)
-        
-        Format your response as a numbered list with clear sections for each precedent.
-        
-        **Legal Clause to Analyze:**
-        "{user_clause}"
-        
-        **Target Jurisdiction:** {location}
-        """
 
-        response = model.generate_content(prompt)
-        
-        if response and response.text:
-            return response.text.strip()
-        else:
-            return f"No precedents could be identified for the given clause in jurisdiction: {location}"
+        response = _generate(build_precedent_prompt(user_clause, location))
+        return format_precedent_response(response, location)
             
     except Exception as e:
         return f"Error analyzing precedents: {str(e)}"
+
+async def afind_precedents(user_clause: str, location: str = "US") -> str:
+    """
+    Async version of find_precedents. Uses the model's async API so the
+    caller's event loop is not blocked while waiting for Gemini.
+    """
+    try:
+        if not user_clause or not user_clause.strip():
+            return "Error: No clause provided for analysis."
+
+        if not location or not location.strip():
+            location = "US"
+
+        user_clause = user_clause.strip()
+        location = location.strip()
+
+        response = await _agenerate(build_precedent_prompt(user_clause, location), hedge=True)
+        return format_precedent_response(response, location)
+
+    except Exception as e:
+        return f"Error analyzing precedents: {str(e)}"
+
+async def afind_precedents_structured(user_clause: str, location: str = "US") -> dict:
+    """
+    Find precedents as validated records instead of free text.
+
+    The model is constrained to PRECEDENT_SCHEMA and its answer is parsed with
+    parse_precedents.
+
+    Args:
+        user_clause (str): The legal clause to analyze
+        location (str): The jurisdiction (e.g., "US", "California", "India", "UK", "EU")
+
+    Returns:
+        dict: {"records": [PrecedentRecord, ...], "precedents": markdown rendering}
+              or {"error": message}
+    """
+    try:
+        if not user_clause or not user_clause.strip():
+            return {"error": "No clause provided for analysis."}
+
+        if not location or not location.strip():
+            location = "US"
+
+        user_clause = user_clause.strip()
+        location = location.strip()
+
+        response = await _agenerate(
+            build_precedent_prompt(user_clause, location, structured=True),
+            generation_config={"response_mime_type": "application/json", "response_schema": PRECEDENT_SCHEMA},
+            hedge=True,
+        )
+        records = parse_precedents(response.text) if response and response.text else []
+        return {"records": records, "precedents": format_precedent_records(records, location)}
+
+    except Exception as e:
+        return {"error": f"Error analyzing precedents: {str(e)}"}
+
+def format_precedent_response(response, location):
+    """Turn a model response into the text returned by find_precedents."""
+    if response and response.text:
+        return response.text.strip()
+    else:
+        return f"No precedents could be identified for the given clause in jurisdiction: {location}"
+
+def build_precedent_prompt(user_clause: str, location: str, structured: bool = False) -> str:
+    """
+    Build the precedent research prompt for a cleaned clause and jurisdiction.
+    With structured=True the answer format is left to the response schema.
+    """
+    return render_precedent_prompt(location, "structured" if structured else "text", clause=user_clause)
+
+def build_batch_prompt(clauses, location: str) -> str:
+    """Prompt asking for the precedents of several numbered clauses in one JSON array."""
+    numbered = "\n\n".join(f'Clause {i}:\n"{clause}"' for i, clause in enumerate(clauses))
+    return render_precedent_prompt(location, "batch", clauses=numbered)
+
+def clause_key(clause: str) -> str:
+    """Clauses that differ only in whitespace are the same clause."""
+    return " ".join(clause.split())
+
+def pack_clauses(clauses, max_clauses=BATCH_MAX_CLAUSES, max_chars=BATCH_MAX_CHARS):
+    """Group clauses (in order) so each group fits one packed prompt."""
+    groups, group, size = [], [], 0
+    for clause in clauses:
+        if group and (len(group) >= max_clauses or size + len(clause) > max_chars):
+            groups.append(group)
+            group, size = [], 0
+        group.append(clause)
+        size += len(clause)
+    if group:
+        groups.append(group)
+    return groups
+
+async def _afind_packed(clauses, location: str) -> dict:
+    """One model call for a group of clauses. Returns {clause: precedents} for the clauses answered."""
+    if len(clauses) == 1:
+        return {clauses[0]: await afind_precedents(clauses[0], location)}
+    response = await _agenerate(
+        build_batch_prompt(clauses, location),
+        generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": BATCH_RESPONSE_SCHEMA,
+            "max_output_tokens": BATCH_MAX_OUTPUT_TOKENS,
+        },
+    )
+    answered = {}
+    for item in json.loads(response.text):
+        clause_id = item.get("clause_id")
+        if isinstance(clause_id, int) and 0 <= clause_id < len(clauses) and item.get("precedents"):
+            answered[clauses[clause_id]] = item["precedents"].strip()
+    return answered
+
+async def afind_precedents_batch(clauses, location: str = "US", concurrency: int = BATCH_CONCURRENCY) -> dict:
+    """
+    Find precedents for many clauses at once.
+
+    Identical clauses are looked up once, clauses are packed several to a prompt,
+    and packed prompts run concurrently (at most `concurrency` at a time). Any
+    clause a packed response leaves out, or whose group fails, is retried on its own.
+
+    Args:
+        clauses (list): Clause texts.
+        location (str): The jurisdiction shared by all clauses.
+        concurrency (int): Maximum model calls in flight.
+
+    Returns:
+        dict: {clause_key(clause): precedents text} for each distinct clause
+    """
+    if not location or not location.strip():
+        location = "US"
+    location = location.strip()
+    unique = list(dict.fromkeys(clause_key(c) for c in clauses if c and c.strip()))
+    gate = asyncio.Semaphore(max(1, concurrency))
+    results = {}
+
+    async def run(group):
+        async with gate:
+            try:
+                answered = await _afind_packed(group, location)
+            except Exception:
+                answered = {}
+        results.update(answered)
+        missing = [clause for clause in group if clause not in answered]
+        if missing:
+            await asyncio.gather(*(run_single(clause) for clause in missing))
+
+    async def run_single(clause):
+        async with gate:
+            results[clause] = await afind_precedents(clause, location)
+
+    await asyncio.gather(*(run(group) for group in pack_clauses(unique)))
+    return results
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from Class.cache import ResultCache, get_backend
+from Class.retrieval import VectorStore, embed_texts
+
+
+# Model answers keyed by normalized question + scope (document hash for pdf_qa,
+# jurisdiction for precedents). ANSWER_CACHE_BACKEND=off disables it.
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "sqlite").lower()
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+# Cosine similarity above which a differently worded question counts as the
+# same one. Unset (default) means exact matches only; semantic lookups cost an
+# embedding call per question.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0") or 0) or None
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+class AnswerCache:
+    """
+    Exact-then-semantic answer cache.
+
+    Exact hits are looked up by hash of (scope, normalized text) in a
+    ResultCache, so they survive restarts when the backend is SQLite. With a
+    similarity threshold, misses are then compared against the embeddings of
+    earlier questions in the same scope (kept in-process). Embeddings whose
+    entry has left the ResultCache are dropped when a lookup finds them, and
+    at most max_vectors are kept (oldest, least recently used scope first).
+
+    Args:
+        cache (ResultCache): Stores {"answer", "text", "provenance"} entries.
+        similarity (float, optional): Cosine threshold for semantic hits; None disables them.
+        embed_fn (callable): texts -> vectors, used when similarity is set.
+        max_vectors (int, optional): Cap on embeddings kept across all scopes.
+            Defaults to the cache's max_entries, since more could only point at evicted entries.
+    """
+
+    def __init__(self, cache, similarity=None, embed_fn=embed_texts, max_vectors=None):
+        self.cache = cache
+        self.similarity = similarity
+        self.embed_fn = embed_fn
+        self.max_vectors = max_vectors or cache.max_entries
+        self._vectors = OrderedDict()  # scope -> VectorStore of entry keys, least recently used first
+        self._vector_count = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(scope, text):
+        return hashlib.sha256(f"{scope}\0{normalize(text)}".encode()).hexdigest()
+
+    def lookup(self, scope, text):
+        """
+        Return the cached entry for text within scope, or None.
+
+        The entry is {"answer", "text", "provenance", "match", "similarity"}, where
+        match is "exact" or "semantic".
+        """
+        entry = self.cache.get(self.key(scope, text))
+        if entry is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return {**entry, "match": "exact", "similarity": 1.0}
+        if self.similarity is not None:
+            with self._lock:
+                store = self._vectors.get(scope)
+                if store is not None:
+                    self._vectors.move_to_end(scope)
+            if store is not None and store.items:
+                try:
+                    vector = self.embed_fn([normalize(text)])[0]
+                except Exception:
+                    vector = None
+                if vector is not None:
+                    with self._lock:
+                        candidates = store.search(vector, k=3)
+                    for score, key in candidates:
+                        if score < self.similarity:
+                            break
+                        # Goes through the ResultCache so TTL still applies
+                        entry = self.cache.get(key)
+                        if entry is not None:
+                            with self._lock:
+                                self.semantic_hits += 1
+                            return {**entry, "match": "semantic", "similarity": round(score, 4)}
+                        self._forget(scope, key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _forget(self, scope, key):
+        """Drop the embedding of an entry that has expired or been evicted."""
+        with self._lock:
+            store = self._vectors.get(scope)
+            if store is None:
+                return
+            self._vector_count -= store.remove(key)
+            if not store.items:
+                del self._vectors[scope]
+
+    def _remember(self, scope, key, vector):
+        with self._lock:
+            store = self._vectors.get(scope)
+            if store is None:
+                store = self._vectors[scope] = VectorStore()
+            self._vectors.move_to_end(scope)
+            # A re-stored question replaces its old embedding
+            self._vector_count -= store.remove(key)
+            store.add([vector], [key])
+            self._vector_count += 1
+            while self.max_vectors is not None and self._vector_count > self.max_vectors:
+                oldest_scope, oldest = next(iter(self._vectors.items()))
+                oldest.pop_oldest()
+                self._vector_count -= 1
+                if not oldest.items:
+                    del self._vectors[oldest_scope]
+
+    def store(self, scope, text, answer, **provenance):
+        """Cache answer for text within scope. provenance is stored alongside (source, document, ...)."""
+        key = self.key(scope, text)
+        self.cache.set(key, {
+            "answer": answer,
+            "text": text,
+            "provenance": {**provenance, "scope": scope, "created_at": time.time()},
+        })
+        if self.similarity is not None:
+            try:
+                vector = self.embed_fn([normalize(text)])[0]
+            except Exception:
+                return
+            self._remember(scope, key, vector)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        entries, size = self.cache.backend.usage(self.cache.namespace)
+        return {
+            "namespace": self.cache.namespace,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": ((self.exact_hits + self.semantic_hits) / lookups) if lookups else 0.0,
+            "evictions": self.cache.evictions,
+            "entries": entries,
+            "bytes": size,
+            "vectors": self._vector_count,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(name):
+    """
+    Return the shared AnswerCache for name ("qa", "precedents" or
+    "precedent-records"), created on first use, or None when
+    ANSWER_CACHE_BACKEND is off.
+    """
+    if ANSWER_CACHE_BACKEND == "off":
+        return None
+    with _caches_lock:
+        answers = _caches.get(name)
+        if answers is None:
+            cache = ResultCache(
+                get_backend(ANSWER_CACHE_BACKEND, os.getenv("ANSWER_CACHE_PATH")),
+                namespace=f"answers-{name}",
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                max_age_seconds=ANSWER_CACHE_TTL_SECONDS,
+            )
+            answers = _caches[name] = AnswerCache(cache, similarity=ANSWER_CACHE_SIMILARITY)
+        return answers
+
+
+def answer_cache_stats():
+    """Stats for the answer caches used so far in this process."""
+    with _caches_lock:
+        return {name: answers.stats() for name, answers in _caches.items()}
@@ -0,0 +1,316 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheBackend(abc.ABC):
+    """Storage interface for ResultCache. Values are JSON strings."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return (value, created_at) for key, or None if missing."""
+
+    @abc.abstractmethod
+    def set(self, key, value):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+    @abc.abstractmethod
+    def evict(self, max_entries=None, max_bytes=None, max_age_seconds=None, namespace=None):
+        """Drop expired entries, then least recently used ones until within limits.
+
+        When namespace is given, only keys under "<namespace>:" are counted and
+        removed, so caches sharing a backend do not purge each other.
+
+        Returns:
+            int: Number of entries removed.
+        """
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    @abc.abstractmethod
+    def usage(self, namespace=None):
+        """Return (entry_count, total_bytes), optionally for one namespace."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU backend. Useful for tests and single-shot scripts."""
+
+    def __init__(self):
+        self._entries = OrderedDict()  # key -> (value, created_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (value, time.time())
+            self._bytes += len(value)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+
+    def _scoped(self, namespace):
+        """Keys under namespace, least recently used first."""
+        if namespace is None:
+            return list(self._entries)
+        prefix = f"{namespace}:"
+        return [key for key in self._entries if key.startswith(prefix)]
+
+    def evict(self, max_entries=None, max_bytes=None, max_age_seconds=None, namespace=None):
+        removed = 0
+        with self._lock:
+            keys = self._scoped(namespace)
+            if max_age_seconds is not None:
+                cutoff = time.time() - max_age_seconds
+                expired = {key for key in keys if self._entries[key][1] < cutoff}
+                for key in expired:
+                    self._bytes -= len(self._entries.pop(key)[0])
+                    removed += 1
+                keys = [key for key in keys if key not in expired]
+            count = len(keys)
+            total = sum(len(self._entries[key][0]) for key in keys)
+            for key in keys:
+                if (max_entries is None or count <= max_entries) and (max_bytes is None or total <= max_bytes):
+                    break
+                size = len(self._entries.pop(key)[0])
+                self._bytes -= size
+                count -= 1
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def usage(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                return len(self._entries), self._bytes
+            keys = self._scoped(namespace)
+            return len(keys), sum(len(self._entries[key][0]) for key in keys)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Local-disk backend. Survives restarts and is shared by worker threads."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries(accessed_at)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0], row[1]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    @staticmethod
+    def _scope(namespace):
+        """SQL condition and parameters selecting the keys of one namespace."""
+        if namespace is None:
+            return "1", ()
+        # "<ns>:" <= key < "<ns>;" matches exactly the "<ns>:" prefix and uses the key index.
+        return "key >= ? AND key < ?", (f"{namespace}:", f"{namespace};")
+
+    def evict(self, max_entries=None, max_bytes=None, max_age_seconds=None, namespace=None):
+        removed = 0
+        scope, params = self._scope(namespace)
+        with self._lock:
+            if max_age_seconds is not None:
+                cursor = self._conn.execute(
+                    f"DELETE FROM cache_entries WHERE {scope} AND created_at < ?",
+                    params + (time.time() - max_age_seconds,),
+                )
+                removed += cursor.rowcount
+            count, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE {scope}", params
+            ).fetchone()
+            if (max_entries is None or count <= max_entries) and (max_bytes is None or total <= max_bytes):
+                return removed
+            # Walk from least recently used until both limits are satisfied.
+            victims = []
+            for key, size in self._conn.execute(
+                f"SELECT key, size FROM cache_entries WHERE {scope} ORDER BY accessed_at ASC", params
+            ):
+                if (max_entries is None or count <= max_entries) and (max_bytes is None or total <= max_bytes):
+                    break
+                victims.append((key,))
+                count -= 1
+                total -= size
+            self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+            return removed + len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+
+    def usage(self, namespace=None):
+        scope, params = self._scope(namespace)
+        with self._lock:
+            count, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE {scope}", params
+            ).fetchone()
+            return count, total
+
+
+class ResultCache:
+    """
+    JSON result cache with age/size eviction and hit/miss counters.
+
+    Args:
+        backend (CacheBackend): Where entries are stored.
+        namespace (str): Prefix applied to every key so several caches can share a backend.
+        max_entries (int, optional): Maximum number of entries kept.
+        max_bytes (int, optional): Maximum total size of stored JSON.
+        max_age_seconds (float, optional): Entries older than this are treated as misses and evicted.
+    """
+
+    def __init__(self, backend, namespace, max_entries=None, max_bytes=None, max_age_seconds=None):
+        self.backend = backend
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        # Guards the counters; the cache is shared by worker threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        entry = self.backend.get(self._key(key))
+        if entry is not None:
+            value, created_at = entry
+            if self.max_age_seconds is None or time.time() - created_at <= self.max_age_seconds:
+                with self._lock:
+                    self.hits += 1
+                return json.loads(value)
+            self.backend.delete(self._key(key))
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.backend.set(self._key(key), json.dumps(value, separators=(",", ":")))
+        removed = self.backend.evict(
+            self.max_entries, self.max_bytes, self.max_age_seconds, namespace=self.namespace
+        )
+        with self._lock:
+            self.evictions += removed
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    def stats(self):
+        """Return hit/miss counters and this namespace's share of the backend."""
+        entries, size = self.backend.usage(self.namespace)
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            "namespace": self.namespace,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+            "evictions": evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(kind=None, path=None):
+    """
+    Return a shared cache backend configured from the environment.
+
+    Args:
+        kind (str, optional): "sqlite" (default) or "memory". Falls back to CACHE_BACKEND.
+        path (str, optional): SQLite file path. Falls back to CACHE_PATH.
+
+    Returns:
+        CacheBackend: One instance per (kind, path) for the whole process.
+    """
+    kind = (kind or os.getenv("CACHE_BACKEND") or "sqlite").lower()
+    if kind == "sqlite":
+        path = path or os.getenv("CACHE_PATH") or os.path.join("cache", "results.sqlite3")
+    else:
+        path = None
+    with _backends_lock:
+        backend = _backends.get((kind, path))
+        if backend is None:
+            if kind == "sqlite":
+                backend = SQLiteCacheBackend(path)
+            elif kind == "memory":
+                backend = MemoryCacheBackend()
+            else:
+                raise ValueError(f"Unknown cache backend: {kind}")
+            _backends[(kind, path)] = backend
+        return backend
@@ -0,0 +1,539 @@
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from Class import tracing
+
+
+# Record/replay of Google API responses at the client boundary (Class.clients).
+#   off    - clients talk to Google as usual
+#   record - every model/OCR response is also written to the cassette
+#   replay - responses come from the cassette; a request it lacks raises CassetteMiss
+#   auto   - replay what the cassette has, record the rest
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", os.path.join("cache", "cassettes"))
+CASSETTE_NAME = os.getenv("CASSETTE_NAME", "default")
+# "fast" replays at once; "recorded" waits as long as the original call did,
+# chunk by chunk for streams, so load tests see realistic latencies
+CASSETTE_PACING = os.getenv("CASSETTE_PACING", "fast").lower()
+
+BLOBS_DIR = "blobs"
+
+# Recorded methods per client kind: attribute path -> how it is called.
+#   call    - plain function returning a response
+#   async   - coroutine returning a response
+#   stream  - function returning an iterator of chunks
+#   astream - coroutine returning an async iterator of chunks
+RECORDED = {
+    "genai": {
+        ("models", "generate_content"): "call",
+        ("models", "generate_content_stream"): "stream",
+        ("models", "embed_content"): "call",
+        ("aio", "models", "generate_content"): "async",
+        ("aio", "models", "generate_content_stream"): "astream",
+        ("caches", "create"): "call",
+        ("caches", "update"): "call",
+        ("caches", "delete"): "call",
+    },
+    "documentai": {
+        ("process_document",): "call",
+    },
+    "generative_model": {
+        ("generate_content",): "call",
+        ("generate_content_async",): "async",
+    },
+}
+
+
+class CassetteMiss(LookupError):
+    """Replay mode got a request that was never recorded."""
+
+
+def enabled():
+    return CASSETTE_MODE in ("record", "replay", "auto")
+
+
+# ---- Request keys ----
+
+def _canonical(value):
+    """JSON-able form of a request argument that is stable across runs."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "model_dump"):  # google-genai types (pydantic)
+        return _canonical(value.model_dump(mode="json", exclude_none=True))
+    pb = getattr(type(value), "pb", None)  # proto-plus messages (Document AI)
+    if pb is not None:
+        return {"proto": hashlib.sha256(pb(value).SerializeToString(deterministic=True)).hexdigest()}
+    if hasattr(value, "to_dict"):  # vertexai types
+        return _canonical(value.to_dict())
+    return repr(value)
+
+
+def request_key(kind, method, args, kwargs):
+    """Hash identifying a request: the client kind, the method and its arguments."""
+    payload = json.dumps([kind, method, _canonical(list(args)), _canonical(kwargs)], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+# ---- Response encoding ----
+
+def _encode(value, cassette):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return {"json": value}
+    if isinstance(value, bytes):
+        return {"blob": cassette.put_blob(value)}
+    if isinstance(value, (list, tuple)):
+        return {"list": [_encode(v, cassette) for v in value]}
+    if hasattr(value, "model_dump"):
+        return {"genai": type(value).__name__, "data": value.model_dump(mode="json", exclude_none=True)}
+    pb = getattr(type(value), "pb", None)
+    if pb is not None:
+        return {"proto": f"{type(value).__module__}:{type(value).__qualname__}",
+                "data": base64.b64encode(type(value).serialize(value)).decode()}
+    if hasattr(value, "to_dict") and hasattr(type(value), "from_dict"):
+        return {"vertex": f"{type(value).__module__}:{type(value).__qualname__}", "data": value.to_dict()}
+    if isinstance(value, SimpleNamespace):
+        return {"namespace": {k: _encode(v, cassette) for k, v in vars(value).items()}}
+    raise TypeError(f"Cannot record a {type(value).__name__}")
+
+
+def _load_class(path):
+    module, _, name = path.partition(":")
+    cls = importlib.import_module(module)
+    for part in name.split("."):
+        cls = getattr(cls, part)
+    return cls
+
+
+def _decode(data, cassette):
+    if "json" in data:
+        return data["json"]
+    if "blob" in data:
+        return cassette.get_blob(data["blob"])
+    if "list" in data:
+        return [_decode(v, cassette) for v in data["list"]]
+    if "genai" in data:
+        from google.genai import types
+        return getattr(types, data["genai"]).model_validate(data["data"])
+    if "proto" in data:
+        return _load_class(data["proto"]).deserialize(base64.b64decode(data["data"]))
+    if "vertex" in data:
+        return _load_class(data["vertex"]).from_dict(data["data"])
+    if "namespace" in data:
+        return SimpleNamespace(**{k: _decode(v, cassette) for k, v in data["namespace"].items()})
+    raise ValueError(f"Unknown cassette value: {sorted(data)}")
+
+
+# ---- Cassette ----
+
+class Cassette:
+    """
+    Recorded interactions keyed by request_key, in a gzipped JSON-lines file:
+
+        {"key", "kind", "method", "duration", "value"}                  one response
+        {"key", "kind", "method", "duration", "chunks": [[at, value]]}  a stream; `at`
+                                                                        is seconds since the call
+
+    New interactions are appended (a later line for a key wins). Byte payloads
+    (GCS downloads) are stored once each under blobs/<sha256>.
+
+    Args:
+        path (str): Cassette file (conventionally <CASSETTE_DIR>/<name>.jsonl.gz).
+        mode (str): "record", "replay" or "auto".
+        pacing (str): "fast" or "recorded".
+    """
+
+    def __init__(self, path, mode=CASSETTE_MODE, pacing=CASSETTE_PACING):
+        self.path = path
+        self.mode = mode
+        self.pacing = pacing
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+        except (EOFError, json.JSONDecodeError):
+            # Interrupted while recording; keep the complete lines
+            pass
+
+    def _blob_path(self, sha256):
+        return os.path.join(os.path.dirname(self.path), BLOBS_DIR, sha256)
+
+    def put_blob(self, data):
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return sha256
+
+    def get_blob(self, sha256):
+        with open(self._blob_path(sha256), "rb") as f:
+            return f.read()
+
+    def lookup(self, key, kind, method):
+        """The entry to replay for key, None to call the API (and record), or raise CassetteMiss."""
+        entry = self.entries.get(key) if self.mode in ("replay", "auto") else None
+        with self._lock:
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None and self.mode == "replay":
+            raise CassetteMiss(f"No recording of {kind}.{method} for request {key} in {self.path}")
+        active = tracing.current_span()
+        if active is not None:
+            active.set_attribute("cassette", "replay" if entry is not None else "record")
+        return entry
+
+    def record(self, key, kind, method, duration, value=None, chunks=None):
+        entry = {"key": key, "kind": kind, "method": method, "duration": round(duration, 4)}
+        if chunks is None:
+            entry["value"] = _encode(value, self)
+        else:
+            entry["chunks"] = [[round(at, 4), _encode(chunk, self)] for at, chunk in chunks]
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Each append is its own gzip member; readers see one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            self.entries[key] = entry
+            self.recorded += 1
+
+    def value(self, entry):
+        return _decode(entry["value"], self)
+
+    def chunks(self, entry):
+        return [(at, _decode(chunk, self)) for at, chunk in entry["chunks"]]
+
+    def paced(self):
+        return self.pacing == "recorded"
+
+    def stats(self):
+        with self._lock:
+            methods = {}
+            for entry in self.entries.values():
+                name = f"{entry['kind']}.{entry['method']}"
+                methods[name] = methods.get(name, 0) + 1
+            return {
+                "mode": self.mode,
+                "pacing": self.pacing,
+                "path": self.path,
+                "entries": len(self.entries),
+                "methods": methods,
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+                "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            }
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The process-wide cassette for CASSETTE_MODE/CASSETTE_DIR/CASSETTE_NAME, or None when off."""
+    global _cassette
+    if not enabled():
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(os.path.join(CASSETTE_DIR, f"{CASSETTE_NAME}.jsonl.gz"))
+    return _cassette
+
+
+def cassette_stats():
+    """Mode, size and hit/miss counters of the cassette (None when off)."""
+    return _cassette.stats() if _cassette is not None else None
+
+
+# ---- Client proxies ----
+
+class _Lazy:
+    """Creates the real client on first use, so replaying needs no credentials."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.client = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client = self.factory()
+        return self.client
+
+    def resolve(self, path):
+        target = self.get()
+        for name in path:
+            target = getattr(target, name)
+        return target
+
+
+class _Proxy:
+    """
+    Stands in for a client (or one of its sub-objects such as client.aio.models).
+    Recorded methods go through the cassette; every other attribute is the real one.
+    """
+
+    def __init__(self, cassette, kind, real, path=()):
+        self._cassette = cassette
+        self._kind = kind
+        self._real = real
+        self._path = path
+
+    def __getattr__(self, name):
+        path = self._path + (name,)
+        recorded = RECORDED.get(self._kind, {})
+        style = recorded.get(path)
+        if style is not None:
+            return _recorder(self._cassette, self._kind, path, style, self._real)
+        if any(p[:len(path)] == path for p in recorded):
+            return _Proxy(self._cassette, self._kind, self._real, path)
+        return self._real.resolve(path)
+
+
+def _recorder(cassette, kind, path, style, real):
+    method = ".".join(path)
+
+    def prepare(args, kwargs):
+        key = request_key(kind, method, args, kwargs)
+        return key, cassette.lookup(key, kind, method)
+
+    if style == "call":
+        def call(*args, **kwargs):
+            key, entry = prepare(args, kwargs)
+            if entry is not None:
+                if cassette.paced():
+                    time.sleep(entry["duration"])
+                return cassette.value(entry)
+            start = time.perf_counter()
+            response = real.resolve(path)(*args, **kwargs)
+            cassette.record(key, kind, method, time.perf_counter() - start, value=response)
+            return response
+        return call
+
+    if style == "async":
+        async def acall(*args, **kwargs):
+            key, entry = prepare(args, kwargs)
+            if entry is not None:
+                if cassette.paced():
+                    await asyncio.sleep(entry["duration"])
+                return cassette.value(entry)
+            start = time.perf_counter()
+            response = await real.resolve(path)(*args, **kwargs)
+            cassette.record(key, kind, method, time.perf_counter() - start, value=response)
+            return response
+        return acall
+
+    if style == "stream":
+        def stream(*args, **kwargs):
+            key, entry = prepare(args, kwargs)
+            if entry is not None:
+                return _replay_stream(cassette, entry)
+            return _record_stream(cassette, key, kind, method, real.resolve(path), args, kwargs)
+        return stream
+
+    async def astream(*args, **kwargs):
+        key, entry = prepare(args, kwargs)
+        if entry is not None:
+            return _areplay_stream(cassette, entry)
+        start = time.perf_counter()
+        response_stream = await real.resolve(path)(*args, **kwargs)
+        return _arecord_stream(cassette, key, kind, method, response_stream, start)
+    return astream
+
+
+def _replay_stream(cassette, entry):
+    start = time.perf_counter()
+    for at, chunk in cassette.chunks(entry):
+        if cassette.paced():
+            time.sleep(max(0.0, at - (time.perf_counter() - start)))
+        yield chunk
+
+
+async def _areplay_stream(cassette, entry):
+    start = time.perf_counter()
+    for at, chunk in cassette.chunks(entry):
+        if cassette.paced():
+            await asyncio.sleep(max(0.0, at - (time.perf_counter() - start)))
+        yield chunk
+
+
+def _record_stream(cassette, key, kind, method, fn, args, kwargs):
+    # Only complete streams are recorded; one the caller abandons is dropped
+    start = time.perf_counter()
+    chunks = []
+    for chunk in fn(*args, **kwargs):
+        chunks.append((time.perf_counter() - start, chunk))
+        yield chunk
+    cassette.record(key, kind, method, time.perf_counter() - start, chunks=chunks)
+
+
+async def _arecord_stream(cassette, key, kind, method, response_stream, start):
+    chunks = []
+    async for chunk in response_stream:
+        chunks.append((time.perf_counter() - start, chunk))
+        yield chunk
+    cassette.record(key, kind, method, time.perf_counter() - start, chunks=chunks)
+
+
+class _StorageProxy:
+    """
+    Storage client whose reads go through the cassette: blob downloads (OCR counts
+    a PDF's pages from its bytes, and the recorded page ranges depend on it),
+    existence checks and get_blob metadata (the OCR cache key).
+    Everything else, uploads and rewrites included, uses the real client, so
+    replaying a run that stores documents still needs GCS.
+    """
+
+    def __init__(self, cassette, real):
+        self._cassette = cassette
+        self._real = real
+
+    def bucket(self, name, *args, **kwargs):
+        return _BucketProxy(self._cassette, self._real, name, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._real.get(), name)
+
+
+class _BucketProxy:
+    def __init__(self, cassette, real, name, args, kwargs):
+        self._cassette = cassette
+        self._real = real
+        self._bucket = None
+        self.name = name
+        self._args = (args, kwargs)
+
+    def _get(self):
+        if self._bucket is None:
+            args, kwargs = self._args
+            self._bucket = self._real.get().bucket(self.name, *args, **kwargs)
+        return self._bucket
+
+    def blob(self, blob_name, *args, **kwargs):
+        return _BlobProxy(self._cassette, self, blob_name, args, kwargs)
+
+    def get_blob(self, blob_name, *args, **kwargs):
+        """The blob with its metadata, or None if it does not exist."""
+        def fetch():
+            blob = self._get().get_blob(blob_name, *args, **kwargs)
+            if blob is None:
+                return None
+            return SimpleNamespace(**{attr: getattr(blob, attr, None) for attr in _BLOB_METADATA})
+
+        metadata = _recorded(self._cassette, "get_blob", f"gs://{self.name}/{blob_name}", kwargs, fetch)
+        if metadata is None:
+            return None
+        return _BlobProxy(self._cassette, self, blob_name, (), {}, metadata=vars(metadata))
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+# Blob attributes kept for get_blob, enough to build a content hash
+_BLOB_METADATA = ("size", "md5_hash", "crc32c", "generation", "content_type")
+
+
+def _recorded(cassette, method, uri, kwargs, fetch):
+    """Return the recorded result of a storage read, calling fetch() to record it."""
+    key = request_key("storage", method, [uri], kwargs)
+    entry = cassette.lookup(key, "storage", method)
+    if entry is not None:
+        return cassette.value(entry)
+    start = time.perf_counter()
+    value = fetch()
+    cassette.record(key, "storage", method, time.perf_counter() - start, value=value)
+    return value
+
+
+class _BlobProxy:
+    def __init__(self, cassette, bucket, name, args, kwargs, metadata=None):
+        self._cassette = cassette
+        self._bucket = bucket
+        self._blob = None
+        self.name = name
+        self._args = (args, kwargs)
+        # Recorded metadata (from get_blob) shadows the real blob's
+        self.__dict__.update(metadata or {})
+
+    def _get(self):
+        if self._blob is None:
+            args, kwargs = self._args
+            self._blob = self._bucket._get().blob(self.name, *args, **kwargs)
+        return self._blob
+
+    def _uri(self):
+        return f"gs://{self._bucket.name}/{self.name}"
+
+    def download_as_bytes(self, **kwargs):
+        return _recorded(self._cassette, "download_as_bytes", self._uri(), kwargs,
+                         lambda: self._get().download_as_bytes(**kwargs))
+
+    def exists(self, *args, **kwargs):
+        return _recorded(self._cassette, "exists", self._uri(), kwargs,
+                         lambda: self._get().exists(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+def wrap(kind, factory, cassette=None):
+    """
+    Client proxy for `kind` whose recorded methods go through the cassette.
+    factory() creates the real client, on first use.
+    """
+    cassette = cassette or get_cassette()
+    real = _Lazy(factory)
+    if kind == "storage":
+        return _StorageProxy(cassette, real)
+    return _Proxy(cassette, kind, real)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect recorded API cassettes.")
+    parser.add_argument("cassette", nargs="?", default=os.path.join(CASSETTE_DIR, f"{CASSETTE_NAME}.jsonl.gz"))
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.cassette):
+        print(f"No cassette at {args.cassette}")
+        return 1
+    print(json.dumps(Cassette(args.cassette, mode="replay").stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,18 @@
+import asyncio
 import base64
 import mimetypes
 import io
+import time
 import typing
 import requests
 from PIL import Image # For handling image data
-from google import genai
 from google.genai import types
 
+from Class import resilience
+from Class.clients import get_genai_client
+from Class.context_cache import LOCAL_PREFIX, document_part, make_context_cache
+from Class.metrics import record_usage, upstream
+
 # --- Start of utils.py content, adapted for pure Python ---
 
 def get_part_from_file(file_path):
@@ -151,51 +157,37 @@ def convert_content_to_output_list(
 # --- End of utils.py content, adapted for pure Python ---
 
 
-# The main generation function, adapted to use the pure Python utils
-def generate_legal_advice(
-    user_message: typing.Union[str, dict, Image.Image, bytes, typing.Tuple[str, ...]],
-    chat_history: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
-    project_id: str = "sodium-coil-470706-f4",
-    location: str = "global",
-    stream_response: bool = False # Added for potential Flask streaming
-):
-    """
-    Function to call the model for legal advice based on user input and chat history.
+MODEL_NAME = "gemini-2.5-flash-lite"
 
-    Args:
-        user_message: The current message from the user. Can be a string,
-                      a dictionary (for text/files), a PIL Image, or raw bytes.
-        chat_history: A list of previous chat messages. Each item in the list
-                      should be a dictionary like {"role": "user"|"model", "content": "message text"}.
-                      The 'content' can also be a more complex type if it was e.g., an image.
-        project_id (str): Google Cloud project ID.
-        location (str): Google Cloud location for Vertex AI.
-        stream_response (bool): If True, yields chunks of the response. If False, returns the full response.
+SYSTEM_INSTRUCTION = """you are a highly qualified legal professional, renowned for your sharp wit, unparalleled expertise, and ability to win even the toughest cases. As a top-tier legal advisor and document assistant, you are well-versed in all areas of law, including corporate, criminal, civil, tax, intellectual property, international, and regulatory law in the Indian jurisdiction specifically. You provide precise, actionable legal advice, identifying legitimate strategies, exemptions, or loopholes to minimize penalties or liabilities when requested, without ever endorsing illegal actions."""
 
-    Returns:
-        If stream_response is True, yields string chunks.
-        If stream_response is False, returns a single string with the full response.
-    """
-    if chat_history is None:
-        chat_history = []
 
-    # For a Flask app, you might validate keys here, or earlier in middleware.
-    # For this pure Python function, we remove the request object dependency.
-    # validate_key_result = utils.validate_key(request) # Removed request dependency
-    # if validate_key_result is not None:
-    #     yield validate_key_result # This would also need to be adapted for non-Gradio streaming.
+# Document + system instruction registered once per gsUri and reused across questions
+context_cache = make_context_cache(MODEL_NAME, SYSTEM_INSTRUCTION)
 
-    client = genai.Client(
-        vertexai=True,
-        project=project_id,
-        location=location,
-    )
 
-    si_text1 = types.Part.from_text(text="""you are a highly qualified legal professional, renowned for your sharp wit, unparalleled expertise, and ability to win even the toughest cases. As a top-tier legal advisor and document assistant, you are well-versed in all areas of law, including corporate, criminal, civil, tax, intellectual property, international, and regulatory law in the Indian jurisdiction specifically. You provide precise, actionable legal advice, identifying legitimate strategies, exemptions, or loopholes to minimize penalties or liabilities when requested, without ever endorsing illegal actions.""")
-    
-    model = "gemini-2.5-flash-lite"
+def context_cache_stats():
+    return context_cache.stats() if context_cache is not None else None
+
+
+def build_generation_request(user_message, chat_history, cached_content=None):
+    """
+    Build the (contents, config) pair sent to the model for one turn.
+    With cached_content, the document and system instruction come from the
+    cached context instead of being sent again.
+    """
+    si_text1 = types.Part.from_text(text=SYSTEM_INSTRUCTION)
 
     contents = []
+    if cached_content and cached_content.startswith(LOCAL_PREFIX):
+        # Local registry: expand the handle back into what it stands for
+        resolved = context_cache.store.resolve(cached_content)
+        if resolved is None:
+            # Callers treat this like an expired Gemini handle and resend the document
+            raise LookupError(f"Cached context {cached_content} has expired")
+        document, _ = resolved
+        contents.append(types.Content(role="user", parts=[document_part(document)]))
+        cached_content = None
     # Build the conversation history for the model
     for prev_msg in chat_history:
         role = "user" if prev_msg["role"] == "user" else "model"
@@ -220,8 +212,66 @@ def generate_legal_advice(
             types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
             types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
         ],
-        system_instruction=[si_text1],
     )
+    if cached_content:
+        generate_content_config.cached_content = cached_content
+    else:
+        generate_content_config.system_instruction = [si_text1]
+    return contents, generate_content_config
+
+
+def chunk_text(chunk):
+    """Text carried by one streamed response chunk ("" if none)."""
+    if chunk.candidates and chunk.candidates[0] and chunk.candidates[0].content:
+        # convert_content_to_output_list will give a list, join if it's text
+        chunk_parts = convert_content_to_output_list(chunk.candidates[0].content, use_markdown=True)
+        # Assuming text for streaming, handle images separately if needed
+        return "".join(p for p in chunk_parts if isinstance(p, str))
+    return ""
+
+
+def mark_first_chunk(active, started):
+    """Record time to first chunk as an event on the stream's span (if traced)."""
+    if active is not None:
+        active.add_event("first_chunk", {"time_to_first_chunk_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+# The main generation function, adapted to use the pure Python utils
+def generate_legal_advice(
+    user_message: typing.Union[str, dict, Image.Image, bytes, typing.Tuple[str, ...]],
+    chat_history: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
+    project_id: typing.Optional[str] = None,
+    location: typing.Optional[str] = None,
+    stream_response: bool = False # Added for potential Flask streaming
+):
+    """
+    Function to call the model for legal advice based on user input and chat history.
+
+    Args:
+        user_message: The current message from the user. Can be a string,
+                      a dictionary (for text/files), a PIL Image, or raw bytes.
+        chat_history: A list of previous chat messages. Each item in the list
+                      should be a dictionary like {"role": "user"|"model", "content": "message text"}.
+                      The 'content' can also be a more complex type if it was e.g., an image.
+        project_id (str, optional): Google Cloud project ID. Defaults to the PROJECT_ID setting.
+        location (str, optional): Google Cloud location for Vertex AI. Defaults to GENAI_LOCATION.
+        stream_response (bool): If True, yields chunks of the response. If False, returns the full response.
+
+    Returns:
+        If stream_response is True, yields string chunks.
+        If stream_response is False, returns a single string with the full response.
+    """
+    if chat_history is None:
+        chat_history = []
+
+    # For a Flask app, you might validate keys here, or earlier in middleware.
+    # For this pure Python function, we remove the request object dependency.
+    # validate_key_result = utils.validate_key(request) # Removed request dependency
+    # if validate_key_result is not None:
+    #     yield validate_key_result # This would also need to be adapted for non-Gradio streaming.
+
+    client = get_genai_client(project_id, location)
+
+    contents, generate_content_config = build_generation_request(user_message, chat_history)
 
     # MCP tool call logic (add this before Gemini call)
     if isinstance(user_message, str) and user_message.lower().startswith("what is"):
@@ -230,32 +280,116 @@ def generate_legal_advice(
         if definition and "definition" in definition:
             return definition["definition"]
 
-    response_generator = client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    )
+    usage = None
+    with upstream("gemini", "generate_content_stream") as active:
+        started = time.perf_counter()
+        # Opening the stream (up to its first chunk) is retried; see Class.resilience
+        response_generator = resilience.stream(
+            "gemini",
+            client.models.generate_content_stream,
+            model=MODEL_NAME,
+            contents=contents,
+            config=generate_content_config,
+        )
 
-    if stream_response:
-        for chunk in response_generator:
-            if chunk.candidates and chunk.candidates[0] and chunk.candidates[0].content:
-                # convert_content_to_output_list will give a list, join if it's text
-                chunk_parts = convert_content_to_output_list(chunk.candidates[0].content, use_markdown=True)
-                # Assuming text for streaming, handle images separately if needed
-                text_chunks = [p for p in chunk_parts if isinstance(p, str)]
-                if text_chunks:
-                    yield "".join(text_chunks)
-    else:
-        full_response_text = ""
-        # If not streaming, collect all parts and return as a single string
-        for chunk in response_generator:
-            if chunk.candidates and chunk.candidates[0] and chunk.candidates[0].content:
-                chunk_parts = convert_content_to_output_list(chunk.candidates[0].content, use_markdown=True)
-                # Join text parts; for images, you'd collect them or handle them differently.
-                text_content = [p for p in chunk_parts if isinstance(p, str)]
-                full_response_text += "".join(text_content)
+        if stream_response:
+            for i, chunk in enumerate(response_generator):
+                if i == 0:
+                    mark_first_chunk(active, started)
+                usage = chunk.usage_metadata or usage
+                text = chunk_text(chunk)
+                if text:
+                    yield text
+        else:
+            full_response_text = ""
+            # If not streaming, collect all parts and return as a single string
+            for i, chunk in enumerate(response_generator):
+                if i == 0:
+                    mark_first_chunk(active, started)
+                usage = chunk.usage_metadata or usage
+                full_response_text += chunk_text(chunk)
+    record_usage(MODEL_NAME, usage)
+    if not stream_response:
         return full_response_text
 
+async def agenerate_legal_advice(
+    user_message: typing.Union[str, dict, Image.Image, bytes, typing.Tuple[str, ...]],
+    chat_history: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
+    project_id: typing.Optional[str] = None,
+    location: typing.Optional[str] = None,
+    cached_content: typing.Optional[str] = None,
+):
+    """
+    Async counterpart of generate_legal_advice using the google-genai aio client.
+    Yields text chunks as they arrive without blocking the event loop.
+    cached_content is a handle from context_cache standing in for the document.
+    """
+    if chat_history is None:
+        chat_history = []
+
+    client = get_genai_client(project_id, location)
+
+    contents, generate_content_config = build_generation_request(user_message, chat_history, cached_content)
+
+    if isinstance(user_message, str) and user_message.lower().startswith("what is"):
+        term = user_message.lower().replace("what is", "").strip("? .")
+        definition = await asyncio.to_thread(call_mcp_tool, "get_legal_term_definition", {"term": term})
+        if definition and "definition" in definition:
+            yield definition["definition"]
+            return
+
+    usage = None
+    # Includes the time the caller takes to consume each chunk, which for
+    # pdf_qa is only forwarding it as progress
+    with upstream("gemini", "generate_content_stream") as active:
+        started = time.perf_counter()
+        response_stream = resilience.astream(
+            "gemini",
+            client.aio.models.generate_content_stream,
+            model=MODEL_NAME,
+            contents=contents,
+            config=generate_content_config,
+        )
+        first = True
+        async for chunk in response_stream:
+            if first:
+                mark_first_chunk(active, started)
+                first = False
+            usage = chunk.usage_metadata or usage
+            text = chunk_text(chunk)
+            if text:
+                yield text
+    record_usage(MODEL_NAME, usage)
+
+def summarize_turns(summary, turns):
+    """
+    Fold older chat turns into a running summary with one short model call.
+
+    Args:
+        summary (str): The summary so far ("" if none).
+        turns (list): {"role", "content"} turns (text only) to fold in.
+
+    Returns:
+        str: The updated summary.
+    """
+    transcript = "\n".join(
+        f"{'User' if t['role'] == 'user' else 'Assistant'}: {t['content']}" for t in turns
+    )
+    with upstream("gemini", "generate_content"):
+        response = resilience.call(
+            "gemini",
+            get_genai_client().models.generate_content,
+            model=MODEL_NAME,
+            contents=(
+                "Update this summary of a legal Q&A conversation with the new exchanges. Keep the facts, "
+                "clauses, page references and conclusions; drop pleasantries. Reply with the summary only.\n\n"
+                f"Summary so far:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript}"
+            ),
+            config=types.GenerateContentConfig(temperature=0.0, max_output_tokens=600),
+        )
+    record_usage(MODEL_NAME, response.usage_metadata)
+    return response.text or summary
+
 def automated_chat(question, file_path=None, stream_response=False, chat_history=None):
     """
     Flask-compatible version: accepts question and optional file_path, returns model response.
@@ -290,6 +424,51 @@ def automated_chat(question, file_path=None, stream_response=False, chat_history
 
         return response
 
+async def astream_chat(question, file_path=None, chat_history=None):
+    """
+    Async streaming chat: yields answer chunks as the model produces them and
+    records the finished turn in chat_history.
+    """
+    if chat_history is None:
+        chat_history = []
+
+    cached_content = None
+    if file_path and file_path.startswith("gs://") and context_cache is not None:
+        cached_content = await asyncio.to_thread(context_cache.acquire, file_path)
+
+    if file_path and not cached_content:
+        user_input = {"text": question, "files": [file_path]}
+    else:
+        user_input = question
+
+    # The current turn is passed separately, so it is only appended to the
+    # history once the model has answered (otherwise it would be sent twice).
+    full_response = ""
+    try:
+        async for chunk in agenerate_legal_advice(user_input, chat_history=chat_history, cached_content=cached_content):
+            full_response += chunk
+            yield chunk
+    except Exception:
+        if not cached_content or full_response:
+            raise
+        # The handle may have expired server-side; drop it and send the document instead
+        context_cache.invalidate(file_path)
+        user_input = {"text": question, "files": [file_path]}
+        async for chunk in agenerate_legal_advice(user_input, chat_history=chat_history):
+            full_response += chunk
+            yield chunk
+    chat_history.append({"role": "user", "content": user_input})
+    chat_history.append({"role": "model", "content": full_response})
+
+async def aautomated_chat(question, file_path=None, chat_history=None):
+    """
+    Async version of automated_chat. Returns the full model response text.
+    """
+    chunks = []
+    async for chunk in astream_chat(question, file_path=file_path, chat_history=chat_history):
+        chunks.append(chunk)
+    return "".join(chunks)
+
 MCP_SERVER_URL = "https://sodium-coil-470706-f4-38771871641.asia-south1.run.app"
 
 def call_mcp_tool(tool_name, params):
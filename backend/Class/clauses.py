@@ -0,0 +1,112 @@
+import re
+
+
+# Numbered headings: "3.", "3.1", "3.1.2 Term", "4) Payment", "Section 5. Notices",
+# "Article IV - Termination", "Clause 12". A bare decimal needs at least one dot
+# or a closing parenthesis, so a line starting "30 days" is not a heading.
+_NUMBERED = re.compile(
+    r"(?:(?:section|article|clause)\s+(?P<word_number>\d+(?:\.\d+)*|[ivxlc]+)\b[.):]?"
+    r"|(?P<number>\d+(?:\.\d+)+|\d+[.)])\.?)"
+    r"(?:\s+[-–—:]?\s*(?P<title>\S.*))?$",
+    re.IGNORECASE,
+)
+_MAX_HEADING_CHARS = 120
+_HEADING_START = frozenset("0123456789SsAaCc")
+
+
+def _numbered_heading(line):
+    """Return (number, title) if line opens a numbered clause, else None."""
+    if line[0] not in _HEADING_START or len(line) > _MAX_HEADING_CHARS * 4:
+        return None
+    match = _NUMBERED.match(line)
+    if not match:
+        return None
+    number = (match.group("word_number") or match.group("number")).rstrip(".)")
+    title = (match.group("title") or "").strip()
+    # "2.5 percent of the fee..." is a sentence, not a heading
+    if title and not (title[0].isupper() or title[0].isdigit() or title[0] in "(\"'"):
+        return None
+    if match.group("word_number") and not match.group("word_number")[0].isdigit():
+        number = number.upper()
+    return number, title
+
+
+def _caps_heading(line):
+    """An unnumbered ALL-CAPS line such as "GOVERNING LAW" is a heading."""
+    if len(line) > _MAX_HEADING_CHARS or line.endswith((".", ",", ";")):
+        return False
+    letters = sum(1 for c in line if c.isalpha())
+    return letters >= 4 and line.upper() == line and letters >= len(line) // 2
+
+
+def iter_clauses(pages, max_depth=None):
+    """
+    Split OCR'd pages into clauses, yielding each one as soon as the next heading is seen.
+
+    Headings are recognised by numbering ("1.", "2.3", "Section 4", "Article IV")
+    or as short ALL-CAPS lines. Text before the first heading is yielded as a
+    clause with number None. `pages` may be a generator, so clauses can be
+    consumed while later pages are still being OCR'd.
+
+    Args:
+        pages (iterable): Page dicts with "page_number" and "text", as in the
+            "pages" list returned by process_pdf_with_document_ai.
+        max_depth (int, optional): Only numbers with at most this many levels
+            start a new clause (max_depth=1 keeps "3.1" inside clause 3).
+
+    Yields:
+        dict: clause_id, number, heading, text, page_start, start_offset,
+              page_end, end_offset. Offsets are character offsets into the
+              page's text; end_offset is exclusive.
+    """
+    clause_id = 0
+    current = None
+    lines = []
+    has_body = False
+    last_page, last_end = None, 0
+
+    def finish():
+        nonlocal clause_id
+        clause = {"clause_id": clause_id, **current, "page_end": last_page, "end_offset": last_end,
+                  "text": "\n".join(lines).strip()}
+        clause_id += 1
+        return clause
+
+    for page in pages:
+        text = page.get("text") or ""
+        page_number = page["page_number"]
+        offset = 0
+        for raw in text.split("\n"):
+            line_start, offset = offset, offset + len(raw) + 1
+            line = raw.strip()
+            if not line:
+                if current is not None:
+                    lines.append("")
+                continue
+            heading = _numbered_heading(line)
+            if heading is not None and max_depth is not None and heading[0].count(".") >= max_depth:
+                heading = None
+            if heading is None and _caps_heading(line):
+                heading = (None, line)
+            if heading is not None and heading[0] is None and current is not None and not has_body:
+                # "ARTICLE 4" followed by "TERMINATION": one heading over two lines
+                current["heading"] = f"{current['heading']} {line}".strip()
+                heading = None
+            elif heading is not None or current is None:
+                if current is not None:
+                    yield finish()
+                number, title = heading if heading is not None else (None, "")
+                current = {"number": number, "heading": title, "page_start": page_number, "start_offset": line_start}
+                lines = []
+                has_body = heading is None
+            else:
+                has_body = True
+            lines.append(line)
+            last_page, last_end = page_number, line_start + len(raw)
+    if current is not None:
+        yield finish()
+
+
+def segment_clauses(pages, max_depth=None):
+    """List form of iter_clauses."""
+    return list(iter_clauses(pages, max_depth=max_depth))
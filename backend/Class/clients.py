@@ -0,0 +1,101 @@
+import os
+import threading
+
+from Class import cassettes
+
+
+# Settings for all Google clients. Defaults match the deployed project.
+PROJECT_ID = os.getenv("PROJECT_ID", "sodium-coil-470706-f4")
+GENAI_LOCATION = os.getenv("GENAI_LOCATION", "global")
+VERTEX_LOCATION = os.getenv("VERTEX_LOCATION", "us-central1")
+DOCUMENTAI_LOCATION = os.getenv("DOCUMENTAI_LOCATION", "us")
+DOCUMENTAI_PROCESSOR_ID = os.getenv("DOCUMENTAI_PROCESSOR_ID", "18d898182b219656")
+
+_clients = {}
+_overrides = {}
+_lock = threading.Lock()
+
+
+def _get_or_create(kind, key, factory):
+    override = _overrides.get(kind)
+    if override is not None:
+        return override
+    client = _clients.get((kind, key))
+    if client is None:
+        with _lock:
+            client = _clients.get((kind, key))
+            if client is None:
+                # With CASSETTE_MODE set, responses are recorded or replayed (see Class.cassettes)
+                client = cassettes.wrap(kind, factory) if cassettes.enabled() else factory()
+                _clients[(kind, key)] = client
+    return client
+
+
+def override_client(kind, instance):
+    """
+    Make every get_<kind> call return instance (e.g. a local fake in tests).
+
+    Args:
+        kind (str): "genai", "documentai", "storage" or "generative_model".
+        instance: Object to return, or None to remove the override.
+    """
+    if instance is None:
+        _overrides.pop(kind, None)
+    else:
+        _overrides[kind] = instance
+
+
+def reset_clients():
+    """Drop all cached clients and overrides; the next call creates fresh ones."""
+    with _lock:
+        _clients.clear()
+        _overrides.clear()
+
+
+def get_genai_client(project=None, location=None):
+    """Shared google-genai client (Vertex AI backend), created on first use."""
+    project = project or PROJECT_ID
+    location = location or GENAI_LOCATION
+
+    def factory():
+        from google import genai
+        return genai.Client(vertexai=True, project=project, location=location)
+
+    return _get_or_create("genai", (project, location), factory)
+
+
+def get_documentai_client(location=None):
+    """Shared Document AI client for the regional endpoint, created on first use."""
+    location = location or DOCUMENTAI_LOCATION
+
+    def factory():
+        from google.cloud import documentai
+        client_options = {"api_endpoint": f"{location}-documentai.googleapis.com"}
+        return documentai.DocumentProcessorServiceClient(client_options=client_options)
+
+    return _get_or_create("documentai", location, factory)
+
+
+def get_storage_client(project=None):
+    """Shared Cloud Storage client, created on first use."""
+    project = project or PROJECT_ID
+
+    def factory():
+        from google.cloud import storage
+        return storage.Client(project=project)
+
+    return _get_or_create("storage", project, factory)
+
+
+def get_generative_model(model_name, project=None, location=None):
+    """Shared vertexai GenerativeModel; vertexai.init runs on first use, not at import."""
+    project = project or PROJECT_ID
+    location = location or VERTEX_LOCATION
+
+    def factory():
+        import vertexai
+        from vertexai.generative_models import GenerativeModel
+        vertexai.init(project=project, location=location)
+        return GenerativeModel(model_name)
+
+    return _get_or_create("generative_model", (model_name, project, location), factory)
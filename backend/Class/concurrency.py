@@ -0,0 +1,57 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+# Shared pool for SDK calls that have no async client (Document AI, GCS).
+# Bounded so a burst of slow OCR calls cannot spawn unbounded threads.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+DEFAULT_TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="mcp-blocking")
+_semaphores = {}
+
+
+def tool_concurrency(tool_name):
+    """
+    Concurrency limit for a tool.
+    Reads TOOL_CONCURRENCY_<TOOL_NAME> (e.g. TOOL_CONCURRENCY_PDF_QA), then TOOL_CONCURRENCY.
+    """
+    return int(os.getenv(f"TOOL_CONCURRENCY_{tool_name.upper()}", DEFAULT_TOOL_CONCURRENCY))
+
+
+def _semaphore(tool_name):
+    loop = asyncio.get_running_loop()
+    entry = _semaphores.get(tool_name)
+    # Semaphores bind to the loop they first block on; rebuild if the loop changed
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Semaphore(tool_concurrency(tool_name)))
+        _semaphores[tool_name] = entry
+    return entry[1]
+
+
+@asynccontextmanager
+async def tool_slot(tool_name):
+    """Wait for a free slot for tool_name; callers beyond the limit queue here."""
+    async with _semaphore(tool_name):
+        yield
+
+
+def in_caller_context(fn):
+    """
+    Wrap fn for executor.map on a plain ThreadPoolExecutor so every call runs
+    in a copy of the caller's context (metrics and tracing state included).
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the shared pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
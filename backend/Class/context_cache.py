@@ -0,0 +1,241 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from google.genai import types
+
+from Class import resilience
+from Class.clients import get_genai_client
+from Class.metrics import upstream
+from Class.sessions import SESSION_TTL_SECONDS
+
+
+# "gemini" registers documents with the Gemini cached-content API, "local" keeps
+# an in-process registry with the same interface (no token savings; used for
+# stubs and tests), "off" disables the layer.
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "gemini")
+# Handles expire after this long without a question, like chat sessions
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", str(SESSION_TTL_SECONDS)))
+# After a failed registration (e.g. document below the provider's minimum size) don't retry for this long
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("CONTEXT_CACHE_RETRY_SECONDS", "600"))
+# Documents tracked at once; the least recently asked about is dropped beyond this
+CONTEXT_CACHE_MAX_DOCUMENTS = int(os.getenv("CONTEXT_CACHE_MAX_DOCUMENTS", "1000"))
+
+LOCAL_PREFIX = "local/"
+
+
+def document_part(document):
+    return types.Part.from_uri(file_uri=document, mime_type="application/pdf")
+
+
+class GeminiContextStore:
+    """Cached contents held by the Gemini API."""
+
+    kind = "gemini"
+
+    def create(self, document, model, system_instruction, ttl_seconds):
+        with upstream("gemini", "caches.create"):
+            cache = resilience.create(
+                "gemini",
+                get_genai_client().caches.create,
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[document_part(document)])],
+                    system_instruction=system_instruction,
+                    display_name=hashlib.sha256(document.encode()).hexdigest()[:32],
+                    ttl=f"{ttl_seconds}s",
+                ),
+            )
+        return cache.name
+
+    def refresh(self, name, ttl_seconds):
+        with upstream("gemini", "caches.update"):
+            resilience.call("gemini", get_genai_client().caches.update,
+                            name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"))
+
+    def delete(self, name):
+        with upstream("gemini", "caches.delete"):
+            resilience.call("gemini", get_genai_client().caches.delete, name=name)
+
+
+class LocalContextStore:
+    """In-process stand-in: handles resolve back to the document and system instruction until their TTL."""
+
+    kind = "local"
+
+    def __init__(self):
+        self._contents = OrderedDict()  # name -> (document, system_instruction, expires_at), soonest expiry first
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._contents:
+            name, (_, _, expires_at) = next(iter(self._contents.items()))
+            if expires_at > now:
+                break
+            del self._contents[name]
+
+    def create(self, document, model, system_instruction, ttl_seconds):
+        name = LOCAL_PREFIX + hashlib.sha256(f"{model}\0{system_instruction}\0{document}".encode()).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._contents.pop(name, None)
+            self._contents[name] = (document, system_instruction, now + ttl_seconds)
+        return name
+
+    def refresh(self, name, ttl_seconds):
+        with self._lock:
+            entry = self._contents.pop(name, None)
+            if entry is not None:
+                self._contents[name] = (entry[0], entry[1], time.monotonic() + ttl_seconds)
+
+    def delete(self, name):
+        with self._lock:
+            self._contents.pop(name, None)
+
+    def resolve(self, name):
+        """Return (document, system_instruction) for a live local handle, or None."""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._contents.get(name)
+        return entry[:2] if entry is not None else None
+
+
+class ContextCache:
+    """
+    One cached context (document + system instruction) per document, reused by
+    every question about it. A handle's expiry is pushed back whenever it is
+    used, so it lives as long as someone keeps asking about the document.
+    Expired handles and failures are forgotten, and at most max_documents are
+    tracked (the least recently used handle is deleted from the store).
+    """
+
+    def __init__(self, model, system_instruction, store, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+                 max_documents=CONTEXT_CACHE_MAX_DOCUMENTS):
+        self.model = model
+        self.system_instruction = system_instruction
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self._entries = OrderedDict()  # document -> {"name", "expires_at"}, least recently used first
+        self._failed = OrderedDict()  # document -> retry_at, oldest failure first
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _document_lock(self, document):
+        with self._lock:
+            return self._locks.setdefault(document, threading.Lock())
+
+    def _prune(self, now):
+        """
+        Drop expired handles and failures and trim to max_documents. Returns the
+        handles trimmed while still live, for the caller to delete from the store.
+        """
+        evicted = []
+        with self._lock:
+            while self._failed and next(iter(self._failed.values())) <= now:
+                self._failed.popitem(last=False)
+            while self._entries:
+                entry = next(iter(self._entries.values()))
+                if entry["expires_at"] > now and len(self._entries) <= self.max_documents:
+                    break
+                self._entries.popitem(last=False)
+                if entry["expires_at"] > now:
+                    evicted.append(entry["name"])
+                    self.evictions += 1
+            # Keep locks only for documents still tracked (or in use right now)
+            for document in [d for d, lock in self._locks.items()
+                             if d not in self._entries and d not in self._failed and not lock.locked()]:
+                del self._locks[document]
+        return evicted
+
+    def acquire(self, document):
+        """
+        Return a cached-content handle for document, registering it on first use.
+
+        Args:
+            document (str): gs:// URI of the PDF.
+
+        Returns:
+            str: The handle, or None if the document could not be cached (the
+                 caller should attach the document as usual).
+        """
+        try:
+            return self._acquire(document)
+        finally:
+            for name in self._prune(time.monotonic()):
+                try:
+                    self.store.delete(name)
+                except Exception:
+                    pass
+
+    def _acquire(self, document):
+        with self._document_lock(document):
+            now = time.monotonic()
+            if now < self._failed.get(document, 0):
+                return None
+            entry = self._entries.get(document)
+            if entry and entry["expires_at"] > now:
+                with self._lock:
+                    if document in self._entries:
+                        self._entries.move_to_end(document)
+                self.hits += 1
+                # Only call the API to extend the TTL once half of it has been used
+                if entry["expires_at"] - now < self.ttl_seconds / 2:
+                    try:
+                        self.store.refresh(entry["name"], self.ttl_seconds)
+                        entry["expires_at"] = now + self.ttl_seconds
+                    except Exception:
+                        pass
+                return entry["name"]
+            self.misses += 1
+            try:
+                name = self.store.create(document, self.model, self.system_instruction, self.ttl_seconds)
+            except Exception:
+                with self._lock:
+                    self._failed.pop(document, None)
+                    self._failed[document] = now + CONTEXT_CACHE_RETRY_SECONDS
+                    self._entries.pop(document, None)
+                return None
+            with self._lock:
+                self._entries.pop(document, None)
+                self._entries[document] = {"name": name, "expires_at": now + self.ttl_seconds}
+            return name
+
+    def invalidate(self, document):
+        """Forget the handle for document (e.g. after the provider rejected it)."""
+        with self._document_lock(document), self._lock:
+            entry = self._entries.pop(document, None)
+        if entry:
+            try:
+                self.store.delete(entry["name"])
+            except Exception:
+                pass
+
+    def stats(self):
+        now = time.monotonic()
+        total = self.hits + self.misses
+        with self._lock:
+            entries = sum(1 for e in self._entries.values() if e["expires_at"] > now)
+        return {
+            "backend": self.store.kind,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def make_context_cache(model, system_instruction, kind=None):
+    """Build the ContextCache selected by CONTEXT_CACHE, or None when it is off."""
+    kind = kind or CONTEXT_CACHE
+    if kind == "off":
+        return None
+    store = LocalContextStore() if kind == "local" else GeminiContextStore()
+    return ContextCache(model, system_instruction, store)
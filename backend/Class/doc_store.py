@@ -0,0 +1,196 @@
+import hashlib
+import io
+import logging
+import os
+import re
+
+from Class.cache import ResultCache, get_backend
+from Class import resilience
+from Class.clients import PROJECT_ID, get_storage_client
+from Class.metrics import upstream
+
+
+logger = logging.getLogger("doc_store")
+
+# Documents are stored once under their SHA-256, so the same contract uploaded
+# twice (or under two names) maps to one object and one stable URI.
+DOC_PREFIX = os.getenv("DOC_PREFIX", "docs")
+UPLOAD_DIR = "uploads"
+
+_CONTENT_URI = re.compile(r"/(?:.*/)?([0-9a-f]{64})\.pdf$")
+
+# (owner, filename) -> sha256 aliases, where the owner is the MCP session that
+# uploaded the file: one client must not see or overwrite another's aliases.
+# No max age; only the "doc-alias" namespace is trimmed, by count, so the OCR
+# and answer caches' limits never drop an alias.
+# DOC_ALIAS_PATH moves the index out of the shared cache file entirely.
+_aliases = None
+
+
+def _alias_index():
+    global _aliases
+    if _aliases is None:
+        _aliases = ResultCache(
+            get_backend(None, os.getenv("DOC_ALIAS_PATH")),
+            namespace="doc-alias",
+            max_entries=int(os.getenv("DOC_ALIAS_MAX_ENTRIES", "100000")),
+        )
+    return _aliases
+
+
+# sha256 -> page count, recorded when the upload path has the bytes in hand so
+# OCR can plan its page-range fan-out without downloading the PDF again
+_page_counts = None
+
+
+def _page_count_index():
+    global _page_counts
+    if _page_counts is None:
+        _page_counts = ResultCache(
+            get_backend(None, os.getenv("DOC_ALIAS_PATH")),
+            namespace="doc-pages",
+            max_entries=int(os.getenv("DOC_ALIAS_MAX_ENTRIES", "100000")),
+        )
+    return _page_counts
+
+
+def count_pdf_pages(raw):
+    """Return the number of pages in PDF bytes, or None if they cannot be read."""
+    try:
+        import pikepdf
+    except ImportError:
+        logger.warning("pikepdf is not installed; PDF page counts are unavailable")
+        return None
+    try:
+        with pikepdf.open(io.BytesIO(raw)) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        logger.warning("Could not count PDF pages: %s", e)
+        return None
+
+
+def remember_page_count(sha256, page_count):
+    if page_count:
+        _page_count_index().set(sha256, page_count)
+
+
+def known_page_count(sha256):
+    """Return the page count recorded for a stored document, or None."""
+    return _page_count_index().get(sha256)
+
+
+def content_object_name(sha256):
+    return f"{DOC_PREFIX}/{sha256}.pdf"
+
+
+def sha256_from_uri(uri):
+    """Return the SHA-256 embedded in a content-addressed gs:// URI or local path, else None."""
+    match = _CONTENT_URI.search(uri or "")
+    return match.group(1) if match else None
+
+
+def remember_alias(filename, sha256, uri, owner=None):
+    """Record filename for owner. Uploads without an owner get no alias."""
+    if owner:
+        _alias_index().set(f"{owner}/{filename}", {"sha256": sha256, "uri": uri})
+
+
+def resolve_alias(filename, owner=None):
+    """Return {"sha256", "uri"} for the last document owner uploaded under filename, or None."""
+    if not owner:
+        return None
+    return _alias_index().get(f"{owner}/{filename}")
+
+
+def find_existing(bucket_name, sha256, project_id=None):
+    """Return the gs:// URI if a document with this SHA-256 is already stored, else None."""
+    blob = get_storage_client(project_id or PROJECT_ID).bucket(bucket_name).blob(content_object_name(sha256.lower()))
+    with upstream("gcs", "exists"):
+        exists = resilience.call("gcs", blob.exists)
+    return f"gs://{bucket_name}/{blob.name}" if exists else None
+
+
+def store_pdf(raw, filename, bucket_name, project_id=None, owner=None):
+    """
+    Store PDF bytes under their content hash, skipping the upload if the object exists.
+
+    Args:
+        raw (bytes): PDF content.
+        filename (str): Client filename, recorded as an alias.
+        bucket_name (str): Target bucket.
+        project_id (str, optional): Project for the storage client.
+        owner (str, optional): Session the filename alias is recorded for.
+
+    Returns:
+        dict: Contains gcs_uri, sha256, page_count (None if unreadable) and
+              deduplicated (True if the upload was skipped)
+    """
+    sha256 = hashlib.sha256(raw).hexdigest()
+    blob = get_storage_client(project_id or PROJECT_ID).bucket(bucket_name).blob(content_object_name(sha256))
+    with upstream("gcs", "exists"):
+        deduplicated = resilience.call("gcs", blob.exists)
+    if not deduplicated:
+        # if_generation_match=0: if another request (or an earlier attempt) stores the same bytes first, keep theirs
+        try:
+            with upstream("gcs", "upload"):
+                resilience.call("gcs", blob.upload_from_string, raw, content_type="application/pdf", if_generation_match=0)
+        except Exception as e:
+            if getattr(e, "code", None) != 412:
+                raise
+            deduplicated = True
+    gcs_uri = f"gs://{bucket_name}/{blob.name}"
+    remember_alias(filename, sha256, gcs_uri, owner)
+    page_count = known_page_count(sha256) or count_pdf_pages(raw)
+    remember_page_count(sha256, page_count)
+    return {"gcs_uri": gcs_uri, "sha256": sha256, "page_count": page_count, "deduplicated": deduplicated}
+
+
+def store_pdf_locally(raw, filename, owner=None):
+    """Local-only fallback for store_pdf. Returns local_path, sha256, page_count and deduplicated."""
+    sha256 = hashlib.sha256(raw).hexdigest()
+    local_path = os.path.join(UPLOAD_DIR, f"{sha256}.pdf")
+    deduplicated = os.path.exists(local_path)
+    if not deduplicated:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        tmp_path = f"{local_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, local_path)
+    remember_alias(filename, sha256, local_path, owner)
+    page_count = known_page_count(sha256) or count_pdf_pages(raw)
+    remember_page_count(sha256, page_count)
+    return {"local_path": local_path, "sha256": sha256, "page_count": page_count, "deduplicated": deduplicated}
+
+
+def promote_blob(bucket_name, staging_name, sha256, filename, project_id=None, owner=None):
+    """
+    Move a streamed upload from its staging object to its content address.
+    The copy happens server-side and is skipped if the content already exists.
+    """
+    bucket = get_storage_client(project_id or PROJECT_ID).bucket(bucket_name)
+    staging = bucket.blob(staging_name)
+    target = bucket.blob(content_object_name(sha256))
+    with upstream("gcs", "exists"):
+        deduplicated = resilience.call("gcs", target.exists)
+    if not deduplicated:
+        with upstream("gcs", "rewrite"):
+            token, _, _ = resilience.call("gcs", target.rewrite, staging)
+            while token is not None:
+                token, _, _ = resilience.call("gcs", target.rewrite, staging, token=token)
+    with upstream("gcs", "delete"):
+        resilience.call("gcs", staging.delete)
+    gcs_uri = f"gs://{bucket_name}/{target.name}"
+    remember_alias(filename, sha256, gcs_uri, owner)
+    return {"gcs_uri": gcs_uri, "sha256": sha256, "deduplicated": deduplicated}
+
+
+def promote_local_file(path, sha256, filename, owner=None):
+    """Local counterpart of promote_blob for uploads that fell back to disk."""
+    local_path = os.path.join(UPLOAD_DIR, f"{sha256}.pdf")
+    deduplicated = os.path.exists(local_path)
+    if deduplicated:
+        os.remove(path)
+    else:
+        os.replace(path, local_path)
+    remember_alias(filename, sha256, local_path, owner)
+    return {"local_path": local_path, "sha256": sha256, "deduplicated": deduplicated}
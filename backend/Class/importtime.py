@@ -0,0 +1,59 @@
+import subprocess
+import sys
+
+
+def import_time_report(module, cwd=None):
+    """
+    Import module in a fresh interpreter with `-X importtime` and parse the timings.
+
+    Args:
+        module (str): Module to import, e.g. "mcp_app".
+        cwd (str, optional): Working directory for the child interpreter.
+
+    Returns:
+        dict: Contains:
+            - module: The module that was imported
+            - total_ms: Cumulative import time of the module itself
+            - imports: List of {"module", "self_ms", "cumulative_ms", "depth"},
+              slowest cumulative first
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        imports.append({
+            "module": stripped,
+            "self_ms": int(fields[0]) / 1000,
+            "cumulative_ms": int(fields[1]) / 1000,
+            "depth": (len(name) - len(stripped)) // 2,
+        })
+
+    total_ms = next((i["cumulative_ms"] for i in imports if i["module"] == module), 0.0)
+    imports.sort(key=lambda i: i["cumulative_ms"], reverse=True)
+    return {"module": module, "total_ms": total_ms, "imports": imports}
+
+
+def format_import_report(report, top=25):
+    """Render import_time_report output as a plain-text table."""
+    lines = [
+        f"Import time for {report['module']}: {report['total_ms']:.1f} ms",
+        f"{'cumulative ms':>14} {'self ms':>9}  module",
+    ]
+    for entry in report["imports"][:top]:
+        lines.append(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>9.1f}  {entry['module']}")
+    return "\n".join(lines)
@@ -0,0 +1,277 @@
+import contextvars
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from Class import tracing
+
+
+# Latency buckets in seconds; model calls and OCR of long PDFs run to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination. Label values are passed positionally."""
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (e.g. requests in flight)."""
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    """
+    Bucketed observations per label combination. Each series is one list
+    ([count per bucket..., +Inf count, sum]), updated in place.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._values.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Collected(_Metric):
+    """
+    Series computed at scrape time by fn() -> {label values tuple: value}, for
+    numbers other modules already keep (cache hits, session counts).
+    """
+
+    def __init__(self, name, help_text, labels, fn, kind="gauge"):
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        self._values = self.fn() or {}
+        return super().render()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+TOOL_REQUESTS = registry.register(Counter(
+    "mcp_tool_requests_total", "MCP tool calls.", ["tool"]))
+TOOL_ERRORS = registry.register(Counter(
+    "mcp_tool_errors_total", "MCP tool calls that raised or returned an error.", ["tool"]))
+TOOL_IN_FLIGHT = registry.register(Gauge(
+    "mcp_tool_in_flight", "MCP tool calls currently running.", ["tool"]))
+TOOL_SECONDS = registry.register(Histogram(
+    "mcp_tool_duration_seconds", "Wall-clock duration of MCP tool calls.", ["tool"]))
+TOOL_UPSTREAM_SECONDS = registry.register(Histogram(
+    "mcp_tool_upstream_seconds", "Part of each tool call spent waiting on Document AI, Gemini or GCS.", ["tool"]))
+TOOL_LOCAL_SECONDS = registry.register(Histogram(
+    "mcp_tool_local_seconds", "Part of each tool call spent in local work and queueing.", ["tool"]))
+UPSTREAM_SECONDS = registry.register(Histogram(
+    "upstream_request_duration_seconds", "Duration of calls to Google services.", ["service", "operation"]))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "upstream_errors_total", "Calls to Google services that raised.", ["service", "operation"]))
+UPSTREAM_RETRIES = registry.register(Counter(
+    "upstream_retries_total", "Calls to Google services retried after a transient error.", ["service"]))
+UPSTREAM_HEDGES = registry.register(Counter(
+    "upstream_hedges_total", "Hedged requests sent, and those that answered first.", ["service", "outcome"]))
+MODEL_TOKENS = registry.register(Counter(
+    "model_tokens_total", "Tokens reported in model usage metadata.", ["model", "kind"]))
+
+
+class _UpstreamClock:
+    """
+    Time during which at least one upstream call of a tool call was in flight.
+    Overlapping calls (OCR fan-out, batched precedents) count once, so
+    upstream + local adds up to the tool's wall-clock time.
+    """
+
+    __slots__ = ("active", "since", "seconds", "lock")
+
+    def __init__(self):
+        self.active = 0
+        self.since = 0.0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def enter(self, now):
+        with self.lock:
+            if self.active == 0:
+                self.since = now
+            self.active += 1
+
+    def exit(self, now):
+        with self.lock:
+            self.active -= 1
+            if self.active == 0:
+                self.seconds += now - self.since
+
+    def total(self, now):
+        with self.lock:
+            return self.seconds + (now - self.since if self.active else 0.0)
+
+
+_clock = contextvars.ContextVar("upstream_clock", default=None)
+
+
+@contextmanager
+def upstream(service, operation):
+    """
+    Time one call to a Google service ("documentai", "gemini", "gcs").
+
+    Works in threads and coroutines alike; inside a tool call (see track_tool)
+    the time also counts towards that tool's upstream share. The call is also
+    traced as a "<service>.<operation>" span, which is yielded (None when
+    tracing is off) so callers can add events.
+    """
+    clock = _clock.get()
+    start = time.perf_counter()
+    if clock is not None:
+        clock.enter(start)
+    try:
+        with tracing.span(f"{service}.{operation}", **{"upstream.service": service}) as active:
+            yield active
+    except BaseException:
+        UPSTREAM_ERRORS.inc(service, operation)
+        raise
+    finally:
+        end = time.perf_counter()
+        if clock is not None:
+            clock.exit(end)
+        UPSTREAM_SECONDS.observe(end - start, service, operation)
+
+
+@contextmanager
+def track_tool(tool):
+    """
+    Count and time one tool call, splitting its duration into upstream and local time.
+    Yields a one-item list; set it to True to count the call as an error without raising.
+    """
+    clock = _UpstreamClock()
+    token = _clock.set(clock)
+    failed = [False]
+    TOOL_REQUESTS.inc(tool)
+    TOOL_IN_FLIGHT.inc(tool)
+    start = time.perf_counter()
+    try:
+        yield failed
+    except BaseException:
+        failed[0] = True
+        raise
+    finally:
+        end = time.perf_counter()
+        _clock.reset(token)
+        TOOL_IN_FLIGHT.dec(tool)
+        if failed[0]:
+            TOOL_ERRORS.inc(tool)
+        elapsed = end - start
+        upstream_seconds = min(clock.total(end), elapsed)
+        TOOL_SECONDS.observe(elapsed, tool)
+        TOOL_UPSTREAM_SECONDS.observe(upstream_seconds, tool)
+        TOOL_LOCAL_SECONDS.observe(elapsed - upstream_seconds, tool)
+
+
+def record_usage(model, usage):
+    """Add the token counts of a response's usage_metadata (None is ignored)."""
+    if usage is None:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"),
+                        ("cached", "cached_content_token_count"), ("thoughts", "thoughts_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            MODEL_TOKENS.inc(model, kind, amount=count)
+
+
+def render():
+    return registry.render()
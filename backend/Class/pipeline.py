@@ -0,0 +1,282 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+import time
+
+from Class.clauses import iter_clauses
+from Class.concurrency import run_blocking, tool_concurrency
+from Class.Precedent import clause_key
+
+
+# Items buffered between stages; a full queue makes the stage before it wait
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+# Clauses per precedent lookup, and lookups in flight at once
+PIPELINE_PRECEDENT_BATCH = int(os.getenv("PIPELINE_PRECEDENT_BATCH", "10"))
+PIPELINE_PRECEDENT_CONCURRENCY = int(os.getenv("PIPELINE_PRECEDENT_CONCURRENCY", "4"))
+# Shorter clauses (titles, signature blocks) are not sent for precedents
+PIPELINE_MIN_CLAUSE_CHARS = int(os.getenv("PIPELINE_MIN_CLAUSE_CHARS", "80"))
+# OCR progress is reported every this many pages
+PIPELINE_PROGRESS_PAGES = int(os.getenv("PIPELINE_PROGRESS_PAGES", "10"))
+
+# How often a stage thread blocked on a queue checks whether the pipeline was abandoned
+PIPELINE_POLL_SECONDS = float(os.getenv("PIPELINE_POLL_SECONDS", "0.5"))
+
+_DONE = object()
+
+# A running pipeline holds an OCR and a segmentation thread for its whole run.
+# They get their own pool with room for every analyze_document slot, so pipelines
+# neither queue behind nor starve other blocking work (their own upload included).
+_stage_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=2 * tool_concurrency("analyze_document"), thread_name_prefix="pipeline-stage")
+
+
+class _Stopped(Exception):
+    """Raised in a stage thread once the pipeline has been cancelled or has failed."""
+
+
+def _wait(loop, coro, stop):
+    """Run a queue operation on the loop and wait for it, giving up once stop is set."""
+    if stop.is_set():
+        coro.close()
+        raise _Stopped()
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    while True:
+        try:
+            return future.result(PIPELINE_POLL_SECONDS)
+        except concurrent.futures.TimeoutError:
+            if stop.is_set():
+                future.cancel()
+                raise _Stopped() from None
+
+
+def _put(queue, loop, item, stop):
+    """Blocking put from a stage thread; waits while the queue is full (backpressure)."""
+    _wait(loop, queue.put(item), stop)
+
+
+def _close(queue, loop, stop):
+    """Tell the next stage there is nothing more, unless nobody is listening any more."""
+    try:
+        _put(queue, loop, _DONE, stop)
+    except _Stopped:
+        pass
+
+
+def _run_stage(loop, fn):
+    """Run a stage function on the stage pool, in a copy of the caller's context."""
+    return loop.run_in_executor(_stage_executor, functools.partial(contextvars.copy_context().run, fn))
+
+
+def _drain(queue, loop, stop):
+    """Blocking iterator over an asyncio.Queue, for a stage running in a thread."""
+    while True:
+        item = _wait(loop, queue.get(), stop)
+        if item is _DONE:
+            return
+        yield item
+
+
+async def analyze_document(gcs_uri=None, upload=None, *, iter_pages, find_precedents_batch=None,
+                           summarize=None, location="US", max_depth=None, progress=None):
+    """
+    Run upload -> OCR -> clause segmentation -> precedent lookups, plus a document
+    summary, as one pipeline.
+
+    Stages are connected by bounded queues, so OCR'd pages are segmented while
+    later pages are still being OCR'd, and precedent lookups start on the first
+    clauses. The summary runs alongside as soon as the document is uploaded.
+    A failing stage is recorded in "stages" and the rest keep what they have.
+
+    Args:
+        gcs_uri (str, optional): Document already in GCS.
+        upload (callable, optional): Blocking callable returning the gs:// URI,
+            used when gcs_uri is not given.
+        iter_pages (callable): Blocking generator function gcs_uri -> page dicts
+            (e.g. Class.OCR.iter_pdf_pages).
+        find_precedents_batch (callable, optional): async (clauses, location) ->
+            {clause_key: precedents}. None skips precedent lookups.
+        summarize (callable, optional): async gcs_uri -> summary text. None skips it.
+        location (str): Jurisdiction for precedent lookups.
+        max_depth (int, optional): Passed to iter_clauses.
+        progress (callable, optional): async callback receiving event dicts
+            ({"stage", "status", ...}).
+
+    Returns:
+        dict: gcs_uri, location, stages ({name: {"status", "seconds", "error"}}),
+              clauses (each with "precedents" when looked up), summary, total_pages
+    """
+    loop = asyncio.get_running_loop()
+    stage_names = ["upload", "ocr", "segment", "precedents", "summary"]
+    result = {
+        "gcs_uri": gcs_uri,
+        "location": location,
+        "stages": {name: {"status": "pending"} for name in stage_names},
+        "clauses": [],
+        "summary": None,
+        "total_pages": 0,
+    }
+    stages = result["stages"]
+    events = asyncio.Queue()
+    # Set when analyze_document exits, so stage threads blocked on a queue return
+    # instead of waiting forever for a consumer that was cancelled or failed
+    stop = threading.Event()
+
+    def emit(event):
+        # Safe from stage threads as well as the event loop
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def begin(name):
+        stages[name] = {"status": "running", "started": time.perf_counter()}
+        emit({"stage": name, "status": "running"})
+
+    def end(name, error=None):
+        stage = stages[name]
+        started = stage.pop("started")
+        stage.update(status="failed" if error else "done", seconds=round(time.perf_counter() - started, 3))
+        if error:
+            stage["error"] = error
+        emit({"stage": name, "status": stage["status"], **({"error": error} if error else {})})
+
+    def skip(name):
+        stages[name] = {"status": "skipped"}
+
+    async def report():
+        while True:
+            event = await events.get()
+            if event is _DONE:
+                return
+            if progress is not None:
+                try:
+                    await progress(event)
+                except Exception:
+                    pass
+
+    reporter = asyncio.create_task(report())
+    workers = []
+    try:
+        if gcs_uri:
+            skip("upload")
+        else:
+            begin("upload")
+            try:
+                gcs_uri = result["gcs_uri"] = await run_blocking(upload)
+                end("upload")
+            except Exception as e:
+                end("upload", str(e))
+                for name in stage_names[1:]:
+                    skip(name)
+                return result
+
+        pages_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        clauses_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+
+        def run_ocr():
+            begin("ocr")
+            try:
+                for page in iter_pages(gcs_uri):
+                    result["total_pages"] += 1
+                    if result["total_pages"] % PIPELINE_PROGRESS_PAGES == 0:
+                        emit({"stage": "ocr", "status": "running", "pages": result["total_pages"]})
+                    _put(pages_q, loop, page, stop)
+                end("ocr")
+            except _Stopped:
+                return
+            except Exception as e:
+                end("ocr", str(e))
+            _close(pages_q, loop, stop)
+
+        def run_segment():
+            begin("segment")
+            try:
+                for clause in iter_clauses(_drain(pages_q, loop, stop), max_depth=max_depth):
+                    result["clauses"].append(clause)
+                    _put(clauses_q, loop, clause, stop)
+                end("segment")
+            except _Stopped:
+                return
+            except Exception as e:
+                end("segment", str(e))
+                # Let OCR finish into the void rather than block on a full queue
+                try:
+                    for _ in _drain(pages_q, loop, stop):
+                        pass
+                except _Stopped:
+                    return
+            _close(clauses_q, loop, stop)
+
+        async def run_precedents():
+            if find_precedents_batch is None:
+                skip("precedents")
+                while await clauses_q.get() is not _DONE:
+                    pass
+                return
+            begin("precedents")
+            gate = asyncio.Semaphore(PIPELINE_PRECEDENT_CONCURRENCY)
+            tasks, errors = [], []
+
+            async def lookup(batch):
+                try:
+                    found = await find_precedents_batch([clause_key(c["text"]) for c in batch], location)
+                    for clause in batch:
+                        clause["precedents"] = found.get(clause_key(clause["text"]))
+                except Exception as e:
+                    errors.append(str(e))
+                    for clause in batch:
+                        clause["precedents_error"] = str(e)
+                finally:
+                    gate.release()
+                emit({"stage": "precedents", "status": "running",
+                      "clauses": [c["clause_id"] for c in batch]})
+
+            async def flush(batch):
+                # Waiting for a free slot here stops us reading clauses_q, which backs up segmentation
+                await gate.acquire()
+                tasks.append(asyncio.create_task(lookup(batch)))
+
+            batch = []
+            try:
+                while (clause := await clauses_q.get()) is not _DONE:
+                    if len(clause["text"]) < PIPELINE_MIN_CLAUSE_CHARS:
+                        continue
+                    batch.append(clause)
+                    if len(batch) >= PIPELINE_PRECEDENT_BATCH:
+                        await flush(batch)
+                        batch = []
+                if batch:
+                    await flush(batch)
+                await asyncio.gather(*tasks)
+            finally:
+                # Lookups still in flight when the pipeline is cancelled go with it
+                for task in tasks:
+                    task.cancel()
+            end("precedents", "; ".join(dict.fromkeys(errors)) or None)
+
+        async def run_summary():
+            if summarize is None:
+                skip("summary")
+                return
+            begin("summary")
+            try:
+                result["summary"] = await summarize(gcs_uri)
+                end("summary")
+            except Exception as e:
+                end("summary", str(e))
+
+        workers = [
+            _run_stage(loop, run_ocr),
+            _run_stage(loop, run_segment),
+            asyncio.ensure_future(run_precedents()),
+            asyncio.ensure_future(run_summary()),
+        ]
+        await asyncio.gather(*workers)
+        return result
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.cancel()
+        # call_soon queues behind events the stage threads have already scheduled
+        loop.call_soon(events.put_nowait, _DONE)
+        await reporter
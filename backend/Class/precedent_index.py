@@ -0,0 +1,389 @@
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import sys
+import threading
+from array import array
+from collections import Counter
+
+from Class.answer_cache import normalize
+from Class.Precedent import MAX_RECORDS, PrecedentRecord, format_precedent_records
+from Class.prompts import normalize_jurisdiction
+from Class.retrieval import embed_texts, tokenize
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Local knowledge base of precedents, consulted before the model.
+# PRECEDENT_INDEX=off disables lookups and seeding.
+PRECEDENT_INDEX = os.getenv("PRECEDENT_INDEX", "on").lower()
+PRECEDENT_INDEX_DIR = os.getenv("PRECEDENT_INDEX_DIR", os.path.join("cache", "precedent_index"))
+# A clause is answered from the index when it was indexed before word for word
+# (after normalization), or when an entry's embedding cosine (0..1) is at least
+# this. Lexical scores only pick candidates: bag-of-words overlap cannot tell
+# "the landlord may terminate" from "the landlord may not terminate".
+PRECEDENT_INDEX_MIN_SCORE = float(os.getenv("PRECEDENT_INDEX_MIN_SCORE", "0.85"))
+# Set PRECEDENT_INDEX_EMBEDDINGS=1 to embed entries (Vertex text embeddings) as well
+PRECEDENT_INDEX_EMBEDDINGS = os.getenv("PRECEDENT_INDEX_EMBEDDINGS", "0") == "1"
+# Lexical candidates scored per query
+PRECEDENT_INDEX_CANDIDATES = int(os.getenv("PRECEDENT_INDEX_CANDIDATES", "50"))
+
+ENTRIES_FILE = "entries.jsonl"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+
+
+class PrecedentIndex:
+    """
+    Precedents keyed by the clause (or case summary) they answer, searchable by
+    an inverted index over clause tokens and, optionally, by embedding.
+
+    On disk (`path`) an index is:
+        entries.jsonl  one {"text", "scope", "records", "source"} per line
+        vectors.f32    float32 rows, one per entry, normalized; memory-mapped
+        meta.json      {"dim", "model"} of the vectors
+
+    Entries are append-only, so the files can be copied between instances or
+    baked into an image. path=None keeps everything in memory.
+
+    Args:
+        path (str, optional): Index directory.
+        embed_fn (callable, optional): texts -> vectors. None means lexical only.
+        model (str): Name recorded for the vectors; a mismatch on load drops them.
+    """
+
+    def __init__(self, path=None, embed_fn=None, model=""):
+        self.path = path
+        self.embed_fn = embed_fn
+        self.model = model
+        self.entries = []
+        self._keys = {}  # (scope, normalized text) -> entry id
+        self._postings = {}  # scope -> {token: [entry id, ...]}
+        self._scope_ids = {}  # scope -> [entry id, ...]
+        self._token_counts = []
+        self.dim = None
+        self._rows = array("f")  # in-memory vectors (path=None) and vectors added since the last remap
+        self._mapped = None
+        self._mapped_rows = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    # ---- loading and persistence ----
+
+    def _load(self):
+        entries_path = os.path.join(self.path, ENTRIES_FILE)
+        if os.path.exists(entries_path):
+            with open(entries_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        meta_path = os.path.join(self.path, META_FILE)
+        if self.embed_fn is None or not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model:
+            return
+        self.dim = meta["dim"]
+        self._remap()
+
+    def _remap(self):
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped, self._mapped_rows = None, 0
+        if not os.path.exists(vectors_path) or not os.path.getsize(vectors_path):
+            return
+        with open(vectors_path, "rb") as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapped_rows = len(self._mapped) // (4 * self.dim)
+        self._rows = array("f")
+
+    def _append_files(self, entries, vectors):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ENTRIES_FILE), "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        if vectors:
+            with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "model": self.model}, f)
+            with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                for vector in vectors:
+                    vector.tofile(f)
+
+    def close(self):
+        with self._lock:
+            if self._mapped is not None:
+                self._mapped.close()
+                self._mapped, self._mapped_rows = None, 0
+
+    # ---- building ----
+
+    def _index(self, entry):
+        entry_id = len(self.entries)
+        self.entries.append(entry)
+        self._keys[(entry["scope"], normalize(entry["text"]))] = entry_id
+        counts = Counter(tokenize(entry["text"]))
+        self._token_counts.append(len(counts))
+        self._scope_ids.setdefault(entry["scope"], []).append(entry_id)
+        postings = self._postings.setdefault(entry["scope"], {})
+        for token in counts:
+            postings.setdefault(token, []).append(entry_id)
+
+    def _vector(self, values):
+        norm = math.sqrt(sum(x * x for x in values)) or 1.0
+        return array("f", (x / norm for x in values))
+
+    def add(self, items, source="result"):
+        """
+        Add entries, skipping any already indexed for the same scope and text.
+
+        Args:
+            items (iterable): Dicts with "text" (the clause), "location" or
+                "scope", and "records" (precedent dicts; invalid ones are dropped).
+            source (str): Provenance stored with each entry ("result", "import", ...).
+
+        Returns:
+            int: Number of entries added.
+        """
+        new = []
+        with self._lock:
+            seen = set(self._keys)
+            for item in items:
+                text = " ".join((item.get("text") or "").split())
+                scope = item.get("scope") or normalize_jurisdiction(item.get("location"))
+                records = [r for r in map(PrecedentRecord.from_dict, item.get("records") or []) if r is not None]
+                key = (scope, normalize(text))
+                if not text or not records or key in seen:
+                    continue
+                seen.add(key)
+                new.append({"text": text, "scope": scope, "records": [r.to_dict() for r in records],
+                            "source": item.get("source", source)})
+        if not new:
+            return 0
+        # Rows line up with entries only while every entry has a vector, so an
+        # index started lexical-only stays that way
+        embed = self.embed_fn is not None and self.vector_rows() == len(self.entries)
+        # Embedding is a network call; don't hold the lock for it
+        vectors = [self._vector(v) for v in self.embed_fn([e["text"] for e in new])] if embed else [None] * len(new)
+        with self._lock:
+            pairs = [(e, v) for e, v in zip(new, vectors) if (e["scope"], normalize(e["text"])) not in self._keys]
+            new = [e for e, _ in pairs]
+            vectors = [v for _, v in pairs if v is not None]
+            if self.vector_rows() != len(self.entries):
+                vectors = []  # another add went in lexical-only meanwhile
+            if vectors:
+                self.dim = self.dim or len(vectors[0])
+            if self.path:
+                self._append_files(new, vectors)
+            for entry in new:
+                self._index(entry)
+            for vector in vectors:
+                self._rows.extend(vector)
+            if self.path and vectors:
+                self._remap()
+        return len(new)
+
+    def vector_rows(self):
+        return (self._mapped_rows + len(self._rows) // self.dim) if self.dim else 0
+
+    # ---- searching ----
+
+    def _row_scores(self, entry_ids, query):
+        """Cosine scores of the query vector against the given entries."""
+        if self.dim is None or len(query) != self.dim:
+            return {}
+        total_rows = self.vector_rows()
+        entry_ids = [i for i in entry_ids if i < total_rows]
+        if numpy is not None and self._mapped is not None:
+            matrix = numpy.frombuffer(self._mapped, dtype=numpy.float32).reshape(-1, self.dim)
+            mapped = [i for i in entry_ids if i < self._mapped_rows]
+            scores = dict(zip(mapped, (matrix[mapped] @ numpy.asarray(query, dtype=numpy.float32)).tolist()))
+            entry_ids = [i for i in entry_ids if i >= self._mapped_rows]
+        else:
+            scores = {}
+        mapped_view = memoryview(self._mapped).cast("f") if self._mapped is not None else None
+        try:
+            for i in entry_ids:
+                if i < self._mapped_rows:
+                    row = mapped_view[i * self.dim:(i + 1) * self.dim]
+                else:
+                    start = (i - self._mapped_rows) * self.dim
+                    row = self._rows[start:start + self.dim]
+                scores[i] = sum(a * b for a, b in zip(row, query))
+        finally:
+            if mapped_view is not None:
+                mapped_view.release()
+        return scores
+
+    def search(self, text, location="US", k=5):
+        """
+        Best-matching entries for a clause within one jurisdiction.
+
+        Returns:
+            list: Dicts with "score" (max of the lexical and vector cosine),
+                  "lexical", "vector" and "entry", best first.
+        """
+        scope = normalize_jurisdiction(location)
+        tokens = set(tokenize(text))
+        query = None
+        if self.embed_fn is not None and self.dim is not None and scope in self._postings:
+            query = self._vector(self.embed_fn([text])[0])
+        with self._lock:
+            postings = self._postings.get(scope, {})
+            overlap = Counter()
+            for token in tokens:
+                overlap.update(postings.get(token, ()))
+            lexical = {
+                i: n / math.sqrt(len(tokens) * self._token_counts[i])
+                for i, n in overlap.most_common(PRECEDENT_INDEX_CANDIDATES)
+            }
+            vector = {}
+            if query is not None:
+                vector = self._row_scores(self._scope_ids[scope], query)
+            scores = {i: max(lexical.get(i, 0.0), vector.get(i, 0.0)) for i in lexical.keys() | vector.keys()}
+            best = heapq.nlargest(k, scores, key=scores.get)
+            return [
+                {"score": scores[i], "lexical": round(lexical.get(i, 0.0), 4),
+                 "vector": round(vector.get(i, 0.0), 4), "entry": self.entries[i]}
+                for i in best
+            ]
+
+    def lookup(self, text, location="US", min_score=None):
+        """
+        Precedents for a clause if the index is confident enough, else None.
+
+        Confident means an entry with the same normalized text, or (with
+        embeddings) an embedding cosine of at least min_score. Records of every
+        such entry are merged (exact match first, then best vector score,
+        duplicate cases once).
+
+        Returns:
+            dict: {"records", "precedents" (markdown), "score", "matched_text"} or None
+        """
+        min_score = PRECEDENT_INDEX_MIN_SCORE if min_score is None else min_score
+        # (score, entry) pairs; the lexical score alone never counts as a match
+        matches = [(hit["vector"], hit["entry"]) for hit in self.search(text, location) if hit["vector"] >= min_score]
+        matches.sort(key=lambda match: match[0], reverse=True)
+        with self._lock:
+            exact = self._keys.get((normalize_jurisdiction(location), normalize(text)))
+            if exact is not None:
+                entry = self.entries[exact]
+                matches = [(1.0, entry)] + [match for match in matches if match[1] is not entry]
+            if not matches:
+                self.misses += 1
+                return None
+            self.hits += 1
+        records = {}
+        for _, entry in matches:
+            for record in map(PrecedentRecord.from_dict, entry["records"]):
+                if record is not None:
+                    records.setdefault(record.key(), record)
+        records = list(records.values())[:MAX_RECORDS]
+        return {
+            "records": [record.to_dict() for record in records],
+            "precedents": format_precedent_records(records, location),
+            "score": round(matches[0][0], 4),
+            "matched_text": matches[0][1]["text"],
+        }
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": len(self.entries),
+                "scopes": {scope: len(ids) for scope, ids in self._scope_ids.items()},
+                "vectors": self.vector_rows(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_precedent_index():
+    """The shared on-disk index, loaded on first use; None when PRECEDENT_INDEX is off."""
+    global _index
+    if PRECEDENT_INDEX == "off":
+        return None
+    with _index_lock:
+        if _index is None:
+            from Class.retrieval import EMBEDDING_MODEL
+            _index = PrecedentIndex(
+                PRECEDENT_INDEX_DIR,
+                embed_fn=embed_texts if PRECEDENT_INDEX_EMBEDDINGS else None,
+                model=EMBEDDING_MODEL if PRECEDENT_INDEX_EMBEDDINGS else "",
+            )
+        return _index
+
+
+def precedent_index_stats():
+    """Stats for the shared index, or None if it has not been loaded."""
+    return _index.stats() if _index is not None else None
+
+
+def read_dataset(path):
+    """
+    Items for PrecedentIndex.add from a JSONL file.
+
+    Each line is either a past result, {"clause", "location", "records": [...]},
+    or a single case, {"case_name", "citation", "year", "court", "relevance",
+    "principle", "location"}, indexed under its principle and relevance.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "records" in item:
+                yield {"text": item.get("clause") or item.get("text"), "location": item.get("location"),
+                       "records": item["records"]}
+            else:
+                yield {"text": f"{item.get('principle', '')} {item.get('relevance', '')}",
+                       "location": item.get("location") or item.get("jurisdiction"), "records": [item]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load and query the local precedent index.")
+    parser.add_argument("--dir", default=PRECEDENT_INDEX_DIR, help="index directory")
+    parser.add_argument("--embeddings", action="store_true", default=PRECEDENT_INDEX_EMBEDDINGS,
+                        help="embed entries with Vertex text embeddings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="add a JSONL dataset of cases or past results")
+    load.add_argument("files", nargs="+")
+    query = commands.add_parser("query", help="show the best matches for a clause")
+    query.add_argument("clause")
+    query.add_argument("--location", default="US")
+    commands.add_parser("stats", help="print index statistics")
+    args = parser.parse_args(argv)
+
+    from Class.retrieval import EMBEDDING_MODEL
+    index = PrecedentIndex(args.dir, embed_fn=embed_texts if args.embeddings else None,
+                           model=EMBEDDING_MODEL if args.embeddings else "")
+    if args.command == "load":
+        for path in args.files:
+            added = index.add(read_dataset(path), source=f"import:{os.path.basename(path)}")
+            print(f"{path}: {added} entries added")
+    elif args.command == "query":
+        for hit in index.search(args.clause, args.location):
+            names = ", ".join(r["case_name"] for r in hit["entry"]["records"])
+            print(f"{hit['score']:.3f}  (lexical {hit['lexical']:.3f}, vector {hit['vector']:.3f})  {names}")
+    print(json.dumps(index.stats(), indent=2))
+    index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
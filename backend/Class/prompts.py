@@ -0,0 +1,183 @@
+import functools
+import re
+from string import Template
+
+
+# ---- Jurisdictions ----
+
+US_STATES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana",
+    "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana", "NE": "Nebraska", "NV": "Nevada",
+    "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma", "OR": "Oregon",
+    "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+}
+
+# Spellings of the non-state jurisdictions, already lowercased and stripped of punctuation
+ALIASES = {
+    "us": "US", "usa": "US", "u s": "US", "u s a": "US", "united states": "US",
+    "united states of america": "US", "america": "US", "federal": "US", "us federal": "US",
+    "india": "IN", "in": "IN", "bharat": "IN",
+    "uk": "UK", "u k": "UK", "gb": "UK", "united kingdom": "UK", "great britain": "UK", "britain": "UK",
+    "england": "UK", "england and wales": "UK", "england wales": "UK",
+    "eu": "EU", "e u": "EU", "european union": "EU", "europe": "EU",
+}
+ALIASES.update({name.lower(): f"US-{code}" for code, name in US_STATES.items()})
+ALIASES.update({f"{name.lower()} {suffix}": f"US-{code}" for code, name in US_STATES.items()
+                for suffix in ("state", "us", "usa")})
+ALIASES.update({f"us {code.lower()}": f"US-{code}" for code in US_STATES})
+# Bare two-letter codes are ambiguous ("IN" is India here, not Indiana), so only
+# these common ones are taken as states; "US-XX" always works
+ALIASES.update({code.lower(): f"US-{code}" for code in ("CA", "NY", "TX", "FL", "WA", "NJ", "MA", "IL")})
+
+NAMES = {"US": "United States (federal)", "IN": "India", "UK": "United Kingdom", "EU": "European Union",
+         **{f"US-{code}": f"{name}, United States" for code, name in US_STATES.items()}}
+
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_jurisdiction(location):
+    """
+    Canonical code for a jurisdiction string, so differently written locations
+    share prompts and cache keys: "california", "CA" and "US-CA" -> "US-CA",
+    "usa" -> "US", "England and Wales" -> "UK". Unknown places are kept, with
+    whitespace collapsed; an empty location is "US".
+    """
+    cleaned = " ".join((location or "").split())
+    if not cleaned:
+        return "US"
+    key = " ".join(_SEPARATORS.sub(" ", cleaned.lower()).split())
+    return ALIASES.get(key, cleaned)
+
+
+def jurisdiction_class(code):
+    """Template family for a normalized code: us_state, us_federal, india, uk, eu or other."""
+    if code.startswith("US-"):
+        return "us_state"
+    return {"US": "us_federal", "IN": "india", "UK": "uk", "EU": "eu"}.get(code, "other")
+
+
+def jurisdiction_name(code):
+    """Readable name of a normalized code, for prompts."""
+    return NAMES.get(code, code)
+
+
+# ---- Templates ----
+
+_INTRO = """You are a highly precise legal research assistant with expertise in case law and legal precedents.
+
+Given the clause below, identify the most relevant and authoritative legal precedents from the specified jurisdiction.
+
+INSTRUCTIONS:
+- Only include precedents that are directly relevant to the legal principles in the clause
+- Prioritize landmark cases and frequently cited precedents
+- Exclude cases that are merely tangentially related
+"""
+
+GUIDANCE = {
+    "us_state": """- Prioritize decisions of the state's own courts (supreme court, then courts of appeal)
+- Also include U.S. Supreme Court and federal precedents where they govern or are routinely applied in that state
+- Say when a state has codified or departed from the common-law rule""",
+    "us_federal": """- Focus on the U.S. Supreme Court and the federal courts of appeals
+- Where the question is governed by state law, cite the most influential state decisions and say which state
+- Note circuit splits where they exist""",
+    "india": """- Focus on the Supreme Court of India, then the High Courts
+- Refer to the governing statute (e.g. the Indian Contract Act, 1872) where a precedent interprets it
+- Prefer reported citations (SCC, AIR) where available""",
+    "uk": """- Focus on the UK Supreme Court, the House of Lords and the Court of Appeal of England and Wales
+- Note where Scots law or Northern Irish law differs on the point
+- Use neutral citations where available""",
+    "eu": """- Focus on the Court of Justice of the European Union and the General Court
+- Include leading national court decisions applying the relevant EU law where helpful
+- Use ECLI or case numbers (e.g. C-xxx/yy) where available""",
+    "other": """- If the location is a specific state or province, prioritize its own courts but also include relevant national precedents
+- If the location is a country, include the most significant national and high court precedents""",
+}
+
+OUTPUT_FORMATS = {
+    "text": """For each precedent, provide:
+1. **Case Name** (with official citation if available)
+2. **Year** of decision
+3. **Court/Jurisdiction** (specify court level and jurisdiction)
+4. **Relevance** (2-3 sentences explaining the direct connection to the clause)
+5. **Key Principle** (the specific legal principle established)
+
+Format your response as a numbered list with clear sections for each precedent.""",
+    "structured": """For each precedent, fill in case_name (without citation), citation (official citation, or empty),
+year of decision, court (court level and jurisdiction), relevance (2-3 sentences explaining the direct
+connection to the clause) and principle (the specific legal principle established).""",
+    "batch": """There are several numbered clauses below; answer EACH of them, following the same rules for every clause.
+For each precedent give the Case Name (with citation if available), Year, Court/Jurisdiction,
+Relevance (2-3 sentences) and Key Principle, as a numbered markdown list.
+
+Return a JSON array with one object per clause: {"clause_id": <number>, "precedents": "<markdown list>"}.""",
+}
+
+# Everything that varies per call goes after the prefix, so requests for one
+# jurisdiction class and mode share their leading tokens
+SUFFIXES = {
+    "text": '**Target Jurisdiction:** $jurisdiction\n\n**Legal Clause to Analyze:**\n"$clause"\n',
+    "structured": '**Target Jurisdiction:** $jurisdiction\n\n**Legal Clause to Analyze:**\n"$clause"\n',
+    "batch": "**Target Jurisdiction:** $jurisdiction\n\n$clauses\n",
+}
+FIELDS = {"text": {"jurisdiction", "clause"}, "structured": {"jurisdiction", "clause"},
+          "batch": {"jurisdiction", "clauses"}}
+
+
+class PromptTemplate:
+    """A fixed prefix plus a string.Template suffix holding the per-call fields."""
+
+    __slots__ = ("name", "prefix", "suffix", "fields")
+
+    def __init__(self, name, prefix, suffix, fields):
+        self.name = name
+        self.prefix = prefix
+        self.suffix = Template(suffix)
+        self.fields = frozenset(fields)
+        self.validate()
+
+    def validate(self):
+        """Raise ValueError if the template is malformed or its placeholders don't match fields."""
+        if not self.suffix.is_valid():
+            raise ValueError(f"Prompt template {self.name}: invalid placeholder in suffix")
+        found = set(self.suffix.get_identifiers())
+        if found != self.fields:
+            raise ValueError(f"Prompt template {self.name}: placeholders {sorted(found)}, expected {sorted(self.fields)}")
+        if "$" in self.prefix:
+            raise ValueError(f"Prompt template {self.name}: the prefix must not contain placeholders")
+
+    def render(self, **values):
+        return self.prefix + self.suffix.substitute(values)
+
+
+def _build_templates():
+    templates = {}
+    for family, guidance in GUIDANCE.items():
+        for mode, output_format in OUTPUT_FORMATS.items():
+            prefix = f"{_INTRO}{guidance}\n\n{output_format}\n\n"
+            templates[(family, mode)] = PromptTemplate(f"{family}/{mode}", prefix, SUFFIXES[mode], FIELDS[mode])
+    return templates
+
+
+# Built and validated once, at import
+TEMPLATES = _build_templates()
+
+
+def get_template(location, mode="text"):
+    """The template for a jurisdiction string and mode ("text", "structured" or "batch")."""
+    return TEMPLATES[(jurisdiction_class(normalize_jurisdiction(location)), mode)]
+
+
+def render_precedent_prompt(location, mode="text", **values):
+    """Render the precedent prompt for location; values are the template's fields except jurisdiction."""
+    code = normalize_jurisdiction(location)
+    template = TEMPLATES[(jurisdiction_class(code), mode)]
+    name = jurisdiction_name(code)
+    return template.render(jurisdiction=name if name == code else f"{name} ({code})", **values)
@@ -0,0 +1,463 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from Class import metrics, tracing
+
+
+# Shared protection for calls to Google services ("gemini", "documentai", "gcs"):
+# a token-bucket rate limiter, retries with exponential backoff and full jitter
+# that give up before the call's deadline, and a circuit breaker, per service.
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+# Consecutive retryable failures that open a service's circuit, and how long it
+# stays open before one trial call is let through
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Per service: RATE_LIMIT_<SERVICE>="<requests per second>[/<burst>]" (unset or 0:
+# no limit) and DEADLINE_SECONDS_<SERVICE>, the time budget of one call including
+# retries and waiting for the limiter
+DEFAULT_DEADLINES = {"gemini": 120.0, "documentai": 600.0, "gcs": 120.0}
+# Overall budget of one MCP tool call (0: none); upstream calls made for the tool
+# stop retrying or waiting once it is spent
+TOOL_DEADLINE_SECONDS = float(os.getenv("TOOL_DEADLINE_SECONDS", "0"))
+
+# HTTP statuses worth retrying: rate limited, or a transient server-side failure
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Statuses that mean the request was turned away before it ran, the only failures
+# retried for calls that must not run twice (see create)
+REJECTED_STATUS = {429}
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+_END = object()
+
+
+class UpstreamUnavailable(RuntimeError):
+    """A call was not attempted: the circuit is open or the deadline left no time to wait for the limiter."""
+
+
+def _status(error):
+    """HTTP status of a google-api-core or google-genai error, else None."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    code = getattr(error, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error):
+    if _status(error) in RETRYABLE_STATUS:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    try:
+        import requests
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    except ImportError:
+        return False
+
+
+def backoff(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Full-jitter delay before retry number `attempt` (1 = first retry)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """
+    `rate` requests per second on average, up to `burst` at once. rate <= 0
+    means unlimited. Callers wait (blocking or async) until a token is free.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, float(burst if burst is not None else max(rate, 1)))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waited_seconds = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, going into debt if none is free; returns the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.throttled += 1
+                self.waited_seconds += wait
+            return wait
+
+    def cancel(self, wait=0.0):
+        """Give back a token reserved (with the given wait) that will not be used."""
+        if self.rate > 0:
+            with self._lock:
+                self.tokens = min(self.burst, self.tokens + 1)
+                if wait:
+                    self.throttled -= 1
+                    self.waited_seconds -= wait
+
+    def has_capacity(self):
+        """Whether a token is free now, i.e. a call would not have to wait."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens >= 1
+
+    def stats(self):
+        with self._lock:
+            if self.rate <= 0:
+                return {"rate": None, "burst": None, "tokens": None, "throttled": 0, "waited_seconds": 0.0}
+            self._refill(time.monotonic())
+            return {"rate": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2),
+                    "throttled": self.throttled, "waited_seconds": round(self.waited_seconds, 3)}
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After `threshold` consecutive retryable failures it
+    opens and calls fail fast for `reset_seconds`; then it is half-open and lets
+    one trial call through, which closes it on success or reopens it on failure.
+    """
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now (claims the trial call when half-open)."""
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and 0 < self.threshold <= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opened += 1
+            self._trial = False
+
+    def release(self):
+        """Hand back a half-open trial that ended without a verdict (e.g. a client error)."""
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened}
+
+
+def _parse_rate(value):
+    rate, _, burst = (value or "").partition("/")
+    return float(rate or 0), (float(burst) if burst else None)
+
+
+class Upstream:
+    """Limiter, breaker, deadline and counters of one service."""
+
+    def __init__(self, name):
+        self.name = name
+        rate, burst = _parse_rate(os.getenv(f"RATE_LIMIT_{name.upper()}"))
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.deadline_seconds = float(os.getenv(f"DEADLINE_SECONDS_{name.upper()}", DEFAULT_DEADLINES.get(name, 120.0)))
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def stats(self):
+        return {"limiter": self.limiter.stats(), "breaker": self.breaker.stats(),
+                "deadline_seconds": self.deadline_seconds, "retries": self.retries,
+                "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name):
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.setdefault(name, Upstream(name))
+    return upstream
+
+
+def resilience_stats():
+    """Limiter, breaker and retry/hedge counters per service used so far."""
+    return {name: upstream.stats() for name, upstream in list(_upstreams.items())}
+
+
+@contextmanager
+def deadline(seconds):
+    """Calls in the block must finish within `seconds` (nested deadlines keep the earlier one)."""
+    if not seconds:
+        yield
+        return
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(min(end, outer) if outer is not None else end)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _call_deadline(upstream):
+    end = time.monotonic() + upstream.deadline_seconds
+    outer = _deadline.get()
+    return min(end, outer) if outer is not None else end
+
+
+def _admit(upstream, end):
+    """Check the breaker and reserve a limiter token; returns the seconds to wait first."""
+    if not upstream.breaker.allow():
+        raise UpstreamUnavailable(
+            f"{upstream.name} is unavailable after repeated failures; retry in {upstream.breaker.retry_in():.1f}s")
+    wait = upstream.limiter.reserve()
+    if time.monotonic() + wait > end:
+        upstream.limiter.cancel(wait)
+        upstream.breaker.release()
+        raise UpstreamUnavailable(f"{upstream.name} rate limit: no capacity before the deadline")
+    return wait
+
+
+def _after_failure(upstream, error, attempt, end, idempotent=True):
+    """Record a failed attempt; returns the delay before retrying, or None to give up."""
+    if not is_retryable(error):
+        upstream.breaker.release()
+        return None
+    upstream.breaker.failure()
+    if not idempotent and _status(error) not in REJECTED_STATUS:
+        return None
+    if attempt >= RETRY_MAX_ATTEMPTS:
+        return None
+    delay = backoff(attempt)
+    if time.monotonic() + delay >= end:
+        return None
+    upstream.retries += 1
+    metrics.UPSTREAM_RETRIES.inc(upstream.name)
+    active = tracing.current_span()
+    if active is not None:
+        active.add_event("retry", {"attempt": attempt, "delay_ms": round(delay * 1000, 1),
+                                   "error": f"{type(error).__name__}: {error}"[:200]})
+    return delay
+
+
+async def _until(awaitable, end, service):
+    """Await with the time left before `end`; running out raises a (retryable) TimeoutError."""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0.001, end - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{service} did not answer before the deadline") from None
+
+
+def call(service, fn, *args, **kwargs):
+    """Call fn(*args, **kwargs) (blocking) with the service's limiter, retries and breaker."""
+    return _call(service, fn, args, kwargs, idempotent=True)
+
+
+def create(service, fn, *args, **kwargs):
+    """
+    Like call, for requests that start billed work or create a resource. A timeout,
+    dropped connection or server error may come after the request took effect, so
+    only a rejection (429) is retried; anything else is raised to the caller.
+    """
+    return _call(service, fn, args, kwargs, idempotent=False)
+
+
+def _call(service, fn, args, kwargs, idempotent):
+    upstream = get_upstream(service)
+    end = _call_deadline(upstream)
+    attempt = 0
+    while True:
+        attempt += 1
+        wait = _admit(upstream, end)
+        if wait:
+            time.sleep(wait)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            delay = _after_failure(upstream, e, attempt, end, idempotent)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        upstream.breaker.success()
+        return result
+
+
+async def acall(service, fn, *args, **kwargs):
+    """Async counterpart of call for a coroutine function; an attempt is cut off at the deadline."""
+    upstream = get_upstream(service)
+    end = _call_deadline(upstream)
+    attempt = 0
+    while True:
+        attempt += 1
+        wait = _admit(upstream, end)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            result = await _until(fn(*args, **kwargs), end, service)
+        except Exception as e:
+            delay = _after_failure(upstream, e, attempt, end)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        upstream.breaker.success()
+        return result
+
+
+def stream(service, fn, *args, **kwargs):
+    """
+    Iterate fn(*args, **kwargs), a streaming call. Opening the stream and its first
+    chunk are retried; once chunks have been handed out, errors propagate.
+    """
+    upstream = get_upstream(service)
+    end = _call_deadline(upstream)
+    attempt = 0
+    while True:
+        attempt += 1
+        wait = _admit(upstream, end)
+        if wait:
+            time.sleep(wait)
+        try:
+            iterator = iter(fn(*args, **kwargs))
+            first = next(iterator, _END)
+        except Exception as e:
+            delay = _after_failure(upstream, e, attempt, end)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        upstream.breaker.success()
+        break
+    if first is _END:
+        return
+    yield first
+    yield from iterator
+
+
+async def astream(service, fn, *args, **kwargs):
+    """Async counterpart of stream, for a coroutine returning an async iterator."""
+    upstream = get_upstream(service)
+    end = _call_deadline(upstream)
+    attempt = 0
+    while True:
+        attempt += 1
+        wait = _admit(upstream, end)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            async def open_stream():
+                iterator = (await fn(*args, **kwargs)).__aiter__()
+                try:
+                    return iterator, await iterator.__anext__()
+                except StopAsyncIteration:
+                    return iterator, _END
+            iterator, first = await _until(open_stream(), end, service)
+        except Exception as e:
+            delay = _after_failure(upstream, e, attempt, end)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        upstream.breaker.success()
+        break
+    if first is _END:
+        return
+    yield first
+    async for chunk in iterator:
+        yield chunk
+
+
+async def hedged(service, fn, *args, hedge_after=0.0, **kwargs):
+    """
+    acall, plus a second identical request if the first has not answered after
+    `hedge_after` seconds; the first success wins and the other is cancelled.
+    The hedge is only sent if the limiter has a token free and the circuit is
+    closed, so hedging never adds to throttling or to an outage.
+    """
+    if hedge_after <= 0:
+        return await acall(service, fn, *args, **kwargs)
+    upstream = get_upstream(service)
+    primary = asyncio.ensure_future(acall(service, fn, *args, **kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done or upstream.breaker.state != "closed" or not upstream.limiter.has_capacity():
+        return await primary
+    upstream.hedges += 1
+    metrics.UPSTREAM_HEDGES.inc(service, "sent")
+    hedge = asyncio.ensure_future(acall(service, fn, *args, **kwargs))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        upstream.hedge_wins += 1
+                        metrics.UPSTREAM_HEDGES.inc(service, "won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+metrics.registry.register(metrics.Collected(
+    "upstream_circuit_state", "Circuit breaker per service: 0 closed, 1 half-open, 2 open.", ["service"],
+    lambda: {(name, ): _STATES[u.breaker.state] for name, u in list(_upstreams.items())}))
+metrics.registry.register(metrics.Collected(
+    "upstream_rate_limit_tokens", "Tokens left in the service's rate limiter.", ["service"],
+    lambda: {(name, ): u.limiter.stats()["tokens"] for name, u in list(_upstreams.items()) if u.limiter.rate > 0}))
+metrics.registry.register(metrics.Collected(
+    "upstream_throttled_seconds_total", "Time calls waited for the service's rate limiter.", ["service"],
+    lambda: {(name, ): u.limiter.waited_seconds for name, u in list(_upstreams.items())}, kind="counter"))
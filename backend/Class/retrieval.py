@@ -0,0 +1,254 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+
+# Chunking and retrieval settings
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200"))
+CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+MAX_INDEXES = int(os.getenv("RETRIEVAL_MAX_INDEXES", "64"))
+# Set RETRIEVAL_EMBEDDINGS=1 to add embedding search (Vertex text embeddings) to BM25
+USE_EMBEDDINGS = os.getenv("RETRIEVAL_EMBEDDINGS", "0") == "1"
+EMBEDDING_MODEL = os.getenv("RETRIEVAL_EMBEDDING_MODEL", "text-embedding-005")
+# One embed_content request carries at most this many texts / estimated tokens
+# (the API rejects requests over its per-request instance and token limits)
+EMBEDDING_BATCH_SIZE = int(os.getenv("RETRIEVAL_EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("RETRIEVAL_EMBEDDING_BATCH_TOKENS", "15000"))
+
+# Gemini bills each PDF page attached as a file part at roughly this many tokens
+PDF_TOKENS_PER_PAGE = 258
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which who whom how does do did can shall any all".split()
+)
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    """Rough model token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def chunk_pages(pages, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """
+    Split OCR pages into overlapping chunks that never cross a page boundary.
+
+    Args:
+        pages (list): The "pages" list from extract_text_with_pages.
+        max_chars (int): Target chunk size in characters.
+        overlap (int): Characters repeated at the start of the next chunk.
+
+    Returns:
+        list: Dicts with chunk_id, page_number and text.
+    """
+    chunks = []
+    for page in pages:
+        text = (page.get("text") or "").strip()
+        start = 0
+        while start < len(text):
+            end = min(len(text), start + max_chars)
+            if end < len(text):
+                # Prefer to break at a paragraph, line or sentence end
+                cut = max(text.rfind("\n\n", start, end), text.rfind("\n", start, end), text.rfind(". ", start, end))
+                if cut > start + max_chars // 2:
+                    end = cut + 1
+            piece = text[start:end].strip()
+            if piece:
+                chunks.append({"chunk_id": len(chunks), "page_number": page["page_number"], "text": piece})
+            if end >= len(text):
+                break
+            start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts with an inverted index."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        lengths = []
+        for i, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def search(self, query, k=TOP_K):
+        """Return [(score, chunk)] for the k best-scoring chunks."""
+        scores = {}
+        k1, b, avg = self.k1, self.b, self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for i, tf in plist:
+                norm = k1 * (1 - b + b * self.lengths[i] / avg)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[i]) for i, score in best]
+
+
+class VectorStore:
+    """In-process cosine-similarity store. Vectors are normalized on insert."""
+
+    def __init__(self):
+        self.vectors = []
+        self.items = []
+
+    @staticmethod
+    def _normalize(vector):
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def add(self, vectors, items):
+        for vector, item in zip(vectors, items):
+            self.vectors.append(self._normalize(vector))
+            self.items.append(item)
+
+    def remove(self, item):
+        """Drop every vector stored for item. Returns how many were removed."""
+        keep = [i for i, existing in enumerate(self.items) if existing != item]
+        removed = len(self.items) - len(keep)
+        if removed:
+            self.vectors = [self.vectors[i] for i in keep]
+            self.items = [self.items[i] for i in keep]
+        return removed
+
+    def pop_oldest(self):
+        """Drop the earliest added vector and return its item."""
+        self.vectors.pop(0)
+        return self.items.pop(0)
+
+    def search(self, vector, k=TOP_K):
+        query = self._normalize(vector)
+        scored = [(sum(a * b for a, b in zip(query, v)), item) for v, item in zip(self.vectors, self.items)]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:k]
+
+
+def embedding_batches(texts, max_texts=None, max_tokens=None):
+    """Split texts into consecutive batches within the per-request text and token limits."""
+    max_texts = max_texts or EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or EMBEDDING_BATCH_TOKENS
+    batch, tokens = [], 0
+    for text in texts:
+        size = estimate_tokens(text)
+        if batch and (len(batch) >= max_texts or tokens + size > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += size
+    if batch:
+        yield batch
+
+
+def embed_texts(texts):
+    """Embed texts with the shared genai client, in as many requests as the API limits need."""
+    from Class.clients import get_genai_client
+    from Class import resilience
+    from Class.metrics import upstream
+    vectors = []
+    for batch in embedding_batches(texts):
+        with upstream("gemini", "embed_content"):
+            response = resilience.call("gemini", get_genai_client().models.embed_content, model=EMBEDDING_MODEL, contents=batch)
+        vectors.extend(embedding.values for embedding in response.embeddings)
+    return vectors
+
+
+class DocumentIndex:
+    """
+    Retrieval index for one OCR'd document: BM25, plus an embedding store
+    when an embed_fn is given. Results from both are merged with reciprocal
+    rank fusion.
+    """
+
+    def __init__(self, pages, embed_fn=None):
+        self.chunks = chunk_pages(pages)
+        self.bm25 = BM25Index(self.chunks)
+        self.embed_fn = embed_fn
+        self.vectors = None
+        if embed_fn is not None and self.chunks:
+            self.vectors = VectorStore()
+            self.vectors.add(embed_fn([c["text"] for c in self.chunks]), self.chunks)
+
+    def search(self, query, k=TOP_K):
+        """Return up to k chunks as dicts with chunk_id, page_number, text and score."""
+        rankings = [self.bm25.search(query, k * 2)]
+        if self.vectors is not None:
+            rankings.append(self.vectors.search(self.embed_fn([query])[0], k * 2))
+        fused = {}
+        for ranking in rankings:
+            for rank, (_, chunk) in enumerate(ranking):
+                fused[chunk["chunk_id"]] = fused.get(chunk["chunk_id"], 0.0) + 1.0 / (60 + rank)
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [{**self.chunks[chunk_id], "score": score} for chunk_id, score in best]
+
+
+class IndexStore:
+    """LRU of DocumentIndex objects keyed by document identity."""
+
+    def __init__(self, max_indexes=MAX_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+            return index
+
+    def put(self, key, index):
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+
+
+indexes = IndexStore()
+
+
+def get_document_index(doc_key, ocr_result):
+    """Return the cached index for doc_key, building it from ocr_result on first use."""
+    index = indexes.get(doc_key)
+    if index is None:
+        index = DocumentIndex(ocr_result["pages"], embed_fn=embed_texts if USE_EMBEDDINGS else None)
+        indexes.put(doc_key, index)
+    return index
+
+
+def build_retrieval_prompt(question, chunks):
+    """Prompt carrying only the retrieved excerpts, each labelled with its page."""
+    excerpts = "\n\n".join(f"[Page {c['page_number']}]\n{c['text']}" for c in chunks)
+    return (
+        "Answer the question using the document excerpts below. Cite the pages you rely on as (p. N). "
+        "If the excerpts do not contain the answer, say so.\n\n"
+        f"Document excerpts:\n{excerpts}\n\n"
+        f"Question: {question}"
+    )
+
+
+def citations(chunks):
+    return [{"page": c["page_number"], "chunk_id": c["chunk_id"], "score": round(c["score"], 4)} for c in chunks]
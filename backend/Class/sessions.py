@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from Class.retrieval import estimate_tokens
+
+
+# Session settings
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+# Token budget for the conversation turns (the document part is not counted)
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "4000"))
+# The most recent turns are always kept verbatim
+SESSION_KEEP_TURNS = int(os.getenv("SESSION_KEEP_TURNS", "4"))
+SUMMARY_MAX_CHARS = int(os.getenv("SESSION_SUMMARY_MAX_CHARS", "3000"))
+# "truncate" folds old turns into shortened lines; "model" asks Gemini for a summary
+SESSION_SUMMARY = os.getenv("SESSION_SUMMARY", "truncate")
+
+
+def truncate_summary(summary, turns):
+    """
+    Default compaction: fold turns into the running summary as one shortened
+    line each, dropping the oldest lines once the summary is over SUMMARY_MAX_CHARS.
+    """
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        speaker = "User" if turn["role"] == "user" else "Assistant"
+        limit = 200 if turn["role"] == "user" else 400
+        text = " ".join(turn["content"].split())
+        lines.append(f"{speaker}: {text[:limit]}{'...' if len(text) > limit else ''}")
+    while lines and sum(len(line) + 1 for line in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def model_summary(summary, turns):
+    """Compaction through the chat model, falling back to truncation if the call fails."""
+    try:
+        from Class.chat import summarize_turns
+        return summarize_turns(summary, turns)[:SUMMARY_MAX_CHARS]
+    except Exception:
+        return truncate_summary(summary, turns)
+
+
+class ChatSession:
+    """
+    One client's conversation: the document it is about, a running summary of
+    older turns, and the recent turns verbatim.
+    """
+
+    def __init__(self, session_id, summarize=truncate_summary):
+        self.session_id = session_id
+        self.document = None
+        self.summary = ""
+        self.turns = []
+        self.summarize = summarize
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def history(self, document=None):
+        """
+        Build the chat_history for the next turn.
+
+        The history is text only. The document goes with the current question
+        (as a file part or a cached context), so it is sent once per request
+        however long the conversation gets.
+
+        Args:
+            document (str, optional): gs:// URI or path the question is about.
+                Remembered so follow-up questions can omit it; switching documents
+                keeps the conversation.
+
+        Returns:
+            list: chat_history entries ({"role", "content"}) for generate_legal_advice
+        """
+        with self.lock:
+            if document:
+                self.document = document
+            history = []
+            if self.summary:
+                history.append({"role": "user", "content": f"Summary of our conversation so far:\n{self.summary}"})
+                history.append({"role": "model", "content": "Noted."})
+            history.extend(self.turns)
+            return history
+
+    def record(self, question, answer):
+        """Append a finished exchange and compact if the turns exceed the token budget."""
+        with self.lock:
+            self.turns.append({"role": "user", "content": question})
+            self.turns.append({"role": "model", "content": answer})
+            self._compact()
+
+    def _compact(self):
+        tokens = self.tokens()
+        fold = 0
+        # Fold whole exchanges (user + model) so the history keeps alternating roles
+        while tokens > SESSION_TOKEN_BUDGET and len(self.turns) - fold > SESSION_KEEP_TURNS:
+            tokens -= sum(estimate_tokens(t["content"]) for t in self.turns[fold:fold + 2])
+            fold += 2
+        if fold:
+            self.summary = self.summarize(self.summary, self.turns[:fold])
+            del self.turns[:fold]
+
+    def tokens(self):
+        """Estimated tokens of the summary and verbatim turns."""
+        return (estimate_tokens(self.summary) if self.summary else 0) + sum(
+            estimate_tokens(t["content"]) for t in self.turns)
+
+
+class SessionStore:
+    """ChatSessions keyed by MCP session id, evicted when idle (TTL) or least recently used."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS, summarize=truncate_summary):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.summarize = summarize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id):
+        """Return the session for session_id, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(session_id, summarize=self.summarize)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self, now):
+        # Sessions are kept in last-used order, so expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "sessions": len(self._sessions),
+                "evictions": self.evictions,
+                "tokens": sum(s.tokens() for s in self._sessions.values()),
+            }
+
+
+sessions = SessionStore(summarize=model_summary if SESSION_SUMMARY == "model" else truncate_summary)
@@ -0,0 +1,254 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# TRACING selects where finished spans go:
+#   off     - no spans (default)
+#   memory  - keep the last TRACING_MAX_SPANS in process, served at /traces.
+#             Spans carry document URIs, file names and session ids and /traces
+#             has no authentication, so only enable this for local debugging
+#   console - as memory, and also log each span as one JSON line
+#   otel    - hand spans to the OpenTelemetry API (configure the SDK/exporter
+#             with the usual OTEL_* settings or opentelemetry-instrument)
+TRACING = os.getenv("TRACING", "off").lower()
+TRACING_MAX_SPANS = int(os.getenv("TRACING_MAX_SPANS", "2048"))
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "legal-demystifier-backend")
+TRACING_MODES = ("off", "memory", "console", "otel")
+
+logger = logging.getLogger("tracing")
+
+if TRACING not in TRACING_MODES:
+    logger.warning("Unknown TRACING=%s (expected one of %s); tracing is off", TRACING, ", ".join(TRACING_MODES))
+    TRACING = "off"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    """
+    One timed operation, shaped like an OpenTelemetry span: 128-bit trace id,
+    64-bit span id, nanosecond timestamps, attributes, events and a status.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.events = []
+        self.status = "UNSET"
+        self.status_message = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, attributes=None):
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes or {}})
+
+    def record_exception(self, error):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.add_event("exception", {"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    def context(self):
+        """(trace_id, span_id), usable as an explicit parent."""
+        return self.trace_id, self.span_id
+
+    def traceparent(self):
+        """W3C traceparent header value for this span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class MemoryExporter:
+    """Keeps the most recent finished spans."""
+
+    def __init__(self, max_spans=TRACING_MAX_SPANS):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self, trace_id=None):
+        with self._lock:
+            spans = list(self._spans)
+        return [s.to_dict() for s in spans if trace_id is None or s.trace_id == trace_id]
+
+    def traces(self, limit=20):
+        """Most recent root spans, newest first."""
+        with self._lock:
+            roots = [s for s in self._spans if s.parent_id is None]
+        return [s.to_dict() for s in reversed(roots[-limit:])]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class ConsoleExporter(MemoryExporter):
+    """MemoryExporter that also logs every span as a JSON line."""
+
+    def export(self, span):
+        super().export(span)
+        logger.info("span %s", json.dumps(span.to_dict(), default=str))
+
+
+class _OtelSpan:
+    """Adapter giving an OpenTelemetry span the same interface as Span."""
+
+    __slots__ = ("span",)
+
+    def __init__(self, span):
+        self.span = span
+
+    @property
+    def trace_id(self):
+        return format(self.span.get_span_context().trace_id, "032x")
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+    def add_event(self, name, attributes=None):
+        self.span.add_event(name, attributes or {})
+
+    def record_exception(self, error):
+        from opentelemetry.trace import Status, StatusCode
+        self.span.record_exception(error)
+        self.span.set_status(Status(StatusCode.ERROR, str(error)))
+
+    def context(self):
+        ctx = self.span.get_span_context()
+        return format(ctx.trace_id, "032x"), format(ctx.span_id, "016x")
+
+    def traceparent(self):
+        trace_id, span_id = self.context()
+        return f"00-{trace_id}-{span_id}-01"
+
+
+def _make_exporter():
+    if TRACING == "console":
+        return ConsoleExporter()
+    if TRACING == "memory":
+        return MemoryExporter()
+    return None
+
+
+exporter = _make_exporter()
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value):
+    """(trace_id, span_id) from a W3C traceparent header, or None."""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    return match.groups() if match else None
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    """Trace id of the active span, for log lines; None outside a span."""
+    active = _current.get()
+    return active.trace_id if active is not None else None
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """
+    Open a span as a child of the active one (or of parent, a (trace_id,
+    span_id) pair from another task or a traceparent header) and make it
+    active for the block. Exceptions are recorded on the span and re-raised.
+    Yields the span, or None when tracing is off.
+    """
+    if TRACING == "off":
+        yield None
+        return
+    if TRACING == "otel":
+        with _otel_span(name, parent, attributes) as active:
+            yield active
+        return
+    if parent is None:
+        active = _current.get()
+        parent = active.context() if active is not None else None
+    trace_id, parent_id = parent if parent is not None else (secrets.token_hex(16), None)
+    new = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.record_exception(e)
+        raise
+    finally:
+        new.end_ns = time.time_ns()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An async generator closed from another task (client went away)
+            pass
+        exporter.export(new)
+
+
+def traced(name=None):
+    """Decorator running each call of a (synchronous) function in a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def _otel_span(name, parent, attributes):
+    from opentelemetry import trace
+    from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+    ctx = None
+    if parent is not None:
+        parent_context = SpanContext(int(parent[0], 16), int(parent[1], 16), is_remote=True,
+                                     trace_flags=TraceFlags(TraceFlags.SAMPLED))
+        ctx = trace.set_span_in_context(NonRecordingSpan(parent_context))
+    tracer = trace.get_tracer(SERVICE_NAME)
+    with tracer.start_as_current_span(name, context=ctx, attributes=attributes) as otel_span:
+        wrapped = _OtelSpan(otel_span)
+        token = _current.set(wrapped)
+        try:
+            yield wrapped
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                pass
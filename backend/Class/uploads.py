@@ -0,0 +1,218 @@
+import base64
+import binascii
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+from Class import doc_store, resilience
+from Class.clients import PROJECT_ID, get_storage_client
+from Class.metrics import upstream
+
+
+# GCS resumable uploads send data in multiples of 256 KiB; this is also the
+# most a session buffers in memory before flushing to GCS.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 256 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "900"))
+UPLOAD_DIR = "uploads"
+
+
+class UploadError(Exception):
+    """Raised for invalid chunked-upload requests (unknown id, bad chunk order or data)."""
+
+
+class UploadSession:
+    """
+    One in-progress chunked upload.
+
+    Chunks are base64 text. Each one is decoded as it arrives (a partial
+    4-character group is carried over to the next chunk), hashed, and written
+    straight to a GCS resumable upload of a staging object, or to uploads/
+    when GCS is unavailable, so memory use stays bounded by UPLOAD_CHUNK_SIZE
+    plus one chunk. On finish the data is moved to its content address.
+    """
+
+    def __init__(self, filename, bucket_name, project_id=None, owner=None):
+        self.upload_id = uuid.uuid4().hex
+        self.filename = filename
+        self.owner = owner
+        self.bucket_name = bucket_name
+        self.blob_name = f"{doc_store.DOC_PREFIX}/staging/{self.upload_id}.pdf"
+        self.project_id = project_id or PROJECT_ID
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.next_index = 0
+        self.bytes_received = 0
+        self.target = None
+        self.local_path = None
+        self._carry = ""
+        self.failed = None
+        self._writer = None
+        self._sha256 = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            bucket = get_storage_client(self.project_id).bucket(self.bucket_name)
+            blob = bucket.blob(self.blob_name, chunk_size=UPLOAD_CHUNK_SIZE)
+            # blob.open() does no network I/O, so probe GCS with one metadata call
+            # now rather than find out it is down once chunks are already buffered
+            with upstream("gcs", "exists"):
+                resilience.call("gcs", blob.exists)
+            self._writer = blob.open("wb", content_type="application/pdf")
+            self.target = "gcs"
+        except Exception:
+            # Fallback for local-only mode if GCS is not reachable
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            self.local_path = os.path.join(UPLOAD_DIR, f"{self.upload_id}.part")
+            self._writer = open(self.local_path, "wb")
+            self.target = "local"
+
+    def _timed(self):
+        """Writer calls to GCS count as upstream time in metrics."""
+        return upstream("gcs", "upload") if self.target == "gcs" else nullcontext()
+
+    def _write(self, raw):
+        """
+        Write decoded bytes. A writer that raised may already hold part of them,
+        so the session is marked failed rather than letting the chunk be retried.
+        """
+        try:
+            with self._timed():
+                self._writer.write(raw)
+        except Exception as e:
+            self.failed = str(e)
+            raise
+
+    def _decode(self, data, final=False):
+        """Return (decoded bytes, carry for the next chunk) without touching the session."""
+        data = self._carry + "".join(data.split())
+        usable = len(data) if final else len(data) - len(data) % 4
+        try:
+            return base64.b64decode(data[:usable], validate=True), data[usable:]
+        except binascii.Error as e:
+            raise UploadError(f"Invalid base64 data: {e}")
+
+    def _check_failed(self):
+        if self.failed is not None:
+            raise UploadError(f"Upload {self.upload_id} failed ({self.failed}); start a new upload")
+
+    def write_chunk(self, index, chunk_data):
+        """
+        Decode and write chunk number index (0-based).
+        A chunk that was already received is ignored so clients can safely retry.
+        If writing a chunk fails, the session is marked failed and the upload
+        has to be started again.
+
+        Returns:
+            int: Total decoded bytes received so far.
+        """
+        with self._lock:
+            self._check_failed()
+            if index < self.next_index:
+                return self.bytes_received
+            if index > self.next_index:
+                raise UploadError(f"Expected chunk {self.next_index}, got {index}")
+            if index == 0 and chunk_data.startswith("data:") and "," in chunk_data:
+                chunk_data = chunk_data.split(",", 1)[1]
+            raw, carry = self._decode(chunk_data)
+            if self._writer is None:
+                self._open()
+            self._write(raw)
+            # Only a written chunk moves the session on, so a retry decodes from the same carry
+            self._carry = carry
+            self._sha256.update(raw)
+            self.bytes_received += len(raw)
+            self.next_index += 1
+            self.updated_at = time.time()
+            return self.bytes_received
+
+    def finish(self):
+        """Flush the remaining data and complete the upload. Returns the upload_pdf-style result."""
+        with self._lock:
+            self._check_failed()
+            raw, self._carry = self._decode("", final=True)
+            if self._writer is None:
+                self._open()
+            if raw:
+                self._write(raw)
+                self._sha256.update(raw)
+                self.bytes_received += len(raw)
+            try:
+                with self._timed():
+                    self._writer.close()
+            except Exception as e:
+                self.failed = str(e)
+                raise
+            self._writer = None
+            sha256 = self._sha256.hexdigest()
+            if self.target == "gcs":
+                stored = doc_store.promote_blob(self.bucket_name, self.blob_name, sha256, self.filename,
+                                              self.project_id, owner=self.owner)
+                message = "File uploaded to GCS"
+            else:
+                stored = doc_store.promote_local_file(self.local_path, sha256, self.filename, owner=self.owner)
+                message = "File saved locally"
+            return {"message": message, **stored, "bytes": self.bytes_received}
+
+    def abort(self):
+        """Drop the upload. An unfinished GCS resumable upload is simply never completed."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+            if writer is None:
+                return
+            if self.target == "local":
+                writer.close()
+                if self.local_path and os.path.exists(self.local_path):
+                    os.remove(self.local_path)
+            # BlobWriter.close() would commit the partial object, so the
+            # resumable session is simply never completed
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _expire_sessions():
+    cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+    with _sessions_lock:
+        expired = [s for s in _sessions.values() if s.updated_at < cutoff]
+        for session in expired:
+            del _sessions[session.upload_id]
+    for session in expired:
+        session.abort()
+
+
+def start_upload(filename, bucket_name, project_id=None, owner=None):
+    """Create an upload session and return it. Idle sessions are aborted after UPLOAD_SESSION_TTL_SECONDS."""
+    _expire_sessions()
+    session = UploadSession(filename, bucket_name, project_id=project_id, owner=owner)
+    with _sessions_lock:
+        _sessions[session.upload_id] = session
+    return session
+
+
+def get_upload(upload_id):
+    with _sessions_lock:
+        session = _sessions.get(upload_id)
+    if session is None:
+        raise UploadError(f"Unknown or expired upload_id: {upload_id}")
+    return session
+
+
+def finish_upload(upload_id):
+    session = get_upload(upload_id)
+    try:
+        return session.finish()
+    finally:
+        with _sessions_lock:
+            _sessions.pop(upload_id, None)
+
+
+def abort_upload(upload_id):
+    with _sessions_lock:
+        session = _sessions.pop(upload_id, None)
+    if session is not None:
+        session.abort()
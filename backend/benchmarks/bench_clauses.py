@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+CPU cost of clause segmentation (Class.clauses.iter_clauses) on synthetic OCR pages.
+
+Usage:
+    python benchmarks/bench_clauses.py [--pages 500] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Class.clauses import iter_clauses  # noqa: E402
+from synthetic import make_page_text  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = [{"page_number": p, "text": make_page_text(p)} for p in range(1, args.pages + 1)]
+    chars = sum(len(p["text"]) for p in pages)
+
+    runs, first = [], []
+    for _ in range(args.repeat):
+        start = time.process_time()
+        clauses = iter_clauses(pages)
+        next(clauses)
+        first.append(time.process_time() - start)
+        count = 1 + sum(1 for _ in clauses)
+        runs.append(time.process_time() - start)
+    print(f"{args.pages} pages, {chars:,} characters -> {count} clauses")
+    print(f"first clause after: {statistics.median(first) * 1000:8.2f} ms CPU")
+    print(f"all clauses:        {statistics.median(runs) * 1000:8.2f} ms CPU")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the async MCP tools against stubbed backends.
+
+Every upstream (Gemini, Document AI, GCS) is replaced by a stub that sleeps
+for a fixed latency, so the numbers show how the server itself behaves as
+concurrency goes up: p50/p99 should stay close to the stub latency until the
+per-tool concurrency limit is reached.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--requests 200] [--latency 0.2]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every call repeats the same question, which the answer cache would short-circuit
+os.environ.setdefault("ANSWER_CACHE_BACKEND", "off")
+
+import mcp_app  # noqa: E402
+from fastmcp import Client  # noqa: E402
+
+
+def install_stubs(latency):
+    """Replace every upstream call in mcp_app with a fixed-latency stub."""
+
+    async def aautomated_chat(question, file_path=None, chat_history=None):
+        await asyncio.sleep(latency)
+        return f"stub answer to: {question}"
+
+    async def afind_precedents(user_clause, location="US"):
+        await asyncio.sleep(latency)
+        return f"1. Stub v. Stub ({location})"
+
+    # Document AI and GCS have no async client, so their stubs block like the real SDKs
+    def process_pdf_with_document_ai(gcs_uri, use_cache=True, page_count=None):
+        time.sleep(latency)
+        return {"success": True, "error": None, "full_text": "stub", "pages": [], "form_fields": [], "confidence_score": None}
+
+    def store_pdf(raw, filename, bucket_name, project_id=None, owner=None):
+        time.sleep(latency)
+        return {"gcs_uri": f"gs://{bucket_name}/docs/{filename}", "sha256": "0" * 64, "deduplicated": False}
+
+    mcp_app.aautomated_chat = aautomated_chat
+    mcp_app.afind_precedents = afind_precedents
+    mcp_app.process_pdf_with_document_ai = process_pdf_with_document_ai
+    mcp_app.doc_store.store_pdf = store_pdf
+
+
+TOOL_CALLS = {
+    "pdf_qa": {"question": "What is the termination clause?", "gsUri": "gs://bench/doc.pdf"},
+    "extract_text_from_pdf": {"gcs_uri": "gs://bench/doc.pdf"},
+    "find_legal_precedents": {"clause": "Either party may terminate with 30 days notice.", "location": "India"},
+    "upload_pdf": {"filename": "bench.pdf", "file_data": base64.b64encode(b"%PDF-1.4 bench").decode()},
+}
+
+
+async def run_level(client, tool, args, concurrency, total):
+    """Issue `total` calls with at most `concurrency` in flight; return per-call latencies."""
+    latencies = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            await client.call_tool(tool, args)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def main(levels, total, latency):
+    install_stubs(latency)
+    async with Client(mcp_app.mcp) as client:
+        print(f"stub latency: {latency * 1000:.0f} ms, {total} calls per level")
+        print(f"{'tool':<24}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+        for tool, args in TOOL_CALLS.items():
+            for concurrency in levels:
+                latencies, elapsed = await run_level(client, tool, args, concurrency, total)
+                print(
+                    f"{tool:<24}{concurrency:>6}"
+                    f"{statistics.median(latencies) * 1000:>10.1f}"
+                    f"{percentile(latencies, 99) * 1000:>10.1f}"
+                    f"{total / elapsed:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="calls per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub upstream latency in seconds")
+    parser.add_argument("--levels", default="1,8,32,128", help="comma-separated concurrency levels")
+    args = parser.parse_args()
+    asyncio.run(main([int(x) for x in args.levels.split(",")], args.requests, args.latency))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for Class.OCR.extract_text_with_pages on a synthetic Document.
+
+Usage:
+    python benchmarks/bench_ocr_extract.py [--pages 200] [--fields 50] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("OCR_CACHE_BACKEND", "off")
+
+from Class.OCR import extract_text_with_pages  # noqa: E402
+from synthetic import make_document  # noqa: E402
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fields", type=int, default=50, help="form fields per page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    document = make_document(pages=args.pages, fields_per_page=args.fields)
+    print(f"{args.pages} pages, {args.pages * args.fields} form fields, {len(document.text):,} characters")
+    eager = timed(lambda: extract_text_with_pages(document), args.repeat)
+    print(f"extract_text_with_pages:                  {eager * 1000:8.1f} ms")
+    lazy = timed(lambda: extract_text_with_pages(document, lazy_page_text=True), args.repeat)
+    print(f"extract_text_with_pages(lazy_page_text):  {lazy * 1000:8.1f} ms")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Whole-contract precedent analysis: clause-by-clause calls vs afind_precedents_batch.
+
+The Vertex model is replaced by a fake whose latency is a fixed request
+overhead plus a per-clause generation time, so packing several clauses into
+one request saves the overhead and concurrency overlaps the rest.
+
+Usage:
+    python benchmarks/bench_precedent_batch.py [--clauses 60] [--duplicates 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Class import Precedent  # noqa: E402
+from Class.clients import override_client  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self, overhead, per_clause):
+        self.overhead = overhead
+        self.per_clause = per_clause
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            ids = [int(i) for i in re.findall(r"^\s*Clause (\d+):", prompt, re.M)]
+            await asyncio.sleep(self.overhead + self.per_clause * len(ids))
+            return SimpleNamespace(text=json.dumps([{"clause_id": i, "precedents": f"1. Case {i}"} for i in ids]))
+        await asyncio.sleep(self.overhead + self.per_clause)
+        return SimpleNamespace(text="1. Case")
+
+
+async def main(args):
+    model = FakeModel(args.overhead, args.per_clause)
+    override_client("generative_model", model)
+    distinct = args.clauses - args.duplicates
+    clauses = [f"Clause {i % distinct}: the tenant shall pay rent on the {i % distinct} day." for i in range(args.clauses)]
+
+    start = time.perf_counter()
+    for clause in clauses:
+        await Precedent.afind_precedents(clause, "India")
+    serial, serial_calls = time.perf_counter() - start, model.calls
+
+    model.calls = 0
+    start = time.perf_counter()
+    results = await Precedent.afind_precedents_batch(clauses, "India")
+    batch = time.perf_counter() - start
+    assert len(results) == distinct
+
+    print(f"{args.clauses} clauses ({distinct} distinct), request overhead {args.overhead}s, "
+          f"{args.per_clause}s per clause")
+    print(f"clause by clause: {serial:7.2f} s  {serial_calls:4d} model calls")
+    print(f"batch:            {batch:7.2f} s  {model.calls:4d} model calls  ({serial / batch:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clauses", type=int, default=60)
+    parser.add_argument("--duplicates", type=int, default=10, help="clauses that repeat an earlier one")
+    parser.add_argument("--overhead", type=float, default=0.1, help="fixed seconds per model request")
+    parser.add_argument("--per-clause", type=float, default=0.05, help="generation seconds per clause")
+    asyncio.run(main(parser.parse_args()))
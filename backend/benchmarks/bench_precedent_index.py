@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Queries per second of the local precedent index.
+
+Builds an on-disk index of synthetic clauses across a few jurisdictions, then
+times lookups of reworded clauses and of unrelated ones (which should fall
+through to the model). Reworded clauses are only answered locally with --dim:
+entries then get deterministic hash embeddings, so the memory-mapped vector
+path is measured too (numpy is used when installed). Lexical-only indexes
+answer exact repeats only.
+
+Usage:
+    python benchmarks/bench_precedent_index.py [--entries 20000] [--queries 2000] [--dim 0]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Class import precedent_index  # noqa: E402
+from Class.precedent_index import PrecedentIndex  # noqa: E402
+from synthetic import WORDS  # noqa: E402
+
+LOCATIONS = ["US", "California", "India", "UK", "EU"]
+VOCABULARY = WORDS + (
+    "assignment confidentiality arbitration force majeure subcontract audit insurance renewal "
+    "severability waiver amendment exclusivity deposit maintenance premises employee"
+).split()
+
+
+def make_clause(rng, words=30):
+    return " ".join(rng.choice(VOCABULARY) + str(rng.randrange(50)) for _ in range(words)) + "."
+
+
+def reword(rng, clause):
+    """Same clause with a couple of words changed, as it would appear in another contract."""
+    words = clause.split()
+    for _ in range(2):
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return " ".join(words)
+
+
+def hash_embed(dim):
+    def embed(texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dim
+            for word in text.split():
+                digest = hashlib.blake2b(word.encode(), digest_size=4).digest()
+                vector[int.from_bytes(digest, "little") % dim] += 1.0
+            vectors.append(vector)
+        return vectors
+    return embed
+
+
+def record(i):
+    return {"case_name": f"Case {i} v State", "court": "High Court", "year": 1990 + i % 30,
+            "relevance": "Directly on point.", "principle": "Clauses like this are enforceable."}
+
+
+def timed_queries(index, queries):
+    start = time.perf_counter()
+    answered = sum(index.lookup(text, location) is not None for text, location in queries)
+    return time.perf_counter() - start, answered
+
+
+def main(args):
+    rng = random.Random(0)
+    embed = hash_embed(args.dim) if args.dim else None
+    clauses = [(make_clause(rng), LOCATIONS[i % len(LOCATIONS)]) for i in range(args.entries)]
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        index = PrecedentIndex(path, embed_fn=embed, model="hash")
+        index.add({"text": text, "location": location, "records": [record(i)]}
+                  for i, (text, location) in enumerate(clauses))
+        index.close()
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = PrecedentIndex(path, embed_fn=embed, model="hash")
+        loaded = time.perf_counter() - start
+
+        repeats = [(reword(rng, text), location) for text, location in rng.sample(clauses, args.queries)]
+        novel = [(make_clause(rng), rng.choice(LOCATIONS)) for _ in range(args.queries)]
+        repeat_time, repeat_answered = timed_queries(index, repeats)
+        novel_time, novel_answered = timed_queries(index, novel)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        index.close()
+
+    mode = f"lexical + {args.dim}-dim vectors ({'numpy' if precedent_index.numpy else 'pure Python'})" \
+        if args.dim else "lexical only"
+    print(f"{args.entries} entries, {mode}: built in {built:.2f} s, loaded in {loaded:.2f} s, "
+          f"{size / 1e6:.1f} MB on disk")
+    print(f"reworded clauses:  {args.queries / repeat_time:8.0f} queries/s  "
+          f"{repeat_answered / args.queries:6.1%} answered from the index")
+    print(f"unrelated clauses: {args.queries / novel_time:8.0f} queries/s  "
+          f"{novel_answered / args.queries:6.1%} answered from the index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=0, help="hash-embedding size; 0 for lexical only")
+    main(parser.parse_args())
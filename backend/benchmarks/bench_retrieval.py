@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Per-question cost of retrieval-augmented pdf_qa vs attaching the whole PDF.
+
+Builds the chunk index for a synthetic OCR'd document, then for each question
+reports the model input tokens of both paths (whole PDF: ~258 tokens per page
+plus the question; retrieval: the excerpt prompt) and the local retrieval
+latency. Model prefill time is estimated from --prefill-tps so the two paths
+can be compared end to end without calling Gemini.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--pages 100] [--top-k 6] [--prefill-tps 8000]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("OCR_CACHE_BACKEND", "off")
+
+from Class import retrieval  # noqa: E402
+from Class.OCR import extract_text_with_pages  # noqa: E402
+from synthetic import make_document  # noqa: E402
+
+QUESTIONS = [
+    "What notice is required to terminate the agreement?",
+    "Which party must indemnify for breach of warranty?",
+    "What is the governing law and jurisdiction?",
+    "When is rent payment due from the tenant?",
+    "Is liability for damages limited?",
+]
+
+
+def ms(seconds):
+    return seconds * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=retrieval.TOP_K)
+    parser.add_argument("--prefill-tps", type=float, default=8000, help="assumed model input tokens per second")
+    parser.add_argument("--repeat", type=int, default=20, help="searches per question for the latency median")
+    args = parser.parse_args()
+
+    ocr = extract_text_with_pages(make_document(pages=args.pages, fields_per_page=5))
+    start = time.perf_counter()
+    index = retrieval.DocumentIndex(ocr["pages"])
+    build = time.perf_counter() - start
+    print(f"{args.pages} pages, {len(ocr['full_text']):,} characters, {len(index.chunks)} chunks, "
+          f"index built in {ms(build):.1f} ms")
+    print(f"{'question':<54}{'pdf tok':>9}{'rag tok':>9}{'saved':>8}{'search ms':>11}{'est. ms pdf/rag':>18}")
+
+    totals = {"pdf": 0, "rag": 0}
+    for question in QUESTIONS:
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = index.search(question, args.top_k)
+            runs.append(time.perf_counter() - start)
+        search = statistics.median(runs)
+        prompt = retrieval.build_retrieval_prompt(question, chunks)
+        pdf_tokens = args.pages * retrieval.PDF_TOKENS_PER_PAGE + retrieval.estimate_tokens(question)
+        rag_tokens = retrieval.estimate_tokens(prompt)
+        totals["pdf"] += pdf_tokens
+        totals["rag"] += rag_tokens
+        pdf_ms = ms(pdf_tokens / args.prefill_tps)
+        rag_ms = ms(search + rag_tokens / args.prefill_tps)
+        print(f"{question[:52]:<54}{pdf_tokens:>9,}{rag_tokens:>9,}{1 - rag_tokens / pdf_tokens:>8.0%}"
+              f"{ms(search):>11.2f}{pdf_ms:>10.0f}/{rag_ms:<7.0f}")
+
+    print(f"total input tokens: whole PDF {totals['pdf']:,}, retrieval {totals['rag']:,} "
+          f"({totals['pdf'] / max(1, totals['rag']):.1f}x fewer)")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of every MCP tool, offline, in-process and over HTTP.
+
+All Google services are replaced by the deterministic fakes in fakes.py
+(GCS in memory, Document AI replaying synthetic documents of --pages pages,
+Gemini streaming canned chunks), so the whole server path runs (middleware,
+concurrency limits, OCR fan-out, retrieval, batching, the pipeline) without
+network access or cost. Each tool is called --requests times at every
+concurrency level, through the in-memory FastMCP client and through the
+streamable HTTP transport of the FastAPI app served by uvicorn on localhost.
+
+Results are printed as a table and written as JSON (commit, settings and one
+row per tool/transport/concurrency) to --output, by default
+benchmarks/results/<commit>.json. --compare takes an earlier results file
+and prints the change in p50 latency and throughput per row.
+
+Caches that would answer repeated calls locally (answer cache, OCR cache,
+precedent index) and chat sessions are off unless set in the environment.
+
+Usage:
+    python benchmarks/bench_tools.py [--requests 40] [--levels 1,8] [--transports inproc,http]
+                                     [--tools pdf_qa,find_legal_precedents] [--pages 30]
+                                     [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for name, value in (("ANSWER_CACHE_BACKEND", "off"), ("OCR_CACHE_BACKEND", "off"),
+                    ("PRECEDENT_INDEX", "off"), ("CHAT_SESSIONS", "0")):
+    os.environ.setdefault(name, value)
+
+import mcp_app  # noqa: E402
+from Class import doc_store  # noqa: E402
+from fakes import install_fakes  # noqa: E402
+from fastmcp import Client  # noqa: E402
+from synthetic import make_pdf  # noqa: E402
+
+CLAUSE = "Either party may terminate this agreement with thirty days written notice to the other party."
+BATCH_CLAUSES = [f"Clause {i}: the tenant shall pay rent on day {i} of each month, failing which interest accrues."
+                 for i in range(20)]
+# Not "what is ...": chat.py sends those to a glossary service first
+QUESTION = "How much notice does either party need to give to terminate?"
+
+
+def scenarios(gcs_uri, pdf):
+    """name -> (tool, arguments). Several names may exercise one tool in different modes."""
+    return {
+        "upload_pdf": ("upload_pdf", {"filename": "bench.pdf", "file_data": base64.b64encode(pdf).decode()}),
+        "extract_text_from_pdf": ("extract_text_from_pdf", {"gcs_uri": gcs_uri}),
+        "extract_clauses": ("extract_clauses", {"gcs_uri": gcs_uri}),
+        "pdf_qa": ("pdf_qa", {"question": QUESTION, "gsUri": gcs_uri}),
+        "pdf_qa_stream": ("pdf_qa", {"question": QUESTION, "gsUri": gcs_uri, "stream": True}),
+        "pdf_qa_retrieval": ("pdf_qa", {"question": QUESTION, "gsUri": gcs_uri, "use_retrieval": True}),
+        "find_legal_precedents": ("find_legal_precedents", {"clause": CLAUSE, "location": "India"}),
+        "find_legal_precedents_structured": ("find_legal_precedents",
+                                             {"clause": CLAUSE, "location": "India", "structured": True}),
+        "find_legal_precedents_batch": ("find_legal_precedents_batch", {"clauses": BATCH_CLAUSES, "location": "UK"}),
+        "analyze_document": ("analyze_document", {"gcs_uri": gcs_uri, "location": "California"}),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    """Latency summary in milliseconds."""
+    if not values:
+        return {}
+    return {
+        "mean_ms": round(statistics.fmean(values) * 1000, 2),
+        "p50_ms": round(statistics.median(values) * 1000, 2),
+        "p90_ms": round(percentile(values, 90) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def failed(result):
+    content = result.structured_content
+    return result.is_error or (isinstance(content, dict) and (bool(content.get("error")) or content.get("success") is False))
+
+
+async def run_level(client, tool, arguments, concurrency, total):
+    """
+    Issue `total` calls with at most `concurrency` in flight. Returns per-call
+    latencies, times to the first progress notification, error count and elapsed time.
+    """
+    latencies, first_progress, errors = [], [], []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            seen = []
+
+            async def on_progress(progress, total=None, message=None):
+                if not seen:
+                    seen.append(time.perf_counter() - start)
+
+            try:
+                result = await client.call_tool(tool, arguments, progress_handler=on_progress, raise_on_error=False)
+                if failed(result):
+                    errors.append(str((result.structured_content or {}).get("error", "tool error"))[:200])
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}"[:200])
+            latencies.append(time.perf_counter() - start)
+            first_progress.extend(seen)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, first_progress, errors, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class HTTPServer:
+    """The FastAPI app served by uvicorn on a background thread."""
+
+    def __init__(self):
+        import uvicorn
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(mcp_app.app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/mcp/"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def run_transport(transport, target, selected, levels, total):
+    rows = []
+    async with Client(target) as client:
+        for name, (tool, arguments) in selected.items():
+            # One untimed call warms per-document state (retrieval index, cached context)
+            await client.call_tool(tool, arguments, raise_on_error=False)
+            for concurrency in levels:
+                latencies, first_progress, errors, elapsed = await run_level(client, tool, arguments, concurrency, total)
+                row = {"scenario": name, "tool": tool, "transport": transport, "concurrency": concurrency,
+                       "calls": total, "errors": len(errors), "seconds": round(elapsed, 3),
+                       "throughput_rps": round(total / elapsed, 2), **summarize(latencies)}
+                if first_progress:
+                    row["first_progress"] = summarize(first_progress)
+                if errors:
+                    row["first_error"] = errors[0]
+                rows.append(row)
+                print(format_row(row), flush=True)
+    return rows
+
+
+def format_row(row):
+    return (f"{row['scenario']:<34}{row['transport']:>8}{row['concurrency']:>6}"
+            f"{row.get('p50_ms', 0):>10.1f}{row.get('p99_ms', 0):>10.1f}{row['throughput_rps']:>10.1f}"
+            f"{row['errors']:>8}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(rows, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r["scenario"], r["transport"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} (commit {baseline.get('commit', 'unknown')[:12]}):")
+    print(f"{'scenario':<34}{'transport':>8}{'conc':>6}{'p50':>10}{'req/s':>10}")
+    for row in rows:
+        old = before.get((row["scenario"], row["transport"], row["concurrency"]))
+        if not old or not old.get("p50_ms") or not row.get("p50_ms"):
+            continue
+        p50 = (row["p50_ms"] / old["p50_ms"] - 1) * 100
+        rps = (row["throughput_rps"] / old["throughput_rps"] - 1) * 100
+        print(f"{row['scenario']:<34}{row['transport']:>8}{row['concurrency']:>6}{p50:>+9.1f}%{rps:>+9.1f}%")
+
+
+async def main(args):
+    # The server logs every request at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+    fakes = install_fakes(
+        pages=args.pages, gcs_latency=args.gcs_latency, ocr_latency=args.ocr_latency,
+        ocr_page_latency=args.ocr_page_latency, model_latency=args.model_latency,
+        chunk_interval=args.chunk_interval, chunks=args.chunks, per_clause=args.per_clause,
+    )
+    pdf = make_pdf(args.pages)
+    stored = doc_store.store_pdf(pdf, "bench.pdf", os.getenv("BUCKET_NAME") or "legal-doc-bucket1")
+    selected = scenarios(stored["gcs_uri"], pdf)
+    if args.tools:
+        wanted = args.tools.split(",")
+        unknown = set(wanted) - set(selected)
+        if unknown:
+            raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}; choose from {', '.join(selected)}")
+        selected = {name: selected[name] for name in wanted}
+    levels = [int(x) for x in args.levels.split(",")]
+
+    print(f"{args.pages}-page document, model first chunk {args.model_latency * 1000:.0f} ms, "
+          f"OCR {args.ocr_latency * 1000:.0f} ms + {args.ocr_page_latency * 1000:.0f} ms/page, "
+          f"{args.requests} calls per level")
+    print(f"{'scenario':<34}{'transport':>8}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    rows = []
+    for transport in args.transports.split(","):
+        if transport == "inproc":
+            rows += await run_transport(transport, mcp_app.mcp, selected, levels, args.requests)
+        elif transport == "http":
+            with HTTPServer() as server:
+                rows += await run_transport(transport, server.url, selected, levels, args.requests)
+        else:
+            raise SystemExit(f"unknown transport: {transport}")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "upstream_calls": {"gcs": fakes.storage.calls, "documentai": fakes.documentai.calls,
+                           "genai": fakes.genai.calls, "precedent_model": fakes.generative_model.calls},
+        "results": rows,
+    }
+    output = args.output or os.path.join(BACKEND, "benchmarks", "results", f"{commit[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="calls per concurrency level")
+    parser.add_argument("--levels", default="1,8", help="comma-separated concurrency levels")
+    parser.add_argument("--transports", default="inproc,http", help="inproc, http or both")
+    parser.add_argument("--tools", default="", help="comma-separated scenarios (default: all)")
+    parser.add_argument("--pages", type=int, default=30, help="pages of the synthetic document")
+    parser.add_argument("--gcs-latency", type=float, default=0.01, help="seconds per GCS request")
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="seconds per Document AI request")
+    parser.add_argument("--ocr-page-latency", type=float, default=0.01, help="extra Document AI seconds per page")
+    parser.add_argument("--model-latency", type=float, default=0.3,
+                        help="seconds to the first streamed chunk / to a whole precedent answer")
+    parser.add_argument("--chunk-interval", type=float, default=0.03, help="seconds between streamed chunks")
+    parser.add_argument("--chunks", type=int, default=8, help="chunks per streamed answer")
+    parser.add_argument("--per-clause", type=float, default=0.02, help="extra model seconds per packed clause")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,418 @@
+"""
+Deterministic local fakes for the Google clients, for offline benchmarks.
+
+install_fakes() puts them behind Class.clients.override_client, so every
+code path (doc_store, OCR, chat, Precedent, retrieval, context_cache) runs
+as in production and only the network calls are replaced:
+
+    FakeStorageClient      in-memory buckets (exists/upload/download/rewrite/...)
+    FakeDocumentAIClient   replays synthetic Document protos (see synthetic.py)
+                           with as many pages as the stored PDF, or as requested
+    FakeGenAIClient        streams canned answer chunks (sync and aio), embeds
+                           with hash vectors, and hands out cached-content names
+    FakeGenerativeModel    vertexai model for Precedent: text, structured
+                           records and packed batch answers
+
+Output depends only on the request, and latency is a fixed sleep, so runs are
+repeatable. Blocking calls sleep with time.sleep like the real SDKs; the aio
+calls with asyncio.sleep.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from google.api_core import exceptions
+from google.genai import types
+
+from Class.clients import override_client, reset_clients
+from synthetic import WORDS, make_document
+
+ANSWER = (
+    "Under clause 4.2 either party may terminate the agreement with thirty days written notice. "
+    "The tenant must pay rent on the first day of each month, and late payment accrues interest "
+    "at the rate in clause 5.1. The landlord's liability for indirect damages is excluded, but "
+    "the indemnity in clause 9 survives termination. Disputes are governed by the law of the "
+    "jurisdiction named in clause 12."
+)
+
+
+def _digest(text):
+    return zlib.crc32(str(text).encode())
+
+
+def _split(text, chunks):
+    """Split text into `chunks` pieces of roughly equal length, on word boundaries."""
+    words = text.split(" ")
+    size = max(1, -(-len(words) // max(1, chunks)))
+    return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+
+# ---- Cloud Storage ----
+
+class _Writer:
+    def __init__(self, blob):
+        self.blob = blob
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.blob._store(b"".join(self.parts))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def _data(self):
+        return self.bucket.objects.get(self.name)
+
+    @property
+    def size(self):
+        data = self._data
+        return None if data is None else len(data)
+
+    @property
+    def md5_hash(self):
+        data = self._data
+        return None if data is None else base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    crc32c = None
+
+    def _store(self, data):
+        self.bucket.client.wait()
+        with self.bucket.client.lock:
+            self.bucket.objects[self.name] = data
+
+    def exists(self):
+        self.bucket.client.wait()
+        return self.name in self.bucket.objects
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        if isinstance(data, str):
+            data = data.encode()
+        if if_generation_match == 0 and self.name in self.bucket.objects:
+            raise exceptions.PreconditionFailed(f"{self.name} already exists")
+        self._store(data)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as f:
+            self._store(f.read())
+
+    def download_as_bytes(self, start=None, end=None, **kwargs):
+        self.bucket.client.wait()
+        data = self._data
+        if data is None:
+            raise exceptions.NotFound(f"gs://{self.bucket.name}/{self.name}")
+        # Like GCS ranged reads, end is inclusive
+        return data[start or 0:None if end is None else end + 1]
+
+    def open(self, mode="rb", **kwargs):
+        if mode != "wb":
+            raise ValueError("FakeBlob only supports open('wb')")
+        return _Writer(self)
+
+    def rewrite(self, source, token=None):
+        data = source.download_as_bytes()
+        self._store(data)
+        return None, len(data), len(data)
+
+    def delete(self):
+        self.bucket.client.wait()
+        with self.bucket.client.lock:
+            if self.bucket.objects.pop(self.name, None) is None:
+                raise exceptions.NotFound(f"gs://{self.bucket.name}/{self.name}")
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.objects = {}
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        self.client.wait()
+        return FakeBlob(self, name) if name in self.objects else None
+
+
+class FakeStorageClient:
+    """In-memory Cloud Storage; every request sleeps `latency` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bucket(self, name):
+        with self.lock:
+            if name not in self.buckets:
+                self.buckets[name] = FakeBucket(self, name)
+            return self.buckets[name]
+
+    def list_blobs(self, bucket_name, prefix=""):
+        self.wait()
+        bucket = self.bucket(bucket_name)
+        return [FakeBlob(bucket, name) for name in sorted(bucket.objects) if name.startswith(prefix)]
+
+    def read(self, gcs_uri):
+        """Bytes stored at a gs:// URI, or None (no latency; used by the other fakes)."""
+        bucket_name, _, name = gcs_uri[len("gs://"):].partition("/")
+        bucket = self.buckets.get(bucket_name)
+        return bucket.objects.get(name) if bucket else None
+
+
+# ---- Document AI ----
+
+_PAGE_OBJECT = re.compile(rb"/Type\s*/Page\b(?!s)")
+
+
+class FakeDocumentAIClient:
+    """
+    Answers process_document with a synthetic Document of the requested pages.
+
+    The page count of a whole-document request comes from the PDF in `storage`
+    (counted the way a PDF reader would) and falls back to `pages`. Each call
+    sleeps latency + page_latency * pages. Documents are built once per size.
+    """
+
+    def __init__(self, storage=None, pages=20, latency=0.0, page_latency=0.0, fields_per_page=5):
+        self.storage = storage
+        self.pages = pages
+        self.latency = latency
+        self.page_latency = page_latency
+        self.fields_per_page = fields_per_page
+        self.calls = 0
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def document(self, pages):
+        with self._lock:
+            document = self._documents.get(pages)
+            if document is None:
+                document = self._documents[pages] = make_document(pages, fields_per_page=self.fields_per_page)
+            return document
+
+    def page_count(self, gcs_uri):
+        data = self.storage.read(gcs_uri) if self.storage is not None else None
+        if data is None:
+            return self.pages
+        return len(_PAGE_OBJECT.findall(data)) or self.pages
+
+    def process_document(self, request):
+        self.calls += 1
+        selected = list(request.process_options.individual_page_selector.pages)
+        pages = len(selected) or self.page_count(request.gcs_document.gcs_uri)
+        time.sleep(self.latency + self.page_latency * pages)
+        return SimpleNamespace(document=self.document(pages))
+
+
+# ---- Gemini (google-genai) ----
+
+class _FakeModels:
+    def __init__(self, fake):
+        self.fake = fake
+
+    def generate_content_stream(self, model, contents, config=None):
+        fake = self.fake
+        fake.calls += 1
+        time.sleep(fake.first_chunk_latency)
+        for i, chunk in enumerate(fake.chunks):
+            if i:
+                time.sleep(fake.chunk_interval)
+            yield chunk
+
+    def generate_content(self, model, contents, config=None):
+        self.fake.calls += 1
+        time.sleep(self.fake.first_chunk_latency)
+        return self.fake.response(ANSWER)
+
+    def embed_content(self, model, contents):
+        self.fake.calls += 1
+        time.sleep(self.fake.embed_latency)
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=self.fake.embed(text)) for text in texts])
+
+
+class _FakeAsyncModels:
+    def __init__(self, fake):
+        self.fake = fake
+
+    async def generate_content_stream(self, model, contents, config=None):
+        fake = self.fake
+        fake.calls += 1
+
+        async def stream():
+            await asyncio.sleep(fake.first_chunk_latency)
+            for i, chunk in enumerate(fake.chunks):
+                if i:
+                    await asyncio.sleep(fake.chunk_interval)
+                yield chunk
+
+        return stream()
+
+    async def generate_content(self, model, contents, config=None):
+        self.fake.calls += 1
+        await asyncio.sleep(self.fake.first_chunk_latency)
+        return self.fake.response(ANSWER)
+
+
+class _FakeCaches:
+    def __init__(self, fake):
+        self.fake = fake
+        self.created = 0
+
+    def create(self, model, config=None):
+        self.created += 1
+        time.sleep(self.fake.first_chunk_latency)
+        return SimpleNamespace(name=f"cachedContents/fake-{self.created}")
+
+    def update(self, name, config=None):
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        return None
+
+
+class FakeGenAIClient:
+    """
+    google-genai client whose streams yield ANSWER in `chunks` pieces: the
+    first after first_chunk_latency, the rest every chunk_interval seconds.
+    The last chunk carries usage metadata, as the real API's does.
+    """
+
+    def __init__(self, first_chunk_latency=0.0, chunk_interval=0.0, chunks=8, embed_latency=0.0, dim=64):
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.embed_latency = embed_latency
+        self.dim = dim
+        self.calls = 0
+        pieces = _split(ANSWER, chunks)
+        self.chunks = [self.response(piece, usage=i == len(pieces) - 1) for i, piece in enumerate(pieces)]
+        self.models = _FakeModels(self)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self))
+        self.caches = _FakeCaches(self)
+
+    @staticmethod
+    def response(text, usage=True):
+        metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=1000, candidates_token_count=len(ANSWER.split()), total_token_count=1000 + len(ANSWER.split()),
+        ) if usage else None
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+            usage_metadata=metadata,
+        )
+
+    def embed(self, text):
+        vector = [0.0] * self.dim
+        for word in str(text).split():
+            vector[_digest(word.lower()) % self.dim] += 1.0
+        return vector
+
+
+# ---- Precedent model (vertexai) ----
+
+class FakeGenerativeModel:
+    """
+    vertexai GenerativeModel for Precedent. Plain prompts get a markdown list;
+    JSON requests get records (PRECEDENT_SCHEMA) or one answer per "Clause N:"
+    (the batch schema). Answers are derived from the prompt, so they repeat
+    across runs. Each call sleeps latency + per_clause per clause.
+    """
+
+    def __init__(self, latency=0.0, per_clause=0.0):
+        self.latency = latency
+        self.per_clause = per_clause
+        self.calls = 0
+
+    def _answer(self, prompt, generation_config):
+        self.calls += 1
+        seed = _digest(prompt)
+        schema = (generation_config or {}).get("response_schema") or {}
+        fields = schema.get("items", {}).get("properties", {})
+        if "clause_id" in fields:
+            ids = [int(i) for i in re.findall(r"^\s*Clause (\d+):", prompt, re.M)]
+            text = json.dumps([{"clause_id": i, "precedents": self._markdown(seed + i)} for i in ids])
+            return text, len(ids)
+        if "case_name" in fields:
+            return json.dumps(self._records(seed)), 1
+        return self._markdown(seed), 1
+
+    @staticmethod
+    def _records(seed, count=3):
+        return [{
+            "case_name": f"{WORDS[(seed + i) % len(WORDS)].title()} v {WORDS[(seed + 3 * i + 1) % len(WORDS)].title()}",
+            "citation": f"{(seed + i) % 900 + 100} U.S. {(seed >> 8) % 900 + 1}",
+            "year": 1950 + (seed + i) % 70,
+            "court": "Supreme Court",
+            "relevance": "The clause raises the same question of notice and termination decided in this case.",
+            "principle": "A termination clause is enforced as written when notice is given.",
+        } for i in range(count)]
+
+    def _markdown(self, seed):
+        return "\n\n".join(
+            f"{i}. **{r['case_name']}**, {r['citation']} ({r['year']})\n   - Court: {r['court']}\n"
+            f"   - Relevance: {r['relevance']}\n   - Key Principle: {r['principle']}"
+            for i, r in enumerate(self._records(seed), 1)
+        )
+
+    def _response(self, text):
+        usage = SimpleNamespace(prompt_token_count=800, candidates_token_count=len(text) // 4, cached_content_token_count=0)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, prompt, generation_config=None):
+        text, clauses = self._answer(prompt, generation_config)
+        time.sleep(self.latency + self.per_clause * clauses)
+        return self._response(text)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        text, clauses = self._answer(prompt, generation_config)
+        await asyncio.sleep(self.latency + self.per_clause * clauses)
+        return self._response(text)
+
+
+def install_fakes(pages=20, gcs_latency=0.0, ocr_latency=0.0, ocr_page_latency=0.0,
+                  model_latency=0.0, chunk_interval=0.0, chunks=8, per_clause=0.0):
+    """
+    Route every Google client through the fakes; returns them as a namespace
+    (storage, documentai, genai, generative_model) for seeding and call counts.
+    """
+    storage = FakeStorageClient(gcs_latency)
+    fakes = SimpleNamespace(
+        storage=storage,
+        documentai=FakeDocumentAIClient(storage, pages, ocr_latency, ocr_page_latency),
+        genai=FakeGenAIClient(model_latency, chunk_interval, chunks),
+        generative_model=FakeGenerativeModel(model_latency, per_clause),
+    )
+    for kind, instance in vars(fakes).items():
+        override_client(kind, instance)
+    return fakes
+
+
+def remove_fakes():
+    reset_clients()
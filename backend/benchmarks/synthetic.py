@@ -0,0 +1,92 @@
+"""
+Synthetic Document AI protos and PDFs for benchmarks.
+
+make_document builds a documentai.Document the way the OCR processor lays
+one out: a single document.text with pages, lines and form fields pointing
+into it through text anchors. make_pdf builds a (blank) PDF with a given
+number of pages, enough for pikepdf to count them.
+"""
+
+from google.cloud import documentai
+
+Document = documentai.Document
+
+WORDS = (
+    "agreement party shall terminate notice clause liability indemnify breach "
+    "payment rent tenant landlord governing law jurisdiction damages warranty"
+).split()
+
+
+def _anchor(start, end):
+    return Document.TextAnchor(text_segments=[Document.TextAnchor.TextSegment(start_index=start, end_index=end)])
+
+
+def make_page_text(page_number, lines_per_page=40, words_per_line=12):
+    lines = []
+    for line in range(lines_per_page):
+        words = [WORDS[(page_number * 7 + line * 3 + w) % len(WORDS)] for w in range(words_per_line)]
+        if line % 10 == 0:
+            lines.append(f"{page_number}.{line // 10 + 1} {' '.join(words[:4]).upper()}")
+        else:
+            lines.append(" ".join(words) + ".")
+    return "\n".join(lines) + "\n"
+
+
+def make_document(pages=100, fields_per_page=20, lines_per_page=40):
+    """
+    Build a synthetic Document.
+
+    Args:
+        pages (int): Number of pages.
+        fields_per_page (int): Form fields (name/value pairs) per page.
+        lines_per_page (int): Text lines per page; every 10th line looks like a heading.
+
+    Returns:
+        documentai.Document
+    """
+    texts = []
+    page_protos = []
+    offset = 0
+    for page_number in range(1, pages + 1):
+        page_text = make_page_text(page_number, lines_per_page)
+        fields = []
+        field_text = []
+        field_offset = offset + len(page_text)
+        for f in range(fields_per_page):
+            name, value = f"Field {page_number}-{f}:", f"value {f} "
+            fields.append(Document.Page.FormField(
+                field_name=Document.Page.Layout(text_anchor=_anchor(field_offset, field_offset + len(name)), confidence=0.9),
+                field_value=Document.Page.Layout(
+                    text_anchor=_anchor(field_offset + len(name), field_offset + len(name) + len(value)), confidence=0.8
+                ),
+            ))
+            field_text.append(name + value)
+            field_offset += len(name) + len(value)
+        page_text += "".join(field_text)
+        page_protos.append(Document.Page(
+            page_number=page_number,
+            layout=Document.Page.Layout(text_anchor=_anchor(offset, offset + len(page_text)), confidence=0.95),
+            detected_languages=[Document.Page.DetectedLanguage(language_code="en", confidence=0.99)],
+            form_fields=fields,
+        ))
+        texts.append(page_text)
+        offset += len(page_text)
+    return Document(text="".join(texts), pages=page_protos, mime_type="application/pdf")
+
+
+def make_pdf(pages=10):
+    """Bytes of a minimal valid PDF with `pages` blank pages."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * pages
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
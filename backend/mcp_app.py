@@ -1,12 +1,18 @@
 # mcp_app.py
+import argparse
 import base64
+import importlib
+import json
 import logging
 import os
-from typing import Optional
+import re
+import sys
+from types import SimpleNamespace
+from typing import List, Optional
 
 from fastapi import FastAPI, Request
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 
 # ---- Logging ----
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -14,46 +20,248 @@ logger = logging.getLogger("mcp_app")
 
 # ---- Try optional imports ----
 try:
-    from fastmcp import FastMCP
+    from fastmcp import FastMCP, Context
 except Exception as e:
     FastMCP = None
+    Context = None
     logger.warning("fastmcp import failed: %s", e)
 
-try:
-    from google.cloud import storage
-except Exception as e:
-    storage = None
-    logger.warning("google.cloud.storage import failed: %s", e)
+from Class.clients import PROJECT_ID, get_storage_client
+from Class.concurrency import run_blocking, tool_slot
+from Class import metrics, resilience, tracing
+from Class.metrics import upstream
+from Class import doc_store, pipeline, retrieval, uploads
+from Class.answer_cache import answer_cache_stats, get_answer_cache
+from Class.cassettes import cassette_stats
+from Class.prompts import normalize_jurisdiction
+from Class.clauses import segment_clauses
+from Class.Precedent import clause_key
+from Class.sessions import sessions
+
+# ---- Tool backends ----
+# Backends are imported on first use rather than at startup: Class.OCR,
+# Class.Precedent and Class.chat pull in the Google SDKs (and
+# Class.precedent_index numpy and Class.Precedent), which dominates
+# cold-start time on Cloud Run. A backend that fails to import is replaced
+# by a stub so the rest of the server keeps working.
+_backends = {}
 
-try:
-    from Class.chat import automated_chat
-except Exception:
-    logger.warning("automated_chat import failed, using stub")
 
+def _stub_chat():
     def automated_chat(question: str, file_path: str = None, stream_response: bool = False, chat_history=None):
         return {"stub": True, "question": question, "file_path": file_path}
 
-try:
-    from Class.OCR import process_pdf_with_document_ai
-except Exception:
-    logger.warning("OCR import failed, using stub")
+    async def aautomated_chat(question: str, file_path: str = None, chat_history=None):
+        return automated_chat(question, file_path=file_path, chat_history=chat_history)
+
+    async def astream_chat(question: str, file_path: str = None, chat_history=None):
+        yield str(automated_chat(question, file_path=file_path, chat_history=chat_history))
+
+    def context_cache_stats():
+        return None
+
+    return SimpleNamespace(
+        automated_chat=automated_chat,
+        aautomated_chat=aautomated_chat,
+        astream_chat=astream_chat,
+        context_cache_stats=context_cache_stats,
+    )
 
-    def process_pdf_with_document_ai(gcs_uri: str):
+
+def _stub_ocr():
+    def process_pdf_with_document_ai(gcs_uri: str, use_cache: bool = True, page_count: Optional[int] = None):
         return {"success": False, "error": "OCR module not available", "full_text": "", "pages": [], "form_fields": [], "confidence_score": None}
 
-try:
-    from Class.Precedent import find_precedents
-except Exception:
-    logger.warning("Precedent import failed, using stub")
+    def ocr_cache_stats():
+        return None
+
+    def start_batch_process(gcs_uri: str, output_uri: str = None):
+        raise RuntimeError("OCR module not available")
+
+    def fetch_batch_result(job_id: str, use_cache: bool = True):
+        return {"success": False, "error": "OCR module not available", "job_id": job_id}
+
+    def cached_ocr_result(gcs_uri: str):
+        return None
+
+    def iter_pdf_pages(gcs_uri: str, use_cache: bool = True, page_count: Optional[int] = None):
+        raise RuntimeError("OCR module not available")
+
+    def get_content_hash(gcs_uri: str):
+        # Only content-addressed URIs can be identified without GCS metadata
+        sha256 = doc_store.sha256_from_uri(gcs_uri)
+        return f"sha256:{sha256}" if sha256 else None
+
+    return SimpleNamespace(
+        process_pdf_with_document_ai=process_pdf_with_document_ai,
+        ocr_cache_stats=ocr_cache_stats,
+        start_batch_process=start_batch_process,
+        fetch_batch_result=fetch_batch_result,
+        cached_ocr_result=cached_ocr_result,
+        iter_pdf_pages=iter_pdf_pages,
+        get_content_hash=get_content_hash,
+    )
 
+
+def _stub_precedent():
     def find_precedents(user_clause: str, location: str = "US") -> str:
         return "Precedent module not available. Please check the Precedent.py file and dependencies."
 
+    async def afind_precedents(user_clause: str, location: str = "US") -> str:
+        return find_precedents(user_clause, location)
+
+    async def afind_precedents_batch(clauses, location: str = "US", concurrency: int = 8) -> dict:
+        return {" ".join(c.split()): find_precedents(c, location) for c in clauses if c and c.strip()}
+
+    async def afind_precedents_structured(user_clause: str, location: str = "US") -> dict:
+        return {"error": find_precedents(user_clause, location)}
+
+    return SimpleNamespace(
+        find_precedents=find_precedents,
+        afind_precedents=afind_precedents,
+        afind_precedents_batch=afind_precedents_batch,
+        afind_precedents_structured=afind_precedents_structured,
+    )
+
+
+def _stub_precedent_index():
+    # Without the index every clause simply goes to the model
+    return SimpleNamespace(get_precedent_index=lambda: None, precedent_index_stats=lambda: None)
+
+
+_BACKEND_STUBS = {
+    "Class.chat": _stub_chat,
+    "Class.OCR": _stub_ocr,
+    "Class.Precedent": _stub_precedent,
+    "Class.precedent_index": _stub_precedent_index,
+}
+
+
+def _backend(module_name: str):
+    backend = _backends.get(module_name)
+    if backend is None:
+        try:
+            backend = importlib.import_module(module_name)
+        except Exception:
+            logger.warning("%s import failed, using stub", module_name)
+            backend = _BACKEND_STUBS[module_name]()
+        _backends[module_name] = backend
+    return backend
+
+
+def _is_stub(module_name: str) -> bool:
+    return isinstance(_backends.get(module_name), SimpleNamespace)
+
+def automated_chat(question: str, file_path: str = None, stream_response: bool = False, chat_history=None):
+    return _backend("Class.chat").automated_chat(question, file_path=file_path, stream_response=stream_response, chat_history=chat_history)
+
+async def aautomated_chat(question: str, file_path: str = None, chat_history=None):
+    return await _backend("Class.chat").aautomated_chat(question, file_path=file_path, chat_history=chat_history)
+
+def astream_chat(question: str, file_path: str = None, chat_history=None):
+    return _backend("Class.chat").astream_chat(question, file_path=file_path, chat_history=chat_history)
+
+def context_cache_stats():
+    if "Class.chat" not in _backends:
+        return None
+    return _backend("Class.chat").context_cache_stats()
+
+def process_pdf_with_document_ai(gcs_uri: str, use_cache: bool = True, page_count: Optional[int] = None):
+    return _backend("Class.OCR").process_pdf_with_document_ai(gcs_uri, use_cache=use_cache, page_count=page_count)
+
+def ocr_cache_stats():
+    # Don't import OCR just to report on it
+    if "Class.OCR" not in _backends:
+        return None
+    return _backend("Class.OCR").ocr_cache_stats()
+
+def start_batch_process(gcs_uri: str):
+    return _backend("Class.OCR").start_batch_process(gcs_uri)
+
+def fetch_batch_result(job_id: str):
+    return _backend("Class.OCR").fetch_batch_result(job_id)
+
+def cached_ocr_result(gcs_uri: str):
+    return _backend("Class.OCR").cached_ocr_result(gcs_uri)
+
+def iter_pdf_pages(gcs_uri: str, page_count: Optional[int] = None):
+    return _backend("Class.OCR").iter_pdf_pages(gcs_uri, page_count=page_count)
+
+def get_content_hash(gcs_uri: str):
+    return _backend("Class.OCR").get_content_hash(gcs_uri)
+
+def find_precedents(user_clause: str, location: str = "US") -> str:
+    return _backend("Class.Precedent").find_precedents(user_clause, location)
+
+async def afind_precedents(user_clause: str, location: str = "US") -> str:
+    return await _backend("Class.Precedent").afind_precedents(user_clause, location)
+
+async def afind_precedents_batch(clauses: List[str], location: str = "US", concurrency: Optional[int] = None) -> dict:
+    backend = _backend("Class.Precedent")
+    if concurrency is None:
+        return await backend.afind_precedents_batch(clauses, location)
+    return await backend.afind_precedents_batch(clauses, location, concurrency=concurrency)
+
+async def afind_precedents_structured(user_clause: str, location: str = "US") -> dict:
+    return await _backend("Class.Precedent").afind_precedents_structured(user_clause, location)
+
+def get_precedent_index():
+    return _backend("Class.precedent_index").get_precedent_index()
+
+def precedent_index_stats():
+    # Loading the index pulls in numpy and Class.Precedent; only report it once a tool has
+    if "Class.precedent_index" not in _backends:
+        return None
+    return _backend("Class.precedent_index").precedent_index_stats()
+
 # ---- MCP Setup ----
 MCP_NAME = os.getenv("MCP_NAME", "LegalDemystifierMCP")
 mcp = FastMCP(MCP_NAME) if FastMCP else None
 mcp_asgi = mcp.http_app(path="/", transport="streamable-http") if mcp else None
 
+def _http_trace_parent():
+    """
+    Span context of the HTTP request carrying the current MCP call: the span
+    log_mcp_headers opened, else the client's traceparent header.
+    """
+    try:
+        from fastmcp.server.dependencies import get_http_request
+        request = get_http_request()
+    except Exception:
+        return None
+    return getattr(request.state, "trace_parent", None) or tracing.parse_traceparent(request.headers.get("traceparent"))
+
+if mcp:
+    from fastmcp.server.middleware import Middleware
+
+    class ToolTelemetryMiddleware(Middleware):
+        """
+        Traces, counts and times every tool call. Tools report failures as
+        {"error": ...} or {"success": False} rather than raising, so those
+        count as errors too. Upstream calls made for the tool share its
+        deadline (TOOL_DEADLINE_SECONDS).
+        """
+
+        async def on_call_tool(self, context, call_next):
+            tool = context.message.name
+            try:
+                session_id = context.fastmcp_context.session_id
+            except Exception:
+                session_id = None
+            with tracing.span(f"mcp.tool {tool}", parent=_http_trace_parent(),
+                              **{"mcp.tool": tool, "mcp.session_id": session_id}) as active:
+                logger.info("[mcp tool] %s mcp-session-id=%s trace_id=%s",
+                            tool, session_id, active.trace_id if active else None)
+                with metrics.track_tool(tool) as failed, resilience.deadline(resilience.TOOL_DEADLINE_SECONDS):
+                    result = await call_next(context)
+                    content = result.structured_content
+                    failed[0] = isinstance(content, dict) and (bool(content.get("error")) or content.get("success") is False)
+                    if failed[0] and active is not None:
+                        active.set_attribute("error", str(content.get("error")))
+                    return result
+
+    mcp.add_middleware(ToolTelemetryMiddleware())
+
 # ---- Parent FastAPI app ----
 app = FastAPI(
     title="LegalDemystifier Backend",
@@ -85,90 +293,300 @@ else:
     logger.warning("MCP not initialized; skipping mount.")
 
 # ---- Upload Helper ----
+@tracing.traced()
 def upload_blob_and_get_uri(bucket_name: str, source_file_name: str, destination_blob_name: str, project_id: Optional[str] = None):
-    if storage is None:
-        raise RuntimeError("google.cloud.storage not available.")
-    client = storage.Client(project=project_id) if project_id else storage.Client()
+    client = get_storage_client(project_id)
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
+    with upstream("gcs", "upload"):
+        resilience.call("gcs", blob.upload_from_filename, source_file_name)
     return f"gs://{bucket_name}/{destination_blob_name}"
 
 # ---- MCP Tools ----
 os.makedirs("uploads", exist_ok=True)
 
+# Client-supplied content hashes are used in object names and alias keys
+_SHA256 = re.compile(r"[0-9a-fA-F]{64}")
+
 if mcp:
 
+    def _session_owner(ctx) -> Optional[str]:
+        """MCP session id the filename aliases of an upload belong to (None outside a session)."""
+        try:
+            return ctx.session_id if ctx is not None else None
+        except Exception:
+            return None
+
+    def _store_upload(filename: str, file_data: str, bucket_name: Optional[str], owner: Optional[str] = None) -> dict:
+        if "," in file_data and file_data.startswith("data:"):
+            file_data = file_data.split(",", 1)[1]
+        raw = base64.b64decode(file_data)
+
+        try:
+            bucket = bucket_name or os.getenv("BUCKET_NAME") or "legal-doc-bucket1"
+            stored = doc_store.store_pdf(raw, filename, bucket, PROJECT_ID, owner=owner)
+            logger.info(f"PDF stored in GCS: {stored['gcs_uri']} (deduplicated={stored['deduplicated']})")
+            return {"message": "File uploaded to GCS", **stored}
+        except Exception as gcs_error:
+            logger.warning(f"GCS upload failed, using local file: {gcs_error}")
+            # Fallback for local-only mode if GCS fails
+            stored = doc_store.store_pdf_locally(raw, filename, owner=owner)
+            logger.info(f"PDF saved locally: {stored['local_path']}")
+            return {"message": "File saved locally", **stored}
+
     @mcp.tool
-    def upload_pdf(filename: str, file_data: str, bucket_name: Optional[str] = None) -> dict:
+    async def upload_pdf(filename: str, file_data: str, bucket_name: Optional[str] = None,
+                         ctx: Context = None) -> dict:
+        """
+        Upload a PDF (base64). Files are stored under their SHA-256, so re-uploading
+        the same content skips the transfer and returns the same gcs_uri.
+        """
         try:
             logger.info(f"upload_pdf called with filename: {filename}")
             if not filename.lower().endswith(".pdf"):
                 return {"error": "Only PDFs allowed"}
-            if "," in file_data and file_data.startswith("data:"):
-                file_data = file_data.split(",", 1)[1]
-            raw = base64.b64decode(file_data)
-            local_path = os.path.join("uploads", filename)
-            with open(local_path, "wb") as f:
-                f.write(raw)
-            
-            logger.info(f"PDF saved locally: {local_path}")
-
-            try:
-                bucket = bucket_name or os.getenv("BUCKET_NAME") or "legal-doc-bucket1"
-                project = os.getenv("PROJECT_ID") or "sodium-coil-470706-f4"
-                gcs_uri = upload_blob_and_get_uri(bucket, local_path, filename, project)
-                logger.info(f"PDF uploaded to GCS: {gcs_uri}")
-                return {"message": "File uploaded to GCS", "gcs_uri": gcs_uri}
-            except Exception as gcs_error:
-                logger.warning(f"GCS upload failed, using local file: {gcs_error}")
-                # Fallback for local-only mode if GCS fails
-                return {"message": "File saved locally", "local_path": local_path}
+            # Decoding, hashing and the GCS client are all blocking
+            async with tool_slot("upload_pdf"):
+                return await run_blocking(_store_upload, filename, file_data, bucket_name, _session_owner(ctx))
             
         except Exception as e:
             logger.exception("upload_pdf failed")
             return {"error": str(e)}
 
     @mcp.tool
-    def pdf_qa(question: str, gsUri: str = None) -> dict:
+    async def lookup_document(filename: str, ctx: Context = None) -> dict:
+        """Return the URI and SHA-256 of the document this session last uploaded under filename."""
+        try:
+            alias = await run_blocking(doc_store.resolve_alias, filename, _session_owner(ctx))
+            if alias is None:
+                return {"error": f"No document uploaded as {filename}"}
+            return {"filename": filename, **alias}
+        except Exception as e:
+            logger.exception("lookup_document failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def start_upload(filename: str, bucket_name: Optional[str] = None, sha256: Optional[str] = None,
+                           ctx: Context = None) -> dict:
         """
-        Processes a question about a PDF and ensures the response is a dictionary.
+        Begin a chunked upload for a large PDF. Send the file as base64 text split into
+        parts with upload_chunk (in order, starting at index 0), then call finish_upload.
+        Parts may be any length; each is decoded and streamed to GCS as it arrives.
+        If the client passes the file's sha256 and that content is already stored,
+        the existing gcs_uri is returned straight away and no parts need to be sent.
+
+        Returns:
+            dict: Contains upload_id and a suggested chunk_size (decoded bytes per part),
+                  or gcs_uri with deduplicated=True
         """
         try:
-            logger.info(f"pdf_qa called with question: {question[:100]}... gsUri: {gsUri}")
-            if not question:
-                return {"error": "question required"}
-            
-            result = automated_chat(question, file_path=gsUri, stream_response=True, chat_history=None)
-            
+            logger.info(f"start_upload called with filename: {filename}")
+            if not filename.lower().endswith(".pdf"):
+                return {"error": "Only PDFs allowed"}
+            bucket = bucket_name or os.getenv("BUCKET_NAME") or "legal-doc-bucket1"
+            if sha256 and not _SHA256.fullmatch(sha256):
+                return {"error": "sha256 must be 64 hexadecimal characters"}
+            if sha256:
+                try:
+                    existing = await run_blocking(doc_store.find_existing, bucket, sha256, PROJECT_ID)
+                except Exception as e:
+                    logger.warning(f"Dedup lookup failed, uploading anyway: {e}")
+                    existing = None
+                if existing:
+                    await run_blocking(doc_store.remember_alias, filename, sha256.lower(), existing, _session_owner(ctx))
+                    return {"message": "File already stored", "gcs_uri": existing, "sha256": sha256.lower(), "deduplicated": True}
+            session = uploads.start_upload(filename, bucket, project_id=PROJECT_ID, owner=_session_owner(ctx))
+            return {"upload_id": session.upload_id, "chunk_size": uploads.UPLOAD_CHUNK_SIZE}
+        except Exception as e:
+            logger.exception("start_upload failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def upload_chunk(upload_id: str, index: int, chunk_data: str) -> dict:
+        """
+        Append one base64 part to a chunked upload. Re-sending an already received
+        index is a no-op, so a failed call can be retried.
+        """
+        try:
+            session = uploads.get_upload(upload_id)
+            async with tool_slot("upload_chunk"):
+                received = await run_blocking(session.write_chunk, index, chunk_data)
+            return {"upload_id": upload_id, "next_index": session.next_index, "bytes_received": received}
+        except uploads.UploadError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            logger.exception("upload_chunk failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def finish_upload(upload_id: str) -> dict:
+        """
+        Complete a chunked upload. Returns the same shape as upload_pdf
+        (gcs_uri, or local_path when GCS is unavailable).
+        """
+        try:
+            async with tool_slot("upload_chunk"):
+                result = await run_blocking(uploads.finish_upload, upload_id)
+            logger.info(f"Chunked upload {upload_id} finished: {result}")
+            return result
+        except uploads.UploadError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            logger.exception("finish_upload failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def abort_upload(upload_id: str) -> dict:
+        """Cancel a chunked upload and discard the parts received so far."""
+        try:
+            await run_blocking(uploads.abort_upload, upload_id)
+            return {"upload_id": upload_id, "aborted": True}
+        except Exception as e:
+            logger.exception("abort_upload failed")
+            return {"error": str(e)}
+
+    # Answer from the top-k OCR chunks instead of attaching the whole PDF
+    PDF_QA_RETRIEVAL = os.getenv("PDF_QA_RETRIEVAL", "0") == "1"
+    # Keep per-client conversation history between pdf_qa calls (keyed by mcp-session-id)
+    CHAT_SESSIONS = os.getenv("CHAT_SESSIONS", "1") == "1"
+
+    def _retrieve(question: str, gsUri: str):
+        # OCR (cached per document) -> chunk index (cached per document) -> top-k chunks
+        result = process_pdf_with_document_ai(gsUri)
+        if not result["success"] or not result["pages"]:
+            logger.warning(f"Retrieval unavailable for {gsUri}: {result.get('error')}")
+            return None
+        index = retrieval.get_document_index(doc_store.sha256_from_uri(gsUri) or gsUri, result)
+        chunks = index.search(question)
+        if not chunks:
+            return None
+        return retrieval.build_retrieval_prompt(question, chunks), retrieval.citations(chunks)
+
+    async def _stream_answer(question: str, gsUri: Optional[str], ctx, chat_history=None) -> dict:
+        # Each chunk goes out as a progress notification (message = chunk text)
+        # as soon as the model produces it; the final result still carries the
+        # whole answer so the response shape matches the non-streaming mode.
+        chunks = []
+        async for chunk in astream_chat(question, file_path=gsUri, chat_history=chat_history):
+            chunks.append(chunk)
+            await ctx.report_progress(progress=len(chunks), message=chunk)
+        return {"answer": "".join(chunks), "streamed": True, "chunks": len(chunks)}
+
+    async def _generate_answer(question: str, gsUri: Optional[str], stream: bool, use_retrieval: bool,
+                               history, ctx) -> dict:
+        prompt, file_path, cited = question, gsUri, None
+        if use_retrieval and gsUri and gsUri.startswith("gs://"):
+            async with tool_slot("extract_text_from_pdf"):
+                retrieved = await run_blocking(_retrieve, question, gsUri)
+            if retrieved:
+                (prompt, cited), file_path = retrieved, None
+                logger.info(f"pdf_qa answering from {len(cited)} retrieved chunks")
+
+        if stream and ctx is not None:
+            async with tool_slot("pdf_qa"):
+                response = await _stream_answer(prompt, file_path, ctx, chat_history=history)
+        else:
+            async with tool_slot("pdf_qa"):
+                result = await aautomated_chat(prompt, file_path=file_path, chat_history=history)
+
             # --- FIX IS HERE ---
             # Ensure the final output is always a dictionary.
             if isinstance(result, dict):
                 # If the result is already a dict, ensure it has the 'answer' key for consistency
                 if 'answer' in result:
-                    return result
-                # Try to find a common response key, otherwise convert the whole dict to a string
-                raw_answer = result.get('response') or result.get('text') or str(result)
-                return {"answer": raw_answer}
+                    response = result
+                else:
+                    # Try to find a common response key, otherwise convert the whole dict to a string
+                    raw_answer = result.get('response') or result.get('text') or str(result)
+                    response = {"answer": raw_answer}
             elif isinstance(result, str):
                 # If the result is a string, wrap it in a dictionary
-                return {"answer": result}
+                response = {"answer": result}
             else:
                 # For any other data type, convert to string and wrap
-                return {"answer": str(result)}
+                response = {"answer": str(result)}
+
+        if cited is not None:
+            response["citations"] = cited
+        return response
+
+    def _cache_info(entry: dict) -> dict:
+        return {"match": entry["match"], "similarity": entry["similarity"], "provenance": entry["provenance"]}
+
+    @mcp.tool
+    async def pdf_qa(question: str, gsUri: str = None, stream: bool = False,
+                     use_retrieval: Optional[bool] = None, ctx: Context = None) -> dict:
+        """
+        Processes a question about a PDF and ensures the response is a dictionary.
+        With stream=True, answer chunks are also sent as progress notifications while
+        the model is generating (the client must send a progressToken to receive them).
+        With use_retrieval=True (default: PDF_QA_RETRIEVAL env), only the most relevant
+        OCR'd passages are sent to the model and the answer carries page citations.
+        Follow-up questions in the same MCP session see the earlier conversation
+        and default to the session's last gsUri.
+        Opening questions that were already answered for the same document are
+        served from the answer cache (the response then includes "cached").
+        """
+        try:
+            logger.info(f"pdf_qa called with question: {question[:100]}... gsUri: {gsUri}")
+            if not question:
+                return {"error": "question required"}
+
+            session, history = None, None
+            if CHAT_SESSIONS and ctx is not None:
+                session = sessions.get(ctx.session_id)
+                history = session.history(gsUri)
+                # Follow-up questions may omit gsUri
+                gsUri = gsUri or session.document
+
+            # Follow-ups depend on the conversation, so only opening questions are cached.
+            # Answers are scoped to the document's content hash, so an overwritten object
+            # gets fresh answers; without a hash nothing is cached.
+            answers, scope = None, None
+            if gsUri and not history:
+                try:
+                    scope = await run_blocking(get_content_hash, gsUri)
+                except Exception:
+                    logger.warning(f"No content hash for {gsUri}; answer cache skipped", exc_info=True)
+                if scope:
+                    answers = get_answer_cache("qa")
+            cached = await run_blocking(answers.lookup, scope, question) if answers else None
+
+            if cached is not None:
+                logger.info(f"pdf_qa answer cache hit ({cached['match']})")
+                response = {"answer": cached["answer"], "cached": _cache_info(cached)}
+                if cached["provenance"].get("citations") is not None:
+                    response["citations"] = cached["provenance"]["citations"]
+                if stream and ctx is not None:
+                    await ctx.report_progress(progress=1, message=cached["answer"])
+            else:
+                if use_retrieval is None:
+                    use_retrieval = PDF_QA_RETRIEVAL
+                response = await _generate_answer(question, gsUri, stream, use_retrieval, history, ctx)
+                if (answers is not None and isinstance(response.get("answer"), str) and response["answer"]
+                        and not _is_stub("Class.chat")):
+                    await run_blocking(answers.store, scope, question, response["answer"], source="pdf_qa",
+                                       document=gsUri, citations=response.get("citations"))
+
+            if session is not None and isinstance(response.get("answer"), str):
+                # Compaction may call the model to summarize, so keep it off the event loop
+                await run_blocking(session.record, question, response["answer"])
+            return response
                 
         except Exception as e:
             logger.exception("pdf_qa failed")
             return {"error": str(e)}
 
     @mcp.tool
-    def extract_text_from_pdf(gcs_uri: str) -> dict:
+    async def extract_text_from_pdf(gcs_uri: str, page_count: Optional[int] = None) -> dict:
         """
         Extract text from a PDF document stored in Google Cloud Storage using Document AI.
         Returns structured text data with page-wise breakdown and form fields.
+        Long documents are OCR'd as page ranges in parallel.
         
         Args:
             gcs_uri: The GCS URI of the PDF file (e.g., 'gs://bucket-name/file.pdf')
+            page_count: Number of pages, if the client knows it (saves a lookup)
             
         Returns:
             dict: Contains extracted text, page details, form fields, and confidence score
@@ -183,19 +601,12 @@ if mcp:
                 return {"error": "Invalid GCS URI format. Must start with 'gs://'"}
             
             # Process the PDF using Document AI
-            result = process_pdf_with_document_ai(gcs_uri)
+            async with tool_slot("extract_text_from_pdf"):
+                result = await run_blocking(process_pdf_with_document_ai, gcs_uri, page_count=page_count)
             
             if result["success"]:
                 logger.info(f"OCR processing successful. Extracted {len(result['full_text'])} characters from {len(result['pages'])} pages")
-                return {
-                    "success": True,
-                    "full_text": result["full_text"],
-                    "pages": result["pages"],
-                    "form_fields": result["form_fields"],
-                    "confidence_score": result["confidence_score"],
-                    "total_pages": len(result["pages"]),
-                    "total_characters": len(result["full_text"])
-                }
+                return _ocr_response(result)
             else:
                 logger.error(f"OCR processing failed: {result['error']}")
                 return {"error": result["error"]}
@@ -204,14 +615,103 @@ if mcp:
             logger.exception("extract_text_from_pdf failed")
             return {"error": str(e)}
 
+    def _ocr_response(result: dict) -> dict:
+        return {
+            "success": True,
+            "full_text": result["full_text"],
+            "pages": result["pages"],
+            "form_fields": result["form_fields"],
+            "confidence_score": result["confidence_score"],
+            "total_pages": len(result["pages"]),
+            "total_characters": len(result["full_text"])
+        }
+
     @mcp.tool
-    def find_legal_precedents(clause: str, location: str = "US") -> dict:
+    async def extract_clauses(gcs_uri: str, page_count: Optional[int] = None, max_depth: Optional[int] = None) -> dict:
+        """
+        Split a PDF into its numbered clauses/sections, ready for find_legal_precedents_batch.
+
+        Args:
+            gcs_uri: The GCS URI of the PDF file (e.g., 'gs://bucket-name/file.pdf')
+            page_count: Number of pages, if the client knows it (saves a lookup)
+            max_depth: Only numbering with at most this many levels starts a clause
+                (1 keeps "3.1" inside clause 3)
+
+        Returns:
+            dict: clauses, each with number, heading, text and page/offset references
+        """
+        try:
+            logger.info(f"extract_clauses called with gcs_uri: {gcs_uri}")
+            if not gcs_uri or not gcs_uri.startswith("gs://"):
+                return {"error": "Invalid GCS URI format. Must start with 'gs://'"}
+            async with tool_slot("extract_text_from_pdf"):
+                result = await run_blocking(process_pdf_with_document_ai, gcs_uri, page_count=page_count)
+            if not result["success"]:
+                return {"error": result["error"]}
+            clauses = segment_clauses(result["pages"], max_depth=max_depth)
+            return {"success": True, "clauses": clauses, "total_clauses": len(clauses), "total_pages": len(result["pages"])}
+        except Exception as e:
+            logger.exception("extract_clauses failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def start_batch_ocr(gcs_uri: str) -> dict:
+        """
+        Start OCR of a large PDF as a Document AI batch job instead of a blocking call.
+        Poll get_batch_ocr_result with the returned job_id until state is SUCCEEDED.
+        If the document was OCR'd before, the cached result is returned right away.
+
+        Args:
+            gcs_uri: The GCS URI of the PDF file (e.g., 'gs://bucket-name/file.pdf')
+
+        Returns:
+            dict: Contains job_id and state, or the OCR result when cached
+        """
+        try:
+            logger.info(f"start_batch_ocr called with gcs_uri: {gcs_uri}")
+            if not gcs_uri or not gcs_uri.startswith("gs://"):
+                return {"error": "Invalid GCS URI format. Must start with 'gs://'"}
+
+            async with tool_slot("start_batch_ocr"):
+                cached = await run_blocking(cached_ocr_result, gcs_uri)
+                if cached is not None:
+                    return {**_ocr_response(cached), "job_id": None, "state": "SUCCEEDED", "cached": True}
+                job_id = await run_blocking(start_batch_process, gcs_uri)
+            logger.info(f"Batch OCR started: {job_id}")
+            return {"job_id": job_id, "state": "RUNNING"}
+        except Exception as e:
+            logger.exception("start_batch_ocr failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def get_batch_ocr_result(job_id: str) -> dict:
+        """
+        Poll a batch OCR job. While it runs, returns {"job_id", "state"}; once it has
+        succeeded, returns the same fields as extract_text_from_pdf with shards merged.
+        """
+        try:
+            async with tool_slot("get_batch_ocr_result"):
+                result = await run_blocking(fetch_batch_result, job_id)
+            if result["success"]:
+                return {**_ocr_response(result), "job_id": job_id, "state": result["state"]}
+            if result.get("state") in ("WAITING", "RUNNING", "STATE_UNSPECIFIED", "CANCELLING"):
+                return {"job_id": job_id, "state": result["state"]}
+            logger.error(f"Batch OCR failed: {result['error']}")
+            return {"error": result["error"], "job_id": job_id, "state": result.get("state")}
+        except Exception as e:
+            logger.exception("get_batch_ocr_result failed")
+            return {"error": str(e)}
+
+    @mcp.tool
+    async def find_legal_precedents(clause: str, location: str = "US", structured: bool = False) -> dict:
         """
         Find relevant legal precedents for a given clause and jurisdiction.
         
         Args:
             clause: The legal clause text to find precedents for
             location: The jurisdiction/location (e.g., "US", "California", "India", "UK", "EU")
+            structured: Also return "records", one dict per precedent with case_name, citation,
+                year, court, relevance and principle
             
         Returns:
             dict: Contains the precedents analysis with case names, years, jurisdictions, and relevance explanations
@@ -225,27 +725,97 @@ if mcp:
             if not location or not location.strip():
                 location = "US"  # Default to US if no location provided
             
-            # Call the precedent finding function
-            precedents_result = find_precedents(clause.strip(), location.strip())
-            
-            if precedents_result:
-                logger.info(f"Precedents found successfully for location: {location}")
+            # The same boilerplate clauses come up again and again across contracts
+            answers = get_answer_cache("precedent-records" if structured else "precedents")
+            scope = normalize_jurisdiction(location)
+            cached = await run_blocking(answers.lookup, scope, clause) if answers else None
+            if cached is not None:
+                logger.info(f"Precedent cache hit ({cached['match']}) for location: {location}")
+                response = {
+                    "success": True,
+                    "clause": clause,
+                    "location": location,
+                    "precedents": cached["answer"]["precedents"] if structured else cached["answer"],
+                    "error": None,
+                    "cached": _cache_info(cached),
+                }
+                if structured:
+                    response["records"] = cached["answer"]["records"]
+                return response
+
+            # Clauses close enough to ones analysed before are answered locally
+            # The first call imports numpy and loads the index from disk
+            index = await run_blocking(get_precedent_index)
+            indexed = await run_blocking(index.lookup, clause, location) if index else None
+            if indexed is not None:
+                logger.info(f"Precedent index hit (score {indexed['score']}) for location: {location}")
+                response = {
+                    "success": True,
+                    "clause": clause,
+                    "location": location,
+                    "precedents": indexed["precedents"],
+                    "error": None,
+                    "index": {"score": indexed["score"], "matched_clause": indexed["matched_text"]},
+                }
+                if structured:
+                    response["records"] = indexed["records"]
+                return response
+
+            if structured:
+                async with tool_slot("find_legal_precedents"):
+                    found = await afind_precedents_structured(clause.strip(), location.strip())
+                if "error" in found:
+                    return {
+                        "success": False,
+                        "error": found["error"],
+                        "clause": clause,
+                        "location": location,
+                        "precedents": "",
+                        "records": [],
+                    }
+                records = [record.to_dict() for record in found["records"]]
+                logger.info(f"{len(records)} structured precedents found for location: {location}")
+                # An empty list may be a one-off bad generation; don't pin it in the cache
+                if records and answers is not None:
+                    await run_blocking(answers.store, scope, clause,
+                                       {"records": records, "precedents": found["precedents"]},
+                                       source="find_legal_precedents", location=location)
+                if records and index is not None:
+                    await run_blocking(index.add, [{"text": clause, "location": location, "records": records}])
                 return {
                     "success": True,
                     "clause": clause,
                     "location": location,
-                    "precedents": precedents_result,
+                    "precedents": found["precedents"],
+                    "records": records,
                     "error": None
                 }
-            else:
-                logger.warning("No precedents returned from find_precedents function")
+
+            # Call the precedent finding function
+            async with tool_slot("find_legal_precedents"):
+                precedents_result = await afind_precedents(clause.strip(), location.strip())
+            
+            if _precedents_failed(precedents_result):
+                logger.warning(f"Precedent analysis failed: {precedents_result}")
                 return {
                     "success": False,
-                    "error": "No precedents found or analysis failed",
+                    "error": precedents_result or "No precedents found or analysis failed",
                     "clause": clause,
                     "location": location,
                     "precedents": ""
                 }
+
+            logger.info(f"Precedents found successfully for location: {location}")
+            if answers is not None and _cacheable_precedents(precedents_result):
+                await run_blocking(answers.store, scope, clause, precedents_result,
+                                   source="find_legal_precedents", location=location)
+            return {
+                "success": True,
+                "clause": clause,
+                "location": location,
+                "precedents": precedents_result,
+                "error": None
+            }
                 
         except Exception as e:
             logger.exception("find_legal_precedents failed")
@@ -257,16 +827,201 @@ if mcp:
                 "precedents": ""
             }
 
+    def _precedents_failed(text: str) -> bool:
+        """afind_precedents reports failures (e.g. a 429) as text starting with "Error"."""
+        return not text or text.startswith("Error")
+
+    def _cacheable_precedents(text: str) -> bool:
+        # Errors and "No precedents could be identified" may be one-off; don't pin them in the cache
+        return not _precedents_failed(text) and not text.startswith("No precedents") \
+            and not _is_stub("Class.Precedent")
+
+    async def _lookup_precedents(unique: List[str], location: str, max_concurrency: Optional[int] = None):
+        """
+        Precedents for distinct clause keys: answer cache first, the rest in one backend batch.
+        Returns ({clause: precedents}, {clause: cache info for cached ones}).
+        """
+        answers = get_answer_cache("precedents")
+        scope = normalize_jurisdiction(location)
+        found, cached = {}, {}
+        if answers is not None:
+            for clause in unique:
+                entry = await run_blocking(answers.lookup, scope, clause)
+                if entry is not None:
+                    found[clause] = entry["answer"]
+                    cached[clause] = _cache_info(entry)
+
+        pending = [c for c in unique if c not in found]
+        if pending:
+            async with tool_slot("find_legal_precedents_batch"):
+                fresh = await afind_precedents_batch(pending, location, concurrency=max_concurrency)
+            found.update(fresh)
+            if answers is not None:
+                for clause, text in fresh.items():
+                    if _cacheable_precedents(text):
+                        await run_blocking(answers.store, scope, clause, text,
+                                           source="find_legal_precedents_batch", location=location)
+        return found, cached
+
+    @mcp.tool
+    async def find_legal_precedents_batch(clauses: List[str], location: str = "US",
+                                          max_concurrency: Optional[int] = None) -> dict:
+        """
+        Find legal precedents for many clauses of one contract in a single call.
+        Identical clauses are analysed once, several clauses share one model request,
+        and requests run concurrently.
+
+        Args:
+            clauses: The clause texts
+            location: The jurisdiction shared by all clauses (e.g., "US", "California", "India")
+            max_concurrency: Maximum model requests in flight (default PRECEDENT_BATCH_CONCURRENCY)
+
+        Returns:
+            dict: results, one entry per input clause in order, each shaped like find_legal_precedents
+        """
+        try:
+            logger.info(f"find_legal_precedents_batch called with {len(clauses)} clauses, location: {location}")
+            clauses = [c for c in clauses if c and c.strip()]
+            if not clauses:
+                return {"error": "at least one clause is required"}
+            if not location or not location.strip():
+                location = "US"
+            location = location.strip()
+
+            unique = list(dict.fromkeys(clause_key(c) for c in clauses))
+            found, cached = await _lookup_precedents(unique, location, max_concurrency)
+
+            results = []
+            for clause in clauses:
+                text = found.get(clause_key(clause))
+                failed = _precedents_failed(text)
+                result = {
+                    "success": not failed,
+                    "clause": clause,
+                    "location": location,
+                    "precedents": "" if failed else text,
+                    "error": (text or "No precedents found or analysis failed") if failed else None,
+                }
+                if clause_key(clause) in cached:
+                    result["cached"] = cached[clause_key(clause)]
+                results.append(result)
+            logger.info(f"Batch precedents: {len(unique)} unique clauses, {len(unique) - len(cached)} sent to the model")
+            return {
+                "success": any(r["success"] for r in results),
+                "location": location,
+                "results": results,
+                "unique_clauses": len(unique),
+                "cached_clauses": len(cached),
+            }
+        except Exception as e:
+            logger.exception("find_legal_precedents_batch failed")
+            return {"success": False, "error": f"Batch precedent analysis failed: {str(e)}", "results": []}
+
+    SUMMARY_PROMPT = (
+        "Summarize this document for a non-lawyer: what kind of agreement it is, the parties, "
+        "key obligations, payment terms, term and termination, and any unusual or risky clauses."
+    )
+
+    @mcp.tool
+    async def analyze_document(gcs_uri: Optional[str] = None, filename: Optional[str] = None,
+                               file_data: Optional[str] = None, bucket_name: Optional[str] = None,
+                               location: str = "US", precedents: bool = True, summary: bool = True,
+                               page_count: Optional[int] = None, max_depth: Optional[int] = None,
+                               ctx: Context = None) -> dict:
+        """
+        Analyse a whole document in one call: upload (when file_data is given), OCR,
+        clause segmentation, precedent lookups per clause and a plain-language summary.
+        Stages overlap: clauses are segmented and sent for precedents while later pages
+        are still being OCR'd. Stage progress is sent as progress notifications (JSON
+        messages). If a stage fails, the result still carries what the others produced.
+
+        Args:
+            gcs_uri: The GCS URI of the PDF, if already uploaded
+            filename, file_data: PDF name and base64 content, to upload first
+            bucket_name: Upload bucket (default BUCKET_NAME)
+            location: Jurisdiction for precedents (e.g., "US", "California", "India")
+            precedents, summary: Set False to skip those stages
+            page_count: Number of pages, if known
+            max_depth: Only numbering with at most this many levels starts a clause
+
+        Returns:
+            dict: gcs_uri, stages (status/seconds/error per stage), clauses (with
+                  precedents), summary and total_pages
+        """
+        try:
+            logger.info(f"analyze_document called with gcs_uri: {gcs_uri} filename: {filename}")
+            upload = None
+            if not gcs_uri:
+                if not filename or not file_data:
+                    return {"error": "gcs_uri or filename and file_data required"}
+                if not filename.lower().endswith(".pdf"):
+                    return {"error": "Only PDFs allowed"}
+
+                def upload():
+                    stored = _store_upload(filename, file_data, bucket_name, _session_owner(ctx))
+                    if "gcs_uri" not in stored:
+                        raise RuntimeError("GCS upload failed; OCR needs the document in GCS")
+                    return stored["gcs_uri"]
+            elif not gcs_uri.startswith("gs://"):
+                return {"error": "Invalid GCS URI format. Must start with 'gs://'"}
+            location = (location or "").strip() or "US"
+
+            async def find_batch(clauses, location):
+                found, _ = await _lookup_precedents(list(dict.fromkeys(clauses)), location)
+                return found
+
+            async def summarize(uri):
+                async with tool_slot("pdf_qa"):
+                    return await aautomated_chat(SUMMARY_PROMPT, file_path=uri, chat_history=None)
+
+            events = 0
+
+            async def progress(event):
+                nonlocal events
+                events += 1
+                if ctx is not None:
+                    await ctx.report_progress(progress=events, message=json.dumps(event))
+
+            async with tool_slot("analyze_document"):
+                result = await pipeline.analyze_document(
+                    gcs_uri,
+                    upload,
+                    iter_pages=lambda uri: iter_pdf_pages(uri, page_count=page_count),
+                    find_precedents_batch=find_batch if precedents else None,
+                    summarize=summarize if summary else None,
+                    location=location,
+                    max_depth=max_depth,
+                    progress=progress,
+                )
+            failed = [name for name, stage in result["stages"].items() if stage["status"] == "failed"]
+            result["success"] = not failed
+            result["total_clauses"] = len(result["clauses"])
+            if failed:
+                result["error"] = "; ".join(f"{name}: {result['stages'][name]['error']}" for name in failed)
+            return result
+        except Exception as e:
+            logger.exception("analyze_document failed")
+            return {"success": False, "error": str(e)}
+
 # ---- Debug Middleware ----
 @app.middleware("http")
 async def log_mcp_headers(request: Request, call_next):
-    if request.url.path.startswith("/mcp"):
-        logger.info("[incoming mcp request] %s %s headers=%s",
-                    request.method, request.url.path,
+    if not request.url.path.startswith("/mcp"):
+        return await call_next(request)
+    session_id = request.headers.get("mcp-session-id")
+    with tracing.span(f"HTTP {request.method} /mcp", parent=tracing.parse_traceparent(request.headers.get("traceparent")),
+                      **{"http.method": request.method, "mcp.session_id": session_id}) as active:
+        # Tool calls run in the MCP session's own task; this is how they find their parent
+        request.state.trace_parent = active.context() if active else None
+        logger.info("[incoming mcp request] %s %s trace_id=%s headers=%s",
+                    request.method, request.url.path, active.trace_id if active else None,
                     {k: v for k, v in request.headers.items()
                      if k.lower() in ("host", "origin", "mcp-session-id")})
-    response = await call_next(request)
-    return response
+        response = await call_next(request)
+        if active is not None:
+            active.set_attribute("http.status_code", response.status_code)
+            response.headers["traceparent"] = active.traceparent()
+        return response
 
 # ---- Health ----
 @app.get("/")
@@ -277,6 +1032,58 @@ def root():
 def health_check():
     return {"status": "ok", "mcp": bool(mcp)}
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "ocr": ocr_cache_stats(),
+        "context": context_cache_stats(),
+        "answers": answer_cache_stats(),
+        "sessions": sessions.stats(),
+        "precedent_index": precedent_index_stats(),
+        "cassette": cassette_stats(),
+    }
+
+def _cache_counts():
+    """{cache name: (hits, misses)} for the caches loaded in this process."""
+    counts = {}
+    for name, stats in (("ocr", ocr_cache_stats()), ("context", context_cache_stats()),
+                        ("precedent_index", precedent_index_stats()), ("cassette", cassette_stats())):
+        if stats:
+            counts[name] = (stats["hits"], stats["misses"])
+    for name, stats in answer_cache_stats().items():
+        counts[f"answers-{name}"] = (stats["exact_hits"] + stats["semantic_hits"], stats["misses"])
+    return counts
+
+metrics.registry.register(metrics.Collected(
+    "cache_hits_total", "Cache lookups that hit.", ["cache"],
+    lambda: {(name,): hits for name, (hits, _) in _cache_counts().items()}, kind="counter"))
+metrics.registry.register(metrics.Collected(
+    "cache_misses_total", "Cache lookups that missed.", ["cache"],
+    lambda: {(name,): misses for name, (_, misses) in _cache_counts().items()}, kind="counter"))
+metrics.registry.register(metrics.Collected(
+    "cache_hit_ratio", "Hits over lookups since start.", ["cache"],
+    lambda: {(name,): hits / (hits + misses) for name, (hits, misses) in _cache_counts().items() if hits + misses}))
+
+@app.get("/upstreams")
+def upstreams():
+    """Rate limiter, circuit breaker and retry/hedge counters per Google service."""
+    return resilience.resilience_stats()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Spans hold document URIs and session ids, so the buffer is only served when
+# in-process tracing was explicitly turned on (TRACING=memory or console)
+if tracing.exporter is not None:
+
+    @app.get("/traces")
+    def traces(trace_id: Optional[str] = None, limit: int = 20):
+        """Recent traces (root spans) or, with trace_id, every span of one trace. Local debugging aid."""
+        if trace_id:
+            return {"trace_id": trace_id, "spans": tracing.exporter.spans(trace_id)}
+        return {"traces": tracing.exporter.traces(limit)}
+
 # ---- Startup ----
 @app.on_event("startup")
 async def on_startup():
@@ -284,5 +1091,24 @@ async def on_startup():
 
 # ---- Entrypoint ----
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LegalDemystifier MCP backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8080)))
+    parser.add_argument("--import-report", action="store_true",
+                        help="print a -X importtime breakdown of importing mcp_app and exit")
+    parser.add_argument("--top", type=int, default=25, help="modules to list in the import report")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="with --import-report, exit 1 if importing mcp_app takes longer than this")
+    args = parser.parse_args()
+
+    if args.import_report:
+        from Class.importtime import import_time_report, format_import_report
+        report = import_time_report("mcp_app", cwd=os.path.dirname(os.path.abspath(__file__)))
+        print(format_import_report(report, top=args.top))
+        if args.max_import_ms is not None and report["total_ms"] > args.max_import_ms:
+            print(f"Import time {report['total_ms']:.0f} ms exceeds budget of {args.max_import_ms:.0f} ms")
+            sys.exit(1)
+        sys.exit(0)
+
     import uvicorn
-    uvicorn.run("mcp_app:app", host="0.0.0.0", port=int(os.getenv("PORT", 8080)), reload=True)
\ No newline at end of file
+    uvicorn.run("mcp_app:app", host=args.host, port=args.port, reload=True)
\ No newline at end of file
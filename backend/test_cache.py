@@ -0,0 +1,65 @@
+"""Tests for the shared result cache backends."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Class.cache import MemoryCacheBackend, ResultCache, SQLiteCacheBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCacheBackend()
+    return SQLiteCacheBackend(str(tmp_path / "results.sqlite3"))
+
+
+def test_eviction_is_scoped_to_namespace(backend):
+    aliases = ResultCache(backend, namespace="doc-alias")
+    for i in range(5):
+        aliases.set(f"hash-{i}", f"gs://bucket/doc-{i}.pdf")
+
+    small = ResultCache(backend, namespace="ocr", max_entries=2)
+    for i in range(4):
+        small.set(f"page-{i}", {"text": "x" * i})
+
+    assert backend.usage("doc-alias")[0] == 5
+    assert backend.usage("ocr")[0] == 2
+    assert all(aliases.get(f"hash-{i}") == f"gs://bucket/doc-{i}.pdf" for i in range(5))
+    assert small.get("page-3") == {"text": "xxx"}
+    assert small.get("page-0") is None
+
+
+def test_byte_limit_and_stats_are_per_namespace(backend):
+    other = ResultCache(backend, namespace="answers")
+    other.set("q", "a" * 100)
+
+    capped = ResultCache(backend, namespace="answers-qa", max_bytes=20)
+    capped.set("one", "b" * 10)
+    capped.set("two", "c" * 10)
+
+    stats = capped.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] <= 20
+    assert other.get("q") == "a" * 100
+    assert backend.usage() == (2, stats["bytes"] + other.stats()["bytes"])
+
+
+def test_alias_index_survives_ocr_cache_limits(monkeypatch, tmp_path):
+    from Class import cache, doc_store
+
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(cache, "_backends", {})
+    monkeypatch.setattr(doc_store, "_aliases", None)
+    for i in range(5):
+        doc_store.remember_alias(f"lease-{i}.pdf", f"{i:064x}", f"gs://bucket/docs/{i:064x}.pdf", owner="session-a")
+
+    ocr = ResultCache(cache.get_backend(), namespace="ocr", max_entries=1, max_age_seconds=0)
+    ocr.set("page", {"text": "x"})
+
+    assert all(doc_store.resolve_alias(f"lease-{i}.pdf", owner="session-a") is not None for i in range(5))
+    assert doc_store.resolve_alias("lease-0.pdf", owner="session-b") is None
+    assert doc_store.resolve_alias("lease-0.pdf") is None
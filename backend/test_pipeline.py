@@ -0,0 +1,94 @@
+"""Tests for the streaming document pipeline."""
+
+import asyncio
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Class import pipeline
+
+
+def _run(monkeypatch, coro_fn, workers=2):
+    """Run coro_fn() on a fresh loop with a stage pool of exactly `workers` threads.
+
+    The loop is closed without joining the executor, so a hung stage thread
+    fails the test instead of hanging it.
+    """
+    loop = asyncio.new_event_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    monkeypatch.setattr(pipeline, "_stage_executor", executor)
+    try:
+        return loop.run_until_complete(coro_fn(executor))
+    finally:
+        loop.close()
+
+
+def _endless_pages(started, finished):
+    def iter_pages(gcs_uri):
+        started.set()
+        try:
+            page_number = 0
+            while True:
+                page_number += 1
+                yield {"page_number": page_number, "text": f"{page_number}. CLAUSE\n" + "word " * 40}
+                time.sleep(0.001)
+        finally:
+            finished.set()
+    return iter_pages
+
+
+def test_cancel_mid_pipeline_releases_stage_threads(monkeypatch):
+    monkeypatch.setattr(pipeline, "PIPELINE_POLL_SECONDS", 0.05)
+    started, finished = threading.Event(), threading.Event()
+    never = asyncio.Event()
+
+    async def find_precedents_batch(clauses, location):
+        await never.wait()  # Lookups never finish, so the queues fill up and the stages block
+
+    async def scenario(executor):
+        task = asyncio.create_task(pipeline.analyze_document(
+            "gs://bucket/doc.pdf",
+            iter_pages=_endless_pages(started, finished),
+            find_precedents_batch=find_precedents_batch,
+        ))
+        await asyncio.to_thread(started.wait, 5)
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # Both stage threads must come free: the OCR and segment stages have exited
+        free = [asyncio.get_running_loop().run_in_executor(executor, time.sleep, 0.05) for _ in range(2)]
+        await asyncio.wait_for(asyncio.gather(*free), timeout=5)
+
+    _run(monkeypatch, scenario)
+    assert finished.wait(1)
+
+
+def test_pipeline_completes_and_closes_every_stage(monkeypatch):
+    pages = [{"page_number": n, "text": f"{n}. CLAUSE {n}\n" + "word " * 40} for n in range(1, 6)]
+    looked_up = []
+
+    async def find_precedents_batch(clauses, location):
+        looked_up.extend(clauses)
+        return {}
+
+    async def scenario(executor):
+        return await pipeline.analyze_document(
+            "gs://bucket/doc.pdf",
+            iter_pages=lambda gcs_uri: iter(pages),
+            find_precedents_batch=find_precedents_batch,
+        )
+
+    result = _run(monkeypatch, scenario)
+    assert result["total_pages"] == 5
+    assert len(result["clauses"]) == 5
+    assert len(looked_up) == 5
+    assert {name: stage["status"] for name, stage in result["stages"].items()} == {
+        "upload": "skipped", "ocr": "done", "segment": "done", "precedents": "done", "summary": "skipped",
+    }